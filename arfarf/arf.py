@@ -11,6 +11,10 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 def _create_main_argparser():
+    from .observers import OBSERVER_BACKENDS
+    from .parser import RUNTIMES
+    from .profiling import PROFILE_MODES
+
     parser = argparse.ArgumentParser()
     parser.add_argument('--config-file', '-c', dest='config',
                         help=('specify a config file to provide dogs, the '
@@ -22,6 +26,28 @@ def _create_main_argparser():
                         action='store_true',
                         help=('create the arfarfconfig.py config file'
                               'using the default template'))
+    parser.add_argument('--observer', '-o', dest='observer',
+                        choices=OBSERVER_BACKENDS,
+                        help=('specify how to watch file system events, '
+                              '"auto" uses inotify if possible and falls '
+                              'back to polling'))
+    parser.add_argument('--runtime', '-r', dest='runtime',
+                        choices=RUNTIMES,
+                        help=('specify how to run commands, "asyncio" runs '
+                              'them all in one event loop'))
+    parser.add_argument('--startup-profile', dest='startup_profile',
+                        action='store_true',
+                        help=('print the time spent in each phase of startup '
+                              'to stderr'))
+    parser.add_argument('--profile', '-p', dest='profile',
+                        choices=PROFILE_MODES,
+                        help=('profile from startup to exit, and trace '
+                              'memory allocations; SIGUSR1 stops and '
+                              'starts profiling, SIGUSR2 dumps a memory '
+                              'snapshot, with or without this option'))
+    parser.add_argument('--profile-dir', dest='profile_dir', default='.',
+                        help=('specify the directory profiles and memory '
+                              'snapshots are dumped to'))
     return parser
 
 
@@ -64,35 +90,156 @@ def _apply_main_args(args):
         else:
             sys.exit("File not found: '%s'" % gitignore_path)
 
+    if args.observer is not None:
+        configm.observer = args.observer
+
+    if args.runtime is not None:
+        configm.runtime = args.runtime
+
     return configm
 
 
-def main():
-    """Script entry point."""
-    from watchdog.observers.polling import PollingObserver
-    from .parser import AAConfigParser
-    from .tricks import AutoRunTrick
+def _capture_output(trick_cls, options):
+    """Let the output of the commands go through an OutputMux.
 
-    parser = _create_main_argparser()
-    args = parser.parse_args()
-    configm = _apply_main_args(args)
+    Pressing Ctrl-\\ dumps the output kept of the last runs to stderr.
+    """
+    import signal
+    from .output import OutputMux
+
+    output = trick_cls.output = OutputMux(**options)
+    signal.signal(signal.SIGQUIT,
+                  lambda signum, frame: output.dump(sys.stderr.buffer))
+
+
+def _export_metrics(trick_cls, options):
+    """Record the metrics of the dogs and of the observer, and export them.
+
+    Returns:
+        The MetricsExporter object, started.
+    """
+    from .metrics import Metrics, MetricsExporter
+
+    metrics = trick_cls.metrics = Metrics()
+    exporter = MetricsExporter(metrics, **options)
+    try:
+        exporter.start()
+    except OSError as e:
+        sys.exit('Cannot export metrics: %s' % e)
+    return exporter
+
+
+def _switch_profiling(args):
+    """Let SIGUSR1 and SIGUSR2 profile arfarf, start profiling now with
+    the --profile option.
+
+    Returns:
+        The ProfileSwitch object.
+    """
+    from .profiling import TRACEMALLOC_FRAMES, ProfileSwitch
+
+    switch = ProfileSwitch(args.profile or 'cprofile', args.profile_dir)
+    switch.install()
+    if args.profile is not None:
+        import tracemalloc
+
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        switch.start()
+    return switch
 
-    # The reason to use PollingObserver() is it's os-independent. And it's
-    # more reliable.
-    observer = PollingObserver()
+
+def main():
+    """Script entry point.
+
+    The observer starts scanning as soon as the handlers are scheduled, the
+    initial runs of the commands are started in parallel meanwhile.
+    """
+    from .startup import StartupProfile, start_handlers
+
+    profile = StartupProfile()
+    with profile.phase('imports'):
+        from .observers import create_observer, wait_started
+        from .parser import AAConfigParser
+        from .pools import Pools
+        from .scheduler import Scheduler
+        from .tricks import AutoRunTrick
+
+        parser = _create_main_argparser()
+    args = parser.parse_args()
+    if args.startup_profile:
+        profile.stream = sys.stderr
+    with profile.phase('config import'):
+        configm = _apply_main_args(args)
 
     parser = AAConfigParser(configm)
-    handler_for_watch = parser.schedule_with(observer, AutoRunTrick)
+    AutoRunTrick.pools = Pools(parser.max_jobs)
+    # Fork the process pool before any thread starts, profiling and
+    # exporting metrics start some.
+    if parser.uses_process_pool:
+        AutoRunTrick.pools.get('process')
+    switch = _switch_profiling(args)
+    with profile.phase('gitignore parsing'):
+        parser.load_gitignore()
+    exporter = _export_metrics(AutoRunTrick, parser.metrics_options) \
+               if parser.export_metrics else None
+    # Writing the metrics file must not run the dogs.
+    owners = [exporter] if exporter is not None else []
+    try:
+        observer = create_observer(parser.observer_backend,
+                                   metrics=AutoRunTrick.metrics,
+                                   owners=owners, **parser.observer_options)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    if parser.capture_output:
+        _capture_output(AutoRunTrick, parser.output_options)
+    if parser.runtime == 'asyncio':
+        from .runtime import run
+
+        run(parser, observer, profile)
+        if AutoRunTrick.output is not None:
+            AutoRunTrick.output.close()
+        if exporter is not None:
+            exporter.close()
+        switch.stop()
+        return
+
+    AutoRunTrick.scheduler = Scheduler(AutoRunTrick.supervisor,
+                                       parser.max_jobs)
+    with profile.phase('scheduling'):
+        try:
+            handler_for_watch = parser.schedule_with(observer, AutoRunTrick)
+        except ValueError as e:
+            sys.exit(str(e))
     handlers = set.union(*tuple(handler_for_watch.values()))
 
-    for handler in handlers:
-        handler.start()
-    observer.start()
+    starter = None
     try:
+        # The emitters take their initial snapshots in their threads.
+        with profile.phase('initial scan'):
+            observer.start()
+            with profile.phase('initial runs'):
+                starter = start_handlers(handlers)
+            wait_started(observer)
+        profile.report()
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
+        pass
+    finally:
         observer.stop()
-    observer.join()
-    for handler in handlers:
-        handler.stop()
+        if observer.is_alive():
+            observer.join()
+        if starter is not None:
+            # Don't let an initial run start after its handler is stopped.
+            starter.shutdown(wait=True)
+        for handler in handlers:
+            handler.stop()
+        # Let the commands exit, or be killed, before we do.
+        AutoRunTrick.supervisor.wait()
+        AutoRunTrick.pools.close()
+        if AutoRunTrick.output is not None:
+            AutoRunTrick.output.close()
+        if exporter is not None:
+            exporter.close()
+        switch.stop()
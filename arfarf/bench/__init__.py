@@ -0,0 +1,7 @@
+"""Benchmarks of scanning, dispatching and event to command latency.
+
+Run them with `python -m arfarf.bench`, see --help. They generate a
+synthetic tree, replay bursts of events on it, like a branch switch or
+editor saves, and print the results as JSON, so runs of different versions
+can be compared.
+"""
@@ -0,0 +1,70 @@
+"""Run the benchmarks and print the results as JSON."""
+
+import argparse
+import json
+import sys
+
+from ..observers import OBSERVER_BACKENDS
+from .suite import BENCHMARKS, run
+
+
+def _create_argparser():
+    parser = argparse.ArgumentParser(
+        prog='python -m arfarf.bench',
+        description='Benchmark arfarf on a synthetic tree.')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help='the benchmarks to run, all by default: %s' %
+                             ', '.join(BENCHMARKS))
+    parser.add_argument('--root', help=('the directory to create the tree '
+                                        'in, a temporary one by default'))
+    parser.add_argument('--files', type=int, default=10000,
+                        help='the number of files of the tree')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='the number of directory levels')
+    parser.add_argument('--fanout', type=int, default=8,
+                        help='the number of subdirectories per directory')
+    parser.add_argument('--gitignore', type=int, default=100,
+                        help='the number of gitignore patterns')
+    parser.add_argument('--dogs', type=int, default=10,
+                        help='the number of dogs dispatched events')
+    parser.add_argument('--burst', type=int, default=1000,
+                        help='the number of files a branch switch changes')
+    parser.add_argument('--saves', type=int, default=100,
+                        help='the number of files saved in an editor burst')
+    parser.add_argument('--trials', type=int, default=20,
+                        help='the number of saves timed for latency')
+    parser.add_argument('--observer', choices=OBSERVER_BACKENDS,
+                        default='auto',
+                        help='the observer backend timed for latency')
+    parser.add_argument('--interval', type=float, default=0.1,
+                        help='the polling interval timed for latency')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='the number of rounds of dispatch benchmarks')
+    parser.add_argument('--scan-workers', type=int, default=1,
+                        help='the number of threads scanning the tree')
+    parser.add_argument('--output', '-o', default='-',
+                        help='the JSON file to write, "-" for stdout')
+    return parser
+
+
+def main(argv=None):
+    """Script entry point."""
+    parser = _create_argparser()
+    kwargs = vars(parser.parse_args(argv))
+    output = kwargs.pop('output')
+    kwargs['benchmarks'] = kwargs['benchmarks'] or BENCHMARKS
+    unknown = set(kwargs['benchmarks']) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: %s' % ', '.join(sorted(unknown)))
+    results = run(**kwargs)
+    if output == '-':
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+"""Define the benchmarks.
+
+Times are measured both as wall clock and as CPU time of the process, in
+seconds, and the best of several rounds is kept where a benchmark is
+repeated.
+"""
+
+import os
+import platform
+import statistics
+import tempfile
+import threading
+import time
+
+from functools import partial
+
+import watchdog.version
+
+from ..dog import Dog
+from ..observers import create_observer, wait_started
+from ..polling import TreeSnapshot, diff_events
+from ..router import EventRouter
+from ..transaction import Transaction
+from ..tricks import AutoRunTrick
+from .trees import EXTENSIONS, branch_switch, editor_save, gitignore_patterns
+from .trees import make_tree, replay_save, replay_switch, spread
+
+
+BENCHMARKS = ('create_handler', 'dispatch', 'scan', 'latency')
+
+# Max seconds to wait for a command to start in the latency benchmark.
+LATENCY_TIMEOUT = 10
+
+
+class _CountingTrick(AutoRunTrick):
+    """Count the events handed over instead of running a command."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count = 0
+
+    def on_any_event(self, event):
+        self.count += 1
+
+    def on_events(self, events):
+        self.count += len(events)
+
+
+def _timed(func, *args):
+    """Call func(*args) and time it.
+
+    Returns:
+        A (result, timing) tuple, timing is a dict with wall_s and cpu_s.
+    """
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = func(*args)
+    return result, {'wall_s': time.perf_counter() - wall,
+                    'cpu_s': time.process_time() - cpu}
+
+
+def _best(repeat, func, *args):
+    """Time func(*args) repeat times, keep the fastest round."""
+    rounds = [_timed(func, *args) for _ in range(max(1, repeat))]
+    return min(rounds, key=lambda r: r[1]['wall_s'])
+
+
+def _dogs(root, count):
+    return [Dog(command='true %d' % i, path=root, use_gitignore=True,
+                patterns=['*' + EXTENSIONS[i % 4],
+                          '*' + EXTENSIONS[(i + 1) % 4]])
+            for i in range(count)]
+
+
+def bench_create_handler(root, patterns, dogs):
+    """Time Dog.create_handler() building the patterns of handlers.
+
+    Args:
+        root: The root of the tree the dogs watch.
+        patterns: The gitignore patterns of the dogs.
+        dogs: The number of dogs.
+    """
+    saved = Dog.gitignore
+    Dog.gitignore = patterns
+    try:
+        _, timing = _timed(lambda: [dog.create_handler(AutoRunTrick)
+                                    for dog in _dogs(root, dogs)])
+    finally:
+        Dog.gitignore = saved
+    timing.update(dogs=dogs, patterns=len(patterns),
+                  ms_per_handler=timing['wall_s'] * 1000 / max(1, dogs))
+    return timing
+
+
+def bench_dispatch(root, paths, patterns, dogs, burst, saves, repeat=3):
+    """Time routing and dispatching bursts of events to handlers.
+
+    Args:
+        root: The root of the tree the dogs watch.
+        paths: The file paths of the tree.
+        patterns: The gitignore patterns of the dogs.
+        dogs: The number of dogs.
+        burst: The number of files changed by a branch switch.
+        saves: The number of files saved by an editor.
+        repeat: The number of rounds.
+    """
+    saved = Dog.gitignore
+    Dog.gitignore = patterns
+    try:
+        handlers = [dog.create_handler(_CountingTrick)
+                    for dog in _dogs(root, dogs)]
+    finally:
+        Dog.gitignore = saved
+    router = EventRouter(handlers)
+    bursts = {
+        'branch_switch': branch_switch(paths, burst),
+        'editor_saves': [event for path in spread(paths, saves)
+                         for event in editor_save(path)],
+    }
+    results = {}
+    for name, events in bursts.items():
+        count = max(1, len(events))
+        _, route = _best(repeat, lambda: [router.route(e) for e in events])
+        _, single = _best(repeat, lambda: [router.dispatch(e)
+                                           for e in events])
+        transaction = Transaction(None, events)
+        _, whole = _best(repeat, router.dispatch_transaction, transaction)
+        results[name] = {
+            'events': len(events),
+            'match_us_per_event': route['wall_s'] * 1e6 / count,
+            'match_us_per_event_per_dog':
+                route['wall_s'] * 1e6 / count / max(1, dogs),
+            'dispatch_events_per_s': len(events) / single['wall_s'],
+            'transaction_events_per_s': len(events) / whole['wall_s'],
+            'dispatch': single,
+            'transaction': whole,
+        }
+    return results
+
+
+def bench_scan(root, paths, burst, scan_workers=1):
+    """Time the initial scan and the polls of a tree.
+
+    Args:
+        root: The root of the tree.
+        paths: The file paths of the tree.
+        burst: The number of files rewritten before the last poll.
+        scan_workers: The number of threads scanning the tree.
+    """
+    snapshot, initial = _timed(partial(TreeSnapshot,
+                                       scan_workers=scan_workers), root)
+    _, idle = _timed(snapshot.rescan)
+    _, full = _timed(snapshot.rescan, True)
+    replay_switch(paths, burst)
+    diff, changed = _timed(snapshot.rescan)
+    changed['changes'] = len(diff_events(diff))
+    snapshot.close()
+    return {'entries': len(snapshot.paths), 'initial_scan': initial,
+            'idle_poll': idle, 'full_poll': full, 'burst_poll': changed}
+
+
+def _stats(latencies, missed):
+    if not latencies:
+        return {'trials': 0, 'missed': missed}
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return {'trials': len(latencies), 'missed': missed,
+            'min_ms': latencies[0] * 1000,
+            'median_ms': statistics.median(latencies) * 1000,
+            'p95_ms': p95 * 1000, 'max_ms': latencies[-1] * 1000}
+
+
+def bench_latency(root, paths, backend, interval, trials, burst):
+    """Time from writing files to the start of a command.
+
+    The command is a callable, called in the thread pool, so the time to
+    start a process is left out.
+
+    Args:
+        root: The root of the tree.
+        paths: The file paths of the tree.
+        backend: The observer backend, one of OBSERVER_BACKENDS.
+        interval: The polling interval in seconds.
+        trials: The number of editor saves, there are a fifth as many
+            branch switches.
+        burst: The number of files rewritten by a branch switch.
+    """
+    cond = threading.Condition()
+    started = []
+
+    def command(events):
+        with cond:
+            started.append(time.perf_counter())
+            cond.notify_all()
+
+    handler = Dog(command=command, patterns=['*.py'],
+                  path=root).create_handler(AutoRunTrick)
+    observer = create_observer(backend, timeout=interval)
+    observer.schedule(EventRouter([handler]), root, True)
+    observer.start()
+    wait_started(observer)
+
+    def trial(replay, *args):
+        with cond:
+            del started[:]
+        begin = time.perf_counter()
+        replay(*args)
+        with cond:
+            cond.wait_for(lambda: started, LATENCY_TIMEOUT)
+            latency = started[0] - begin if started else None
+        # Let the rest of the events go before the next trial.
+        time.sleep(interval * 2 + 0.05)
+        return latency
+
+    results = {'observer': backend, 'interval_s': interval}
+    try:
+        sources = [p for p in paths if p.endswith('.py')]
+        cases = {
+            'editor_save': [(replay_save, path)
+                            for path in spread(sources, trials)],
+            'branch_switch': [(replay_switch, paths, burst)] *
+                             max(1, trials // 5),
+        }
+        for name, replays in cases.items():
+            latencies = [trial(*replay) for replay in replays]
+            results[name] = _stats([l for l in latencies if l is not None],
+                                   latencies.count(None))
+    finally:
+        observer.stop()
+        observer.join()
+    return results
+
+
+def _meta():
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'watchdog': watchdog.version.VERSION_STRING,
+    }
+
+
+def run(benchmarks=BENCHMARKS, root=None, files=10000, depth=3, fanout=8,
+        gitignore=100, dogs=10, burst=1000, saves=100, trials=20,
+        observer='auto', interval=0.1, repeat=3, scan_workers=1):
+    """Run benchmarks on a synthetic tree.
+
+    Args:
+        benchmarks: An iterable of names in BENCHMARKS.
+        root: The directory the tree is created in, and removed from
+            afterwards, None for the default temporary directory.
+        files:
+        depth:
+        fanout: The same as tree_paths().
+        gitignore: The number of gitignore patterns of each dog.
+        dogs: The number of dogs dispatched events.
+        burst: The number of files changed by a branch switch.
+        saves: The number of files saved in the editor saves burst.
+        trials: The number of editor saves timed for latency.
+        observer: The observer backend timed for latency.
+        interval: The polling interval timed for latency.
+        repeat: The number of rounds of the dispatch benchmark.
+        scan_workers: The number of threads scanning the tree in the scan
+            benchmark.
+
+    Returns:
+        A dict of the environment, the parameters and the results, JSON
+        serializable.
+    """
+    params = {
+        'files': files, 'depth': depth, 'fanout': fanout,
+        'gitignore': gitignore, 'dogs': dogs, 'burst': burst,
+        'saves': saves, 'trials': trials, 'observer': observer,
+        'interval': interval, 'repeat': repeat,
+        'scan_workers': scan_workers,
+    }
+    unknown = set(benchmarks) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError('unknown benchmarks: %s' % ', '.join(sorted(unknown)))
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='arfarf-bench-',
+                                     dir=root) as tree:
+        paths, results['make_tree'] = _timed(make_tree, tree, files, depth,
+                                             fanout)
+        patterns = gitignore_patterns(gitignore)
+        for name in BENCHMARKS:
+            if name not in benchmarks:
+                continue
+            if name == 'create_handler':
+                results[name] = bench_create_handler(tree, patterns, dogs)
+            elif name == 'dispatch':
+                results[name] = bench_dispatch(tree, paths, patterns, dogs,
+                                               burst, saves, repeat)
+            elif name == 'scan':
+                results[name] = bench_scan(tree, paths, burst,
+                                           scan_workers)
+            elif name == 'latency':
+                results[name] = bench_latency(tree, paths, observer,
+                                              interval, trials, burst)
+    return {'meta': _meta(), 'params': params, 'results': results}
@@ -0,0 +1,149 @@
+"""Define synthetic trees and the bursts of events replayed on them.
+"""
+
+import os
+
+from watchdog.events import FileCreatedEvent, FileDeletedEvent
+from watchdog.events import FileModifiedEvent, FileMovedEvent
+
+
+# File extensions of the tree, cycled through.
+EXTENSIONS = ('.py', '.c', '.h', '.txt', '.o')
+
+# The patterns every generated gitignore file starts with.
+GITIGNORE_BASE = ('*.o', '__pycache__/', 'build/', '*.log')
+
+
+def tree_paths(files, depth=3, fanout=8):
+    """Get the relative paths of the files of a synthetic tree.
+
+    Files are spread evenly among fanout ** depth leaf directories.
+
+    Args:
+        files: The number of files.
+        depth: The number of directory levels above the files.
+        fanout: The number of subdirectories of each directory.
+
+    Returns:
+        A list of relative path strings.
+    """
+    leaves = fanout ** depth
+    paths = []
+    for i in range(files):
+        leaf = i % leaves
+        parts = []
+        for _ in range(depth):
+            leaf, digit = divmod(leaf, fanout)
+            parts.append('d%d' % digit)
+        parts.append('f%d%s' % (i, EXTENSIONS[i % len(EXTENSIONS)]))
+        paths.append(os.path.join(*parts))
+    return paths
+
+
+def make_tree(root, files, depth=3, fanout=8):
+    """Create the files of a synthetic tree under root.
+
+    Returns:
+        The list of absolute file paths.
+    """
+    paths = [os.path.join(root, p) for p in tree_paths(files, depth, fanout)]
+    made = set()
+    for path in paths:
+        parent = os.path.dirname(path)
+        if parent not in made:
+            os.makedirs(parent, exist_ok=True)
+            made.add(parent)
+        with open(path, 'wb') as f:
+            f.write(b'x\n')
+    return paths
+
+
+def gitignore_patterns(size):
+    """Get the patterns of a synthetic gitignore file.
+
+    Few of them match files of the tree, like in real projects.
+
+    Args:
+        size: The number of patterns.
+
+    Returns:
+        A list of pattern strings.
+    """
+    patterns = list(GITIGNORE_BASE[:size])
+    kinds = ('*.tmp%d', 'out%d/', 'd%d/*.bak', 'gen%d/*.py')
+    i = 0
+    while len(patterns) < size:
+        patterns.append(kinds[i % len(kinds)] % i)
+        i += 1
+    return patterns
+
+
+def spread(paths, size):
+    """Pick size paths spread over the tree."""
+    step = max(1, len(paths) // max(1, size))
+    return paths[::step][:size]
+
+
+def branch_switch(paths, size):
+    """Get the events of a checkout changing size files.
+
+    One in ten files is deleted, one in ten created next to an existing
+    one, the others are modified.
+
+    Args:
+        paths: The list of absolute file paths of the tree.
+        size: The number of files changed.
+
+    Returns:
+        A list of file system event objects.
+    """
+    events = []
+    for i, path in enumerate(spread(paths, size)):
+        if i % 10 == 0:
+            events.append(FileDeletedEvent(path))
+        elif i % 10 == 1:
+            events.append(FileCreatedEvent(path + '.new.py'))
+        else:
+            events.append(FileModifiedEvent(path))
+    return events
+
+
+def editor_save(path):
+    """Get the events of an editor saving path, the way vim does.
+
+    It checks it can write the directory with a file named 4913, moves the
+    file to a backup, writes it again, then deletes the backup.
+
+    Returns:
+        A list of file system event objects.
+    """
+    probe = os.path.join(os.path.dirname(path), '4913')
+    backup = path + '~'
+    return [FileCreatedEvent(probe), FileDeletedEvent(probe),
+            FileMovedEvent(path, backup), FileCreatedEvent(path),
+            FileModifiedEvent(path), FileDeletedEvent(backup)]
+
+
+def replay_save(path):
+    """Save path the way editor_save() describes, for real."""
+    probe = os.path.join(os.path.dirname(path), '4913')
+    backup = path + '~'
+    with open(probe, 'wb'):
+        pass
+    os.remove(probe)
+    os.rename(path, backup)
+    with open(path, 'wb') as f:
+        f.write(b'saved\n')
+    os.remove(backup)
+
+
+def replay_switch(paths, size):
+    """Rewrite size files spread over the tree, for real.
+
+    Like git checkout, files are unlinked and written again, so their
+    directories change too.
+    """
+    for path in spread(paths, size):
+        os.remove(path)
+        with open(path, 'wb') as f:
+            f.write(b'switched\n')
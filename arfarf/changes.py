@@ -0,0 +1,205 @@
+"""Define the changes delivered to commands.
+
+A command can be told which paths changed since it last ran, so it only
+works on those. Each change is an event type and a path, the path of a
+directory has a trailing slash. A move is two changes, 'moved_from' the
+source path and 'moved_to' the destination path.
+
+Changes are delivered in one of the CHANGES_MODES:
+    env: ARFARF_CHANGES environment variable, one 'type<TAB>path' per line.
+        Changes longer than ENV_CHANGES_MAX bytes are delivered like in file
+        mode instead, ARFARF_CHANGES is not set then.
+    stdin: The command's standard input, 'type<TAB>path' records ending with
+        a NUL character.
+    file: A temporary file, formatted like stdin, its path is in the
+        ARFARF_CHANGES_FILE environment variable. It's removed once the
+        command exits.
+"""
+
+import os
+import subprocess
+import threading
+
+from collections import OrderedDict
+
+from watchdog.events import EVENT_TYPE_MOVED
+
+
+CHANGES_MODES = ('env', 'stdin', 'file')
+ENV_CHANGES = 'ARFARF_CHANGES'
+ENV_CHANGES_FILE = 'ARFARF_CHANGES_FILE'
+
+# Max bytes of ARFARF_CHANGES, well below the 128 KiB Linux allows a single
+# environment variable (MAX_ARG_STRLEN), other variables need room too.
+ENV_CHANGES_MAX = 64 * 1024
+
+
+def event_changes(event):
+    """Get the changes of an event.
+
+    Args:
+        event: A file system event object.
+
+    Returns:
+        A list of (event type, path) tuples.
+    """
+    def slash(path):
+        return os.path.join(path, '') if event.is_directory else path
+
+    if event.event_type == EVENT_TYPE_MOVED:
+        return [('moved_from', slash(event.src_path)),
+                ('moved_to', slash(event.dest_path))]
+    return [(event.event_type, slash(event.src_path))]
+
+
+class ChangeSet(object):
+    """The changes collected since a command last ran.
+
+    A path is listed once, with the type of its latest change.
+
+    Attributes:
+        changes: Readonly property, the list of (event type, path) tuples
+            collected, oldest first.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changes = OrderedDict()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._changes)
+
+    @property
+    def changes(self):
+        """Readonly property, the list of changes collected, oldest first."""
+        with self._lock:
+            return [(t, p) for p, t in self._changes.items()]
+
+    def add(self, event):
+        """Collect the changes of an event."""
+        with self._lock:
+            for event_type, path in event_changes(event):
+                self._changes.pop(path, None)
+                self._changes[path] = event_type
+
+    def take(self):
+        """Get the changes collected and start collecting anew.
+
+        Returns:
+            A list of (event type, path) tuples, oldest first.
+        """
+        with self._lock:
+            changes = [(t, p) for p, t in self._changes.items()]
+            self._changes.clear()
+            return changes
+
+    def restore(self, changes):
+        """Put back changes taken by a command that didn't finish.
+
+        Changes collected since they were taken are newer and kept.
+
+        Args:
+            changes: A list returned by take().
+        """
+        with self._lock:
+            newer = self._changes
+            self._changes = OrderedDict((p, t) for t, p in changes
+                                        if p not in newer)
+            self._changes.update(newer)
+
+
+def encode_changes(changes, separator):
+    """Encode changes to bytes, one 'type<TAB>path' record each.
+
+    Args:
+        changes: A list of (event type, path) tuples.
+        separator: A bytes object ending each record.
+
+    Returns:
+        A bytes object.
+    """
+    return b''.join(os.fsencode(t) + b'\t' + os.fsencode(p) + separator
+                    for t, p in changes)
+
+
+class Delivery(object):
+    """Deliver changes to one run of a command.
+
+    Constructor Args:
+        mode: One of CHANGES_MODES. 'env' falls back to 'file' when the
+            changes are too long for an environment variable.
+        changes: A list of (event type, path) tuples.
+
+    Attributes:
+        popen_kwargs: Readonly property, a dict of keyword arguments to start
+            the command with.
+        data: Readonly property, the bytes to write to the command's standard
+            input, None if there's none.
+    """
+
+    def __init__(self, mode, changes):
+        env = dict(os.environ)
+        self._data = None
+        self._path = None
+        self._popen_kwargs = {'env': env}
+        if mode == 'env':
+            # Lines, without the last line break.
+            lines = encode_changes(changes, b'\n')[:-1]
+            if len(lines) > ENV_CHANGES_MAX:
+                # The command would fail to start.
+                mode = 'file'
+            else:
+                env[ENV_CHANGES] = os.fsdecode(lines)
+        if mode == 'stdin':
+            self._data = encode_changes(changes, b'\0')
+            self._popen_kwargs['stdin'] = subprocess.PIPE
+        elif mode == 'file':
+            import tempfile
+
+            fd, self._path = tempfile.mkstemp(prefix='arfarf-changes-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(encode_changes(changes, b'\0'))
+            env[ENV_CHANGES_FILE] = self._path
+        elif mode != 'env':
+            raise ValueError('unknown changes mode %r' % mode)
+
+    @property
+    def popen_kwargs(self):
+        """Readonly property, a dict of keyword arguments to start the
+        command with.
+        """
+        return dict(self._popen_kwargs)
+
+    @property
+    def data(self):
+        """Readonly property, the bytes to write to standard input."""
+        return self._data
+
+    def feed(self, process):
+        """Write the changes to the standard input of process, if needed.
+
+        It's written in a daemon thread, the command may not read it all at
+        once.
+        """
+        if self._data is None:
+            return
+
+        def write():
+            try:
+                process.stdin.write(self._data)
+                process.stdin.close()
+            except OSError:
+                # The command exited without reading it all.
+                pass
+
+        threading.Thread(target=write, daemon=True).start()
+
+    def close(self, process=None):
+        """Remove the temporary file, if any, once the command exited."""
+        if self._path is not None:
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+            self._path = None
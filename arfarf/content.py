@@ -0,0 +1,151 @@
+"""Define the file content cache telling if a modified file really changed.
+
+Editors, touch, checkouts and formatters rewrite files with the same
+content, which still makes modified events. Hashing the file and comparing
+with the hash it had before tells those apart. Hashes are cached by
+(device, inode, size, mtime_ns), so a file is hashed once per version, even
+when several dogs check it.
+"""
+
+import os
+import stat
+import threading
+
+from collections import OrderedDict
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+    import hashlib
+
+
+# Bytes read at once when hashing.
+_CHUNK_SIZE = 1 << 20
+
+
+def hash_file(path):
+    """Hash the content of a file with a fast non-cryptographic hash.
+
+    xxHash is used if the xxhash package is installed, BLAKE2 otherwise.
+
+    Args:
+        path: A file path.
+
+    Returns:
+        A bytes object.
+
+    Raises:
+        OSError: The file can't be read.
+    """
+    h = xxhash.xxh3_64() if xxhash is not None \
+        else hashlib.blake2b(digest_size=8)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.digest()
+
+
+class LRUCache(object):
+    """A dict-like cache dropping the least recently used items.
+
+    Constructor Args:
+        size: Max number of items.
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """Get the value of key, None if it's not cached."""
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """Cache value for key, dropping the least recently used item if
+        the cache is full.
+        """
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self._size:
+                self._items.popitem(last=False)
+
+
+class ContentCache(object):
+    """Hashes of file contents, by file version.
+
+    Constructor Args:
+        size: Max number of file versions cached.
+
+    Attributes:
+        cache_size: Default max number of file versions cached.
+    """
+
+    cache_size = 65536
+
+    def __init__(self, size=None):
+        self._hashes = LRUCache(size or type(self).cache_size)
+
+    def digest(self, path):
+        """Get the hash of a regular file's content.
+
+        Args:
+            path: A file path.
+
+        Returns:
+            A bytes object, None if path is not a regular file anymore.
+        """
+        try:
+            st = os.stat(path)
+            if not stat.S_ISREG(st.st_mode):
+                return None
+            key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+            digest = self._hashes.get(key)
+            if digest is None:
+                digest = hash_file(path)
+                self._hashes.put(key, digest)
+        except OSError:
+            return None
+        return digest
+
+
+class ContentTracker(object):
+    """Tell if files changed since a dog last saw them.
+
+    Constructor Args:
+        cache: The ContentCache object to hash files with.
+        size: Max number of paths remembered.
+    """
+
+    def __init__(self, cache, size=None):
+        self._cache = cache
+        self._seen = LRUCache(size or type(cache).cache_size)
+
+    def changed(self, path):
+        """Tell if a file's content changed since the last call for it.
+
+        Files never seen before, or not readable, are changed: files aren't
+        hashed before they're modified, that would read the whole tree at
+        startup.
+
+        Args:
+            path: A file path.
+
+        Returns:
+            A boolean.
+        """
+        digest = self._cache.digest(path)
+        if digest is None:
+            return True
+        previous = self._seen.get(path)
+        self._seen.put(path, digest)
+        return previous != digest
@@ -0,0 +1,87 @@
+"""Define the debouncer collapsing bursts of events.
+"""
+
+import threading
+import time
+import traceback
+
+
+class Debouncer(object):
+    """Collapse a burst of items into one callback once the burst is over.
+
+    A burst is over when no item is pushed for quiet seconds, or max_delay
+    seconds after its first item, whichever comes first. The callback is
+    called in a daemon thread, started on the first push.
+
+    Constructor Args:
+        callback: A callable taking the list of items of a burst.
+        quiet: Seconds without items ending a burst.
+        max_delay: Max seconds a burst lasts, None for no limit.
+    """
+
+    def __init__(self, callback, quiet, max_delay=None):
+        self._callback = callback
+        self._quiet = quiet
+        self._max_delay = max_delay
+        self._cond = threading.Condition()
+        self._items = []
+        self._first = None
+        self._last = None
+        self._thread = None
+
+    @property
+    def pending(self):
+        """Readonly property, the number of items waiting."""
+        with self._cond:
+            return len(self._items)
+
+    def push(self, item):
+        """Add an item to the current burst, starting one if needed."""
+        self.extend([item])
+
+    def extend(self, items):
+        """Add items to the current burst at once, starting one if needed."""
+        with self._cond:
+            now = time.monotonic()
+            if not self._items:
+                self._first = now
+            self._items.extend(items)
+            self._last = now
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self):
+        """Drop the items of the current burst.
+
+        Returns:
+            The list of dropped items.
+        """
+        with self._cond:
+            items, self._items = self._items, []
+            return items
+
+    def _deadline(self):
+        deadline = self._last + self._quiet
+        if self._max_delay is not None:
+            deadline = min(deadline, self._first + self._max_delay)
+        return deadline
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._items:
+                        self._cond.wait()
+                        continue
+                    remaining = self._deadline() - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                items, self._items = self._items, []
+            try:
+                self._callback(items)
+            except Exception:
+                # Keep the thread alive for the next bursts.
+                traceback.print_exc()
@@ -4,6 +4,8 @@
 
 import os
 
+from .profiling import profiled
+
 
 class Dog(object):
     """Define a command to run upon certain file system events.
@@ -16,7 +18,10 @@ class Dog(object):
     Constructor Args:
         command: A string containing a shell command, it's written exactly the
             same way you write it in a terminal. Example: "echo hello ; echo
-            world".
+            world". Commands without shell syntax, such as "make -j4", are
+            run without a shell. It can also be a list of program arguments,
+            like ['make', '-j4'], which is never run by a shell, or a Python
+            callable, called with the list of events it's run for.
         patterns:
         ignore_patterns:
         ignore_directories: The same as PatternMatchingEventHandler.
@@ -25,6 +30,44 @@ class Dog(object):
             not.
         use_gitignore: A boolean indicating if we use gitignore file to
             provide ignore_patterns or not.
+        debounce: Seconds without events to wait before running the command,
+            so a burst of events runs it once. None runs it on every event.
+        max_delay: Max seconds to wait before running the command while
+            events keep coming, None for no limit. It's only used with
+            debounce.
+        priority: An int, when more commands are due than allowed to run at
+            once, those of Dogs with higher priority start first.
+        nice: An int added to the niceness of the command processes, None to
+            keep it.
+        ionice: The I/O scheduling class of the command processes, 1
+            realtime, 2 best-effort or 3 idle, as ionice(1) takes it, or a
+            (class, level) tuple, None to keep it.
+        changes: How the command is told which paths changed since it last
+            ran, one of 'env', 'stdin' or 'file', see the changes module.
+            None not to tell it.
+        worker: Run the command as a warm worker: it's started once and kept
+            running, and notified of changes instead of being restarted.
+            One of 'stdin', 'fifo' or 'socket', see the worker module. None
+            to restart the command on changes.
+        restart_patterns: A list of wildcard patterns, relative to path like
+            patterns. A worker is restarted when a change matches them,
+            instead of being notified.
+        pool: The pool calling a callable command, 'thread' or 'process'.
+            Processes are forked once the config is imported, the callable
+            and the events are pickled to be sent there.
+        verify_content: A boolean indicating if a changed file is hashed to
+            check its content changed, so that saving a file unchanged
+            doesn't run the command, even by renaming a temporary file over
+            it. Files are only hashed once changed, so the first change of
+            each file after arfarf starts runs the command, and so does a
+            rename from a temporary file the patterns match. The optional
+            xxhash package makes hashing faster.
+        run_at_start: A boolean indicating if the command is run when arfarf
+            starts, or only on the first change.
+        name: A string naming the dog, so other dogs can run after it.
+        after: A list of the names of the dogs whose commands must succeed
+            before this one runs. When the command of a dog is due, those of
+            the dogs running after it are due too, see the graph module.
 
     Attributes:
         use_gitignore_default: A boolean indicating if we use gitignore file
@@ -34,6 +77,13 @@ class Dog(object):
             absolute or relative to the current working directory.
         watch_info: Readonly property, a tuple containing information to
             schedule a ObservedWatch.
+        use_gitignore: Readonly property, a boolean indicating if the
+            gitignore file provides ignore patterns, use_gitignore_default
+            when use_gitignore is None.
+        after: Readonly property, a tuple of the names of the dogs the
+            command runs after.
+        pool: Readonly property, the kind of pool calling the command, None
+            if it's not a callable.
     """
 
     use_gitignore_default = False
@@ -42,7 +92,11 @@ class Dog(object):
 
     def __init__(self, command=None, patterns=None, ignore_patterns=None,
                  ignore_directories=False, path='.', recursive=True,
-                 use_gitignore=False):
+                 use_gitignore=False, debounce=None, max_delay=None,
+                 priority=0, nice=None, ionice=None, changes=None,
+                 worker=None, restart_patterns=None, pool='thread',
+                 verify_content=False, run_at_start=True, name=None,
+                 after=None):
         self._command = command
         self._patterns = patterns
         self._ignore_patterns = ignore_patterns
@@ -50,6 +104,19 @@ class Dog(object):
         self._path = path
         self._recursive = recursive
         self._use_gitignore = use_gitignore
+        self._debounce = debounce
+        self._max_delay = max_delay
+        self._priority = priority
+        self._nice = nice
+        self._ionice = ionice
+        self._changes = changes
+        self._worker = worker
+        self._restart_patterns = restart_patterns
+        self._pool = pool
+        self._verify_content = verify_content
+        self._run_at_start = run_at_start
+        self._name = name
+        self._after = after
 
     def __eq__(self, value):
         return isinstance(value, type(self)) and self.key == value.key
@@ -72,9 +139,38 @@ class Dog(object):
         ignore_patterns = tuple(self._ignore_patterns) \
                        if self._ignore_patterns is not None \
                        else None
+        restart_patterns = tuple(self._restart_patterns) \
+                           if self._restart_patterns is not None \
+                           else None
         return (self._command, patterns, ignore_patterns,
                 self._ignore_directories, self._path, self._recursive,
-                self._use_gitignore)
+                self._use_gitignore, self._debounce, self._max_delay,
+                self._priority, self._nice, self._ionice, self._changes,
+                self._worker, restart_patterns, self._pool,
+                self._verify_content, self._run_at_start, self._name,
+                self.after)
+
+    @property
+    def use_gitignore(self):
+        """Readonly property, if the gitignore file provides ignore
+        patterns.
+        """
+        return self._use_gitignore if self._use_gitignore is not None \
+               else type(self).use_gitignore_default
+
+    @property
+    def after(self):
+        """Readonly property, the names of the dogs the command runs
+        after.
+        """
+        return tuple(self._after) if self._after is not None else ()
+
+    @property
+    def pool(self):
+        """Readonly property, the kind of pool calling the command, None if
+        it's not a callable.
+        """
+        return self._pool if callable(self._command) else None
 
     @classmethod
     def parse_gitignore(cls):
@@ -103,20 +199,51 @@ class Dog(object):
                     gitignore.append(p)
         return gitignore
 
-    def create_handler(self, trick_cls):
+    def rebase(self, watch_info):
+        """Get the path of the dog as written in the events of a watch.
+
+        Args:
+            watch_info: The (path, recursive) tuple of a watch covering the
+                dog's path.
+
+        Returns:
+            A (path, scope) tuple. scope is the (path, recursive) tuple of
+            the part of the watch the dog watches, None if it's the whole
+            watch.
+        """
+        root, recursive = watch_info
+        rel = os.path.relpath(os.path.abspath(self._path),
+                              os.path.abspath(root))
+        path = root if rel == os.curdir else os.path.join(root, rel)
+        if rel == os.curdir and recursive == self._recursive:
+            return path, None
+        return path, (path, self._recursive)
+
+    @profiled
+    def create_handler(self, trick_cls, watch_info=None):
         """Create a file system event handler providing the handler class.
 
         Args:
             trick_cls: The handler class to be instantiated, it must be a
                 subclass of FileSystemEventHandler.
+            watch_info: The (path, recursive) tuple of the watch the handler
+                is scheduled for, it may cover more than the dog's path, see
+                rebase(). None for the dog's watch_info. The command gets the
+                paths of events written like the dog's path either way, as
+                absolute paths if it's absolute.
 
         Returns:
             The handler object of type of trick_cls.
         """
         cls = type(self)
-        use = self._use_gitignore if self._use_gitignore is not None \
-              else cls.use_gitignore_default
-        if use:
+        if watch_info is None or watch_info == self.watch_info:
+            path, scope = self._path, None
+        else:
+            path, scope = self.rebase(watch_info)
+        # Patterns are matched with the paths of the watch, but the command
+        # gets paths written like the dog's path.
+        rebase = (path, self._path) if path != self._path else None
+        if self.use_gitignore:
             if cls.gitignore is None:
                 cls.gitignore = cls.parse_gitignore()
         gip = cls.gitignore if cls.gitignore is not None \
@@ -124,13 +251,25 @@ class Dog(object):
         selfip = [] if self._ignore_patterns is None \
                  else self._ignore_patterns
         ipatterns = gip + selfip
-        included = [os.path.join(self._path, p) for p in self._patterns] \
+        included = [os.path.join(path, p) for p in self._patterns] \
                    if self._patterns is not None else None
-        excluded = [os.path.join(self._path, p) for p in ipatterns] \
+        excluded = [os.path.join(path, p) for p in ipatterns] \
                    if ipatterns else None
+        restarted = [os.path.join(path, p)
+                     for p in self._restart_patterns] \
+                    if self._restart_patterns is not None else None
         return trick_cls(command=self._command,
                          patterns=included, ignore_patterns=excluded,
-                         ignore_directories=self._ignore_directories)
+                         ignore_directories=self._ignore_directories,
+                         debounce=self._debounce, max_delay=self._max_delay,
+                         priority=self._priority, nice=self._nice,
+                         ionice=self._ionice, changes=self._changes,
+                         worker=self._worker, restart_patterns=restarted,
+                         pool=self._pool,
+                         verify_content=self._verify_content,
+                         run_at_start=self._run_at_start,
+                         name=self._name, after=self._after, scope=scope,
+                         rebase=rebase)
 
     @property
     def watch_info(self):
@@ -0,0 +1,224 @@
+"""Define the dependency graph of dogs.
+
+A dog can be named, and list the names of the dogs it runs after, like
+codegen, then compile, then tests. When the command of a dog in the graph is
+due, the commands of the dogs depending on it, directly or not, are due too.
+A command starts once the commands it runs after are done, commands which
+don't depend on each other run at once, and those depending on a command
+which failed are skipped.
+
+A command due again while it runs is stopped, and run again once the
+commands it runs after are done again.
+"""
+
+import sys
+import threading
+
+from collections import OrderedDict
+from functools import partial
+
+
+# The states of a node, None until its command is first due.
+WAITING = 'waiting'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+def _label(handler):
+    return handler.name if handler.name is not None else handler.command
+
+
+class DogGraph(object):
+    """Run the commands of dependent handlers in dependency order.
+
+    The graph is made of the handlers with an after list, and the handlers
+    they name. Their graph attribute is set to the graph, they hand their
+    events over to trigger() instead of running their command.
+
+    Constructor Args:
+        handlers: An iterable of AutoRunTrick objects, in the order the dogs
+            are defined. Equal handlers are one node.
+
+    Attributes:
+        handlers: Readonly property, a tuple of the handlers of the graph, in
+            dependency order.
+
+    Raises:
+        ValueError: Two handlers have the same name, an after list names no
+            handler, a worker is in the graph, or dependencies are circular.
+    """
+
+    def __init__(self, handlers):
+        handlers = list(OrderedDict.fromkeys(handlers))
+        named = {}
+        for handler in handlers:
+            if handler.name is None:
+                continue
+            if handler.name in named:
+                raise ValueError('duplicate dog name %r' % handler.name)
+            named[handler.name] = handler
+        self._after = {}
+        for handler in handlers:
+            for name in handler.after:
+                if name not in named:
+                    raise ValueError('unknown dog name %r' % name)
+            if handler.after:
+                self._after[handler] = tuple(named[name]
+                                             for name in handler.after)
+        nodes = set(self._after).union(*self._after.values())
+        nodes = [handler for handler in handlers if handler in nodes]
+        for handler in nodes:
+            if handler.worker is not None:
+                raise ValueError('worker dog %r runs for good, it has no '
+                                 'dependencies' % _label(handler))
+            self._after.setdefault(handler, ())
+        self._dependents = {handler: [] for handler in nodes}
+        for handler in nodes:
+            for prerequisite in self._after[handler]:
+                self._dependents[prerequisite].append(handler)
+        self._order = self._sort(nodes)
+        self._lock = threading.Lock()
+        self._states = dict.fromkeys(self._order)
+        # Events of the handlers for their next run.
+        self._events = {handler: [] for handler in self._order}
+        # Running handlers due again once they're done.
+        self._rerun = set()
+        self._stopped = False
+        for handler in self._order:
+            handler.graph = self
+
+    def _sort(self, nodes):
+        """Sort nodes in dependency order, keeping the order they're
+        defined in otherwise.
+        """
+        blocking = {handler: len(set(self._after[handler]))
+                    for handler in nodes}
+        ready = [handler for handler in nodes if not blocking[handler]]
+        order = []
+        while ready:
+            handler = ready.pop(0)
+            order.append(handler)
+            for dependent in self._dependents[handler]:
+                blocking[dependent] -= 1
+                if not blocking[dependent]:
+                    ready.append(dependent)
+        if len(order) < len(nodes):
+            names = ', '.join(repr(_label(handler)) for handler in nodes
+                              if handler not in order)
+            raise ValueError('circular dependencies between dogs ' + names)
+        return tuple(order)
+
+    @property
+    def handlers(self):
+        """Readonly property, a tuple of the handlers in dependency order."""
+        return self._order
+
+    def state(self, handler):
+        """Get the state of a handler's command.
+
+        Returns:
+            WAITING, RUNNING, DONE, FAILED or SKIPPED, None if it was never
+            due.
+        """
+        with self._lock:
+            return self._states[handler]
+
+    def descendants(self, handler):
+        """Get a handler and the handlers depending on it, directly or not.
+
+        Returns:
+            A list of handlers, in dependency order.
+        """
+        found = {handler}
+        stack = [handler]
+        while stack:
+            for dependent in self._dependents[stack.pop()]:
+                if dependent not in found:
+                    found.add(dependent)
+                    stack.append(dependent)
+        return [h for h in self._order if h in found]
+
+    def trigger(self, handler, events):
+        """Run a handler's command for events, and then its dependents'.
+
+        Args:
+            handler: An AutoRunTrick object of the graph.
+            events: A list of file system event objects.
+        """
+        with self._lock:
+            self._events[handler].extend(events)
+        self._run(self.descendants(handler))
+
+    def start(self):
+        """Run the commands of the handlers run when arfarf starts, in
+        dependency order.
+        """
+        self._run([handler for handler in self._order
+                   if handler.run_at_start])
+
+    def stop(self):
+        """Start no more commands."""
+        with self._lock:
+            self._stopped = True
+
+    def _run(self, due):
+        stopping = []
+        with self._lock:
+            if self._stopped:
+                return
+            for handler in due:
+                if self._states[handler] == RUNNING:
+                    self._rerun.add(handler)
+                    stopping.append(handler)
+                else:
+                    self._states[handler] = WAITING
+            ready = self._ready()
+        for handler in stopping:
+            handler.stop_step()
+        self._launch(ready)
+
+    def _ready(self):
+        """Take the waiting handlers whose prerequisites are done.
+
+        Handlers waiting for a command which failed or was skipped are
+        skipped. It's called with the lock held.
+
+        Returns:
+            A list of (handler, events) tuples to run.
+        """
+        ready = []
+        for handler in self._order:
+            if self._states[handler] != WAITING:
+                continue
+            states = [self._states[p] for p in self._after[handler]]
+            if WAITING in states or RUNNING in states:
+                continue
+            failed = [p for p, state in zip(self._after[handler], states)
+                      if state in (FAILED, SKIPPED)]
+            if failed:
+                # The events are kept for the next run.
+                self._states[handler] = SKIPPED
+                print('arfarf: {!r} skipped, {!r} did not succeed'.format(
+                    _label(handler), _label(failed[0])), file=sys.stderr)
+                continue
+            self._states[handler] = RUNNING
+            events, self._events[handler] = self._events[handler], []
+            ready.append((handler, events))
+        return ready
+
+    def _launch(self, ready):
+        # Without the lock, commands may be done before run_step() returns.
+        for handler, events in ready:
+            handler.run_step(events, partial(self._done, handler))
+
+    def _done(self, handler, succeeded):
+        with self._lock:
+            if handler in self._rerun:
+                self._rerun.discard(handler)
+                self._states[handler] = WAITING
+            else:
+                self._states[handler] = DONE if succeeded else FAILED
+            ready = self._ready() if not self._stopped else []
+        self._launch(ready)
@@ -0,0 +1,405 @@
+"""Define the metrics of a running arfarf.
+
+Metrics are recorded in a Metrics registry, shared by the handlers and the
+observer, and exposed in the Prometheus text format by a MetricsExporter: in
+a file written periodically, and optionally over HTTP on a local port or a
+Unix socket.
+
+Handlers record, per dog, the events received, matched and dropped, the time
+spent matching patterns, the time from a change to the start of the command,
+the runtime and exit status of commands. Polling emitters record how long
+scans of each watch take, the observer how long transactions wait to be
+dispatched.
+"""
+
+import bisect
+import http.server
+import os
+import socketserver
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+# Upper bounds of histogram buckets, in seconds.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+           5, 10, 30, 60, 300)
+
+# Seconds between two writes of the metrics file.
+METRICS_INTERVAL = 15
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"') \
+                     .replace('\n', r'\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value))
+                             for name, value in labels)
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter(object):
+    """A value only going up, one per set of labels.
+
+    Constructor Args:
+        name: The metric name, ending with _total by convention.
+        help: A one line description.
+
+    Attributes:
+        kind: The Prometheus metric type.
+        name: Readonly property, the metric name.
+        help: Readonly property, the description.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self._name = name
+        self._help = help
+        self._lock = threading.Lock()
+        # Sorted label tuples -> value
+        self._values = {}
+
+    @property
+    def name(self):
+        """Readonly property, the metric name."""
+        return self._name
+
+    @property
+    def help(self):
+        """Readonly property, the description."""
+        return self._help
+
+    def inc(self, value=1, **labels):
+        """Add value to the counter of labels."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels):
+        """Get the value of the counter of labels, 0 if never increased."""
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        """Get the samples to expose.
+
+        Returns:
+            A list of (name, labels, value) tuples, labels is a tuple of
+            (name, value) tuples.
+        """
+        with self._lock:
+            return [(self._name, key, value)
+                    for key, value in sorted(self._values.items())]
+
+
+class Histogram(object):
+    """Observations counted in buckets, one histogram per set of labels.
+
+    Constructor Args:
+        name: The metric name, ending with the unit by convention.
+        help: A one line description.
+        buckets: The sorted upper bounds of the buckets.
+
+    Attributes:
+        kind: The Prometheus metric type.
+        name: Readonly property, the metric name.
+        help: Readonly property, the description.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=BUCKETS):
+        self._name = name
+        self._help = help
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # Sorted label tuples -> [bucket counts..., sum, count]
+        self._values = {}
+
+    @property
+    def name(self):
+        """Readonly property, the metric name."""
+        return self._name
+
+    @property
+    def help(self):
+        """Readonly property, the description."""
+        return self._help
+
+    def observe(self, value, **labels):
+        """Count value in the histogram of labels."""
+        key = tuple(sorted(labels.items()))
+        i = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self._buckets) + 2)
+            if i < len(self._buckets):
+                counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds the with block takes."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def count(self, **labels):
+        """Get the number of observations of labels."""
+        with self._lock:
+            counts = self._values.get(tuple(sorted(labels.items())))
+            return counts[-1] if counts is not None else 0
+
+    def samples(self):
+        """Get the samples to expose, see Counter.samples()."""
+        with self._lock:
+            values = sorted((key, list(counts))
+                            for key, counts in self._values.items())
+        samples = []
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self._buckets, counts):
+                cumulative += count
+                samples.append((self._name + '_bucket',
+                                key + (('le', _number(float(bound))),),
+                                cumulative))
+            samples.append((self._name + '_bucket', key + (('le', '+Inf'),),
+                            counts[-1]))
+            samples.append((self._name + '_sum', key, counts[-2]))
+            samples.append((self._name + '_count', key, counts[-1]))
+        return samples
+
+
+class Metrics(object):
+    """The registry of the metrics of arfarf.
+
+    Dogs are labelled by their name, or their command, see
+    AutoRunTrick.label, watches by their path.
+
+    Attributes:
+        events_received: Counter of the events dispatched to the watch of a
+            dog.
+        events_matched: Counter of the events matching the patterns of a
+            dog.
+        events_dropped: Counter of the matched events which didn't run the
+            command, by reason: "unchanged" when verifying content found the
+            file unchanged, "stopped" when the dog was stopped while
+            debouncing them.
+        match_seconds: Counter of the seconds spent matching the patterns of
+            a dog.
+        queue_delay: Histogram of the seconds transactions of a watch wait
+            in the observer, from their first event to their dispatch.
+        spawn_delay: Histogram of the seconds from the first change a
+            command runs for to the start of its process.
+        command_duration: Histogram of the seconds commands run.
+        command_exits: Counter of the exits of commands, by exit status,
+            "failed" for commands which failed to start.
+        scan_duration: Histogram of the seconds polls of a watch take, by
+            kind: "initial", "incremental" or "full".
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self.events_received = self._add(Counter(
+            'arfarf_events_received_total',
+            'Events dispatched to the watch of a dog.'))
+        self.events_matched = self._add(Counter(
+            'arfarf_events_matched_total',
+            'Events matching the patterns of a dog.'))
+        self.events_dropped = self._add(Counter(
+            'arfarf_events_dropped_total',
+            'Matched events which did not run the command of a dog.'))
+        self.match_seconds = self._add(Counter(
+            'arfarf_match_seconds_total',
+            'Seconds spent matching the patterns of a dog.'))
+        self.queue_delay = self._add(Histogram(
+            'arfarf_queue_delay_seconds',
+            'Seconds from the first event of a transaction to its dispatch.'))
+        self.spawn_delay = self._add(Histogram(
+            'arfarf_spawn_delay_seconds',
+            'Seconds from a change to the start of the command process.'))
+        self.command_duration = self._add(Histogram(
+            'arfarf_command_duration_seconds',
+            'Seconds commands run.'))
+        self.command_exits = self._add(Counter(
+            'arfarf_command_exits_total',
+            'Exits of commands by exit status, failed if not started.'))
+        self.scan_duration = self._add(Histogram(
+            'arfarf_scan_duration_seconds',
+            'Seconds polls of a watch take.'))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Get the metrics in the Prometheus text format.
+
+        Returns:
+            A str.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.help))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append('%s%s %s' % (name, _labels(labels),
+                                          _number(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix sockets have no client address.
+        return str(self.client_address[0]) if self.client_address else '-'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn,
+                      socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('', 0)
+
+
+class MetricsExporter(object):
+    """Expose Metrics in the Prometheus text format.
+
+    Constructor Args:
+        metrics: The Metrics object to expose.
+        metrics_file: The path of the file the metrics are written to when
+            started, then every metrics_interval seconds, and once more on
+            close(). None not to write any. It's written in place, like the
+            state file, so writing it doesn't modify the directory it's in,
+            and events for it are dropped, see owns().
+        metrics_interval: Seconds between two writes of the file.
+        metrics_port: The port of 127.0.0.1 to serve the metrics on over
+            HTTP, None not to serve them, 0 for any free port.
+        metrics_socket: The path of the Unix socket to serve the metrics on
+            over HTTP, None not to serve them.
+
+    Attributes:
+        address: Readonly property, the (host, port) tuple the metrics are
+            served on, None if they are not.
+    """
+
+    def __init__(self, metrics, metrics_file=None,
+                 metrics_interval=METRICS_INTERVAL, metrics_port=None,
+                 metrics_socket=None):
+        self._metrics = metrics
+        self._file = metrics_file
+        self._interval = metrics_interval
+        self._port = metrics_port
+        self._socket = metrics_socket
+        # The files written, to tell the observer to drop their events.
+        self._paths = [os.path.abspath(p) for p in (metrics_file,
+                                                    metrics_socket)
+                       if p is not None]
+        self._servers = []
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def address(self):
+        """Readonly property, the (host, port) tuple served on, or None."""
+        for server in self._servers:
+            if isinstance(server, _HTTPServer):
+                return server.server_address
+        return None
+
+    def owns(self, path):
+        """Tell if path is the metrics file, or the socket."""
+        return os.path.abspath(path) in self._paths
+
+    def start(self):
+        """Start writing and serving the metrics in daemon threads.
+
+        Raises:
+            OSError: The port or the socket can't be bound, or the file
+                can't be written.
+        """
+        if self._port is not None:
+            self._serve(_HTTPServer(('127.0.0.1', self._port), _Handler))
+        if self._socket is not None:
+            if os.path.exists(self._socket):
+                # Left by a previous run.
+                os.remove(self._socket)
+            self._serve(_UnixHTTPServer(self._socket, _Handler))
+        if self._file is not None:
+            # Created now, before the watched trees are scanned.
+            self.write()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _serve(self, server):
+        server.metrics = self._metrics
+        self._servers.append(server)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def write(self):
+        """Write the metrics file now, in place."""
+        data = self._metrics.render()
+        with open(self._file, 'w') as f:
+            f.write(data)
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self.write()
+            except OSError:
+                # Try again next time, the directory may come back.
+                pass
+
+    def close(self):
+        """Stop serving, write the metrics file a last time."""
+        self._stopped.set()
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        if self._socket is not None and self._servers:
+            try:
+                os.remove(self._socket)
+            except OSError:
+                pass
+        self._servers = []
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self.write()
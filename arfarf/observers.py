@@ -0,0 +1,245 @@
+"""Define observers to schedule handlers with.
+"""
+
+import errno
+import threading
+
+from functools import partial
+
+from watchdog.observers.api import DEFAULT_EMITTER_TIMEOUT
+from watchdog.observers.api import DEFAULT_OBSERVER_TIMEOUT
+from watchdog.utils import UnsupportedLibc, platform
+
+from .polling import PruningObserver, SnapshotEmitter, SnapshotObserver
+from .polling import ThreadStartEmitter, TreeSnapshot, check_poll_intervals
+from .polling import diff_events
+from .state import TreeState
+from .transaction import queue_transaction
+
+if platform.is_linux():
+    try:
+        from watchdog.observers.inotify import InotifyEmitter
+        from watchdog.observers.inotify import InotifyObserver
+    except UnsupportedLibc:
+        InotifyEmitter = InotifyObserver = None
+else:
+    InotifyEmitter = InotifyObserver = None
+
+
+OBSERVER_BACKENDS = ('auto', 'inotify', 'polling')
+
+# Errors meaning the kernel can't give us (more) inotify instances or
+# watches, anything else is a real error and is raised.
+INOTIFY_EXHAUSTED_ERRNOS = (errno.ENOSPC, errno.EMFILE, errno.ENFILE,
+                            errno.ENOSYS)
+
+
+class _Batch(list):
+    """A list standing for the event queue of a native emitter, so the
+    events it queues at once are put in a transaction.
+    """
+
+    def put(self, item):
+        self.append(item)
+
+
+class FallbackEmitter(ThreadStartEmitter):
+    """An emitter using inotify, or polling when inotify is not available.
+
+    The native emitter is set up in the thread, see ThreadStartEmitter
+    class. If the platform has no inotify or the kernel runs out of inotify
+    instances or watches, a polling emitter is used for the watch instead.
+    Either way the real work is delegated to that emitter.
+
+    With a state, the native emitter has a snapshot of the tree kept to be
+    saved. Changes since the saved snapshot are found by a full scan once the
+    native emitter is set up, so none is missed meanwhile.
+
+    The events of one inotify read are queued in a transaction, the polling
+    emitter queues its transactions itself.
+
+    Constructor Args:
+        event_queue:
+        watch:
+        timeout: The same as EventEmitter class.
+        state: The same as SnapshotEmitter class.
+        fallback_kwargs: Keyword arguments to create the fallback emitter
+            with.
+
+    Attributes:
+        native_emitter_class: The emitter class to try first, None if the
+            platform doesn't support it.
+        fallback_emitter_class: The emitter class to fall back to.
+        emitter: Readonly property, the emitter doing the real work, None
+            before the thread starts.
+    """
+
+    native_emitter_class = InotifyEmitter
+    fallback_emitter_class = SnapshotEmitter
+
+    def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT,
+                 state=None, **fallback_kwargs):
+        super().__init__(event_queue, watch, timeout)
+        self._state = state
+        self._fallback_kwargs = fallback_kwargs
+        self._emitter = None
+        self._batch = None
+        # The (snapshot, lock) tuple tracked for the state, with inotify.
+        self._tracked = None
+
+    @property
+    def emitter(self):
+        """Readonly property, the emitter doing the real work."""
+        return self._emitter
+
+    def _create_emitter(self, emitter_cls, event_queue=None, **kwargs):
+        if event_queue is None:
+            event_queue = self._event_queue
+        emitter = emitter_cls(event_queue=event_queue,
+                              watch=self.watch, timeout=self.timeout,
+                              **kwargs)
+        emitter.on_thread_start()
+        return emitter
+
+    def on_thread_start(self):
+        """Set up the native emitter, or the fallback one if it fails."""
+        cls = type(self)
+        if cls.native_emitter_class is not None:
+            try:
+                self._batch = _Batch()
+                self._emitter = self._create_emitter(cls.native_emitter_class,
+                                                     event_queue=self._batch)
+            except OSError as e:
+                self._batch = None
+                if e.errno not in INOTIFY_EXHAUSTED_ERRNOS:
+                    raise
+            else:
+                if self._state is not None:
+                    self._track_state()
+                return
+        self._emitter = self._create_emitter(cls.fallback_emitter_class,
+                                             state=self._state,
+                                             **self._fallback_kwargs)
+
+    def _track_state(self):
+        path, recursive = self.watch.path, self.watch.is_recursive
+        prune = self._fallback_kwargs.get('prune')
+        snapshot = TreeSnapshot(
+            path, recursive,
+            prune=partial(prune, self.watch) if prune is not None else None,
+            entries=self._state.load(path, recursive),
+            scan_workers=self._fallback_kwargs.get('scan_workers', 1))
+        if snapshot.restored:
+            queue_transaction(self, diff_events(snapshot.rescan(full=True)))
+        lock = threading.Lock()
+        self._state.track(path, recursive, snapshot, lock, refresh=True)
+        self._tracked = (snapshot, lock)
+
+    def on_thread_stop(self):
+        """Stop the delegated emitter, and the scan threads of the
+        snapshot tracked for the state.
+        """
+        if self._emitter is not None:
+            self._emitter.stop()
+        if self._tracked is not None:
+            snapshot, lock = self._tracked
+            with lock:
+                snapshot.close()
+
+    def queue_events(self, timeout):
+        """Let the delegated emitter queue events."""
+        self._emitter.queue_events(timeout)
+        if self._batch:
+            events = [event for event, _ in self._batch]
+            self._batch.clear()
+            queue_transaction(self, events)
+
+
+class FallbackObserver(PruningObserver):
+    """Observer using inotify where possible and polling elsewhere.
+
+    Constructor Args:
+        timeout: The same as BaseObserver class.
+        state:
+        settle_time:
+        metrics: The same as PruningObserver class, it's passed on to the
+            polling emitters.
+        owners: The same as PruningObserver class.
+        polling_kwargs: Keyword arguments to create polling emitters with.
+    """
+
+    def __init__(self, timeout=DEFAULT_OBSERVER_TIMEOUT, state=None,
+                 settle_time=0, metrics=None, owners=(), **polling_kwargs):
+        emitter_cls = partial(FallbackEmitter, prune=self.ignores_tree,
+                              state=state, metrics=metrics, **polling_kwargs)
+        super().__init__(emitter_class=emitter_cls, timeout=timeout,
+                         state=state, settle_time=settle_time,
+                         metrics=metrics, owners=owners)
+
+
+def wait_started(observer):
+    """Wait until the emitters of an observer started are set up.
+
+    Polling and fallback emitters take their initial snapshot in their own
+    thread, see ThreadStartEmitter class, other emitters are set up by
+    Observer.start() already.
+
+    Raises:
+        Exception: The error an emitter failed to set up with.
+    """
+    for emitter in observer.emitters:
+        if isinstance(emitter, ThreadStartEmitter):
+            emitter.wait_started()
+
+
+def create_observer(backend='auto', timeout=DEFAULT_OBSERVER_TIMEOUT,
+                    state_file=None, settle_time=0, metrics=None, owners=(),
+                    **polling_kwargs):
+    """Create an observer using the backend named.
+
+    Args:
+        backend: One of OBSERVER_BACKENDS. 'auto' uses inotify on Linux and
+            falls back to polling when inotify is unavailable or its limits
+            are exhausted, 'inotify' uses inotify only, 'polling' uses
+            polling only.
+        timeout: The observer timeout, it's the polling interval for polling
+            emitters.
+        state_file: The path of the file the tree state is saved to between
+            runs, see the state module. None not to save it. It's ignored by
+            the inotify backend.
+        settle_time: Seconds a watch must stay quiet before a transaction of
+            events is dispatched, see the transaction module. It's ignored
+            by the inotify backend, which has no transactions.
+        metrics: The Metrics object recording scan durations and queue
+            delays, see the metrics module. None not to record them. It's
+            ignored by the inotify backend.
+        owners: A list of objects with an owns() method telling if a path is
+            a file they write, like MetricsExporter. Events for those files
+            are dropped. It's ignored by the inotify backend.
+        polling_kwargs: Keyword arguments to create polling emitters with,
+            like the bounds of the interval between polls, see
+            SnapshotEmitter class. They are ignored by the inotify backend.
+
+    Returns:
+        An observer object.
+
+    Raises:
+        ValueError: The backend is unknown, or it's 'inotify' and the
+            platform doesn't support it, or the polling options are not
+            valid, see check_poll_intervals().
+    """
+    check_poll_intervals(timeout, **polling_kwargs)
+    state = TreeState(state_file) if state_file is not None else None
+    if backend == 'auto':
+        return FallbackObserver(timeout=timeout, state=state,
+                                settle_time=settle_time, metrics=metrics,
+                                owners=owners, **polling_kwargs)
+    elif backend == 'inotify':
+        if InotifyObserver is None:
+            raise ValueError('inotify is not supported on this platform')
+        return InotifyObserver(timeout=timeout)
+    elif backend == 'polling':
+        return SnapshotObserver(timeout=timeout, state=state,
+                                settle_time=settle_time, metrics=metrics,
+                                owners=owners, **polling_kwargs)
+    raise ValueError('Unknown observer backend: {!r}'.format(backend))
@@ -0,0 +1,350 @@
+"""Define the multiplexer of command output.
+
+Commands write their standard output and error to pipes instead of the
+terminal. One thread reads all the pipes without blocking, and hands their
+lines, prefixed with the name of the dog, to another thread writing them to
+the terminal. The lines waiting for the terminal are bounded: when it's
+slower than the commands, like a paused tmux pane, lines are dropped from the
+terminal rather than the commands blocked on their writes.
+
+The output of the last runs of each dog is kept in ring buffers, to be
+dumped on demand, and it's optionally appended to a log file per dog.
+"""
+
+import os
+import re
+import selectors
+import sys
+import threading
+import time
+import traceback
+
+from collections import OrderedDict, deque
+
+
+# Lines kept per run.
+OUTPUT_LINES = 1000
+# Runs kept per dog.
+OUTPUT_RUNS = 5
+# Max bytes waiting for the terminal.
+TERMINAL_BUFFER = 1 << 20
+
+_READ_SIZE = 1 << 16
+_UNSAFE = re.compile(r'[^\w.-]+')
+
+
+class Run(object):
+    """The output of one run of a command.
+
+    Constructor Args:
+        label: The name of the dog.
+        lines: Max number of lines kept.
+
+    Attributes:
+        label: Readonly property, the name of the dog.
+        started: Readonly property, the time the run started, as returned by
+            time.time().
+        lines: Readonly property, a list of the last lines of output, bytes
+            ending with a line break.
+        returncode: Readonly property, the exit status of the command, None
+            while it runs.
+        popen_kwargs: Readonly property, a dict of keyword arguments to start
+            the command with.
+        fds: Readonly property, a tuple of the read ends of the standard
+            output and error pipes.
+    """
+
+    def __init__(self, label, lines=OUTPUT_LINES):
+        self._label = label
+        self._started = time.time()
+        self._lines = deque(maxlen=lines)
+        self._returncode = None
+        self._stdout, stdout = os.pipe()
+        self._stderr, stderr = os.pipe()
+        # The write ends, closed here once the command has them.
+        self._ends = [stdout, stderr]
+
+    def __repr__(self):
+        return '<Run: {!r} {}>'.format(self._label, self._status())
+
+    @property
+    def label(self):
+        """Readonly property, the name of the dog."""
+        return self._label
+
+    @property
+    def started(self):
+        """Readonly property, the time the run started."""
+        return self._started
+
+    @property
+    def lines(self):
+        """Readonly property, a list of the last lines of output."""
+        return list(self._lines)
+
+    @property
+    def returncode(self):
+        """Readonly property, the exit status of the command."""
+        return self._returncode
+
+    @property
+    def popen_kwargs(self):
+        """Readonly property, a dict of keyword arguments to start the
+        command with.
+        """
+        return {'stdout': self._ends[0], 'stderr': self._ends[1]}
+
+    @property
+    def fds(self):
+        """Readonly property, the read ends of the pipes."""
+        return (self._stdout, self._stderr)
+
+    def add(self, lines):
+        """Keep lines of output, dropping the oldest ones beyond the max."""
+        self._lines.extend(lines)
+
+    def spawned(self):
+        """Close the write ends of the pipes, the command has them now.
+
+        Call it once the command is started, or failed to start.
+        """
+        ends, self._ends = self._ends, [None, None]
+        for fd in ends:
+            if fd is not None:
+                os.close(fd)
+
+    def exited(self, process):
+        """Record the exit status of process."""
+        self._returncode = process.returncode
+
+    def _status(self):
+        if self._returncode is None:
+            return 'running'
+        return 'exited {}'.format(self._returncode)
+
+    def header(self):
+        """Get the line introducing the run in a dump."""
+        started = time.strftime('%H:%M:%S', time.localtime(self._started))
+        return '--- {} at {}, {}\n'.format(self._label, started,
+                                           self._status()).encode()
+
+
+class OutputMux(object):
+    """Read the output of commands and write it to the terminal.
+
+    The threads are started when the first run is opened.
+
+    Constructor Args:
+        stream: A binary file object the lines are written to, None for
+            standard output.
+        output_lines: Max number of lines kept per run.
+        output_runs: Max number of runs kept per dog.
+        log_dir: The directory output is appended to a log file per dog in,
+            named after the dog, None for no log files.
+
+    Attributes:
+        terminal_buffer: Max bytes waiting for the terminal, lines are
+            dropped beyond.
+        dropped: Readonly property, the number of lines dropped from the
+            terminal.
+    """
+
+    terminal_buffer = TERMINAL_BUFFER
+
+    def __init__(self, stream=None, output_lines=OUTPUT_LINES,
+                 output_runs=OUTPUT_RUNS, log_dir=None):
+        self._stream = stream if stream is not None else sys.stdout.buffer
+        self._output_lines = output_lines
+        self._output_runs = output_runs
+        self._log_dir = log_dir
+        self._lock = threading.Lock()
+        # label -> deque of Run objects
+        self._history = OrderedDict()
+        # label -> log file descriptor
+        self._logs = {}
+        self._selector = None
+        self._wakeup = None
+        self._reader = None
+        self._closed = False
+        # Lines waiting for the terminal.
+        self._cond = threading.Condition()
+        self._waiting = deque()
+        self._waiting_size = 0
+        self._dropped = 0
+        self._unreported = 0
+        self._writer = None
+
+    @property
+    def dropped(self):
+        """Readonly property, the number of lines dropped."""
+        with self._cond:
+            return self._dropped
+
+    def open(self, label):
+        """Get the pipes for a new run of a command.
+
+        Args:
+            label: The name of the dog, it prefixes the lines.
+
+        Returns:
+            A Run object, start the command with its popen_kwargs, then call
+            spawned().
+        """
+        run = Run(label, self._output_lines)
+        with self._lock:
+            if self._reader is None:
+                self._start()
+            runs = self._history.setdefault(
+                label, deque(maxlen=self._output_runs))
+            runs.append(run)
+            prefix = '[{}] '.format(label).encode()
+            # The state of each pipe: the run, the prefix and the partial
+            # line read so far.
+            for fd in run.fds:
+                os.set_blocking(fd, False)
+                self._selector.register(fd, selectors.EVENT_READ,
+                                        [run, prefix, b''])
+        os.write(self._wakeup[1], b'\0')
+        return run
+
+    def history(self, label):
+        """Get the runs kept for a dog.
+
+        Returns:
+            A list of Run objects, the oldest first.
+        """
+        with self._lock:
+            return list(self._history.get(label, ()))
+
+    def dump(self, stream):
+        """Write the output of the runs kept for every dog.
+
+        Args:
+            stream: A binary file object.
+        """
+        with self._lock:
+            runs = [run for history in self._history.values()
+                    for run in history]
+        for run in runs:
+            stream.write(run.header())
+            stream.writelines(run.lines)
+        stream.flush()
+
+    def close(self):
+        """Stop the threads and close the pipes and log files.
+
+        Lines already read are still written to the terminal.
+        """
+        with self._lock:
+            closed, self._closed = self._closed, True
+            reader = self._reader
+        if closed or reader is None:
+            return
+        os.write(self._wakeup[1], b'\0')
+        reader.join()
+        with self._cond:
+            self._waiting.append(None)
+            self._cond.notify()
+        self._writer.join()
+        # The wakeup pipe included.
+        for key in list(self._selector.get_map().values()):
+            self._selector.unregister(key.fd)
+            os.close(key.fd)
+        self._selector.close()
+        for fd in (self._wakeup[1],) + tuple(self._logs.values()):
+            os.close(fd)
+
+    def _start(self):
+        self._selector = selectors.DefaultSelector()
+        self._wakeup = os.pipe()
+        self._selector.register(self._wakeup[0], selectors.EVENT_READ)
+        self._reader = threading.Thread(target=self._read, daemon=True,
+                                        name='arfarf-output')
+        self._writer = threading.Thread(target=self._write, daemon=True,
+                                        name='arfarf-terminal')
+        self._reader.start()
+        self._writer.start()
+
+    def _read(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+            for key, _ in self._selector.select():
+                if key.fd == self._wakeup[0]:
+                    os.read(key.fd, 512)
+                    continue
+                try:
+                    self._read_pipe(key)
+                except Exception:
+                    # Keep reading the other pipes.
+                    traceback.print_exc()
+
+    def _read_pipe(self, key):
+        run, prefix, partial = key.data
+        try:
+            data = os.read(key.fd, _READ_SIZE)
+        except BlockingIOError:
+            return
+        if not data:
+            # The command, and its children, closed it.
+            with self._lock:
+                self._selector.unregister(key.fd)
+            os.close(key.fd)
+            if partial:
+                self._emit(run, prefix, [partial + b'\n'])
+            return
+        self._log(run.label, data)
+        lines = (partial + data).split(b'\n')
+        key.data[2] = lines.pop()
+        self._emit(run, prefix, [line + b'\n' for line in lines])
+
+    def _log(self, label, data):
+        if self._log_dir is None:
+            return
+        fd = self._logs.get(label)
+        if fd is None:
+            name = _UNSAFE.sub('_', label).strip('_') or 'dog'
+            path = os.path.join(self._log_dir, name + '.log')
+            fd = self._logs[label] = os.open(
+                path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(fd, data)
+
+    def _emit(self, run, prefix, lines):
+        if not lines:
+            return
+        run.add(lines)
+        with self._cond:
+            for line in lines:
+                line = prefix + line
+                if self._waiting_size + len(line) > type(self).terminal_buffer:
+                    self._dropped += 1
+                    self._unreported += 1
+                    continue
+                self._waiting.append(line)
+                self._waiting_size += len(line)
+            self._cond.notify()
+
+    def _write(self):
+        while True:
+            with self._cond:
+                while not self._waiting:
+                    self._cond.wait()
+                lines = list(self._waiting)
+                self._waiting.clear()
+                self._waiting_size = 0
+                dropped, self._unreported = self._unreported, 0
+            if dropped:
+                lines.insert(0, 'arfarf: {} lines dropped, the terminal is '
+                                'too slow\n'.format(dropped).encode())
+            closed = lines[-1] is None
+            if closed:
+                lines.pop()
+            try:
+                self._stream.writelines(lines)
+                self._stream.flush()
+            except (OSError, ValueError):
+                # The terminal is gone.
+                pass
+            if closed:
+                return
@@ -2,9 +2,58 @@
 """
 import os
 
-from collections import defaultdict
+from collections import OrderedDict
 
 from .dog import Dog
+from .graph import DogGraph
+from .router import EventRouter
+
+
+RUNTIMES = ('threads', 'asyncio')
+
+# Optional config options passed on to observers.create_observer().
+OBSERVER_OPTIONS = ('full_scan_interval', 'state_file', 'settle_time',
+                    'poll_interval_min', 'poll_interval_max', 'poll_backoff',
+                    'poll_intervals', 'scan_workers')
+
+# Optional config options passed on to output.OutputMux.
+OUTPUT_OPTIONS = ('output_lines', 'output_runs', 'log_dir')
+
+# Optional config options passed on to metrics.MetricsExporter.
+METRICS_OPTIONS = ('metrics_file', 'metrics_interval', 'metrics_port',
+                   'metrics_socket')
+
+
+def cover_watches(watch_infos):
+    """Find the watches covering the watches of dogs with fewer watches.
+
+    A recursive watch covers the watches of its path and of the paths under
+    it, a watch which isn't covers the watches of the same path only. Each
+    watch is covered by the widest recursive watch covering it, the first of
+    them in case of duplicates, or by itself. Each covering watch is then
+    scanned once for all the dogs it covers.
+
+    Args:
+        watch_infos: An iterable of (path, recursive) tuples, see
+            Dog.watch_info.
+
+    Returns:
+        An OrderedDict mapping each watch info to the one covering it.
+    """
+    infos = list(OrderedDict.fromkeys(watch_infos))
+    absolute = {info: os.path.abspath(info[0]) for info in infos}
+
+    def covers(root, info):
+        if not root[1]:
+            return not info[1] and absolute[root] == absolute[info]
+        return absolute[info] == absolute[root] or \
+            absolute[info].startswith(os.path.join(absolute[root], ''))
+
+    return OrderedDict(
+        # min() keeps the first of equal ones.
+        (info, min((root for root in infos if covers(root, info)),
+                   key=lambda root: (not root[1], len(absolute[root]))))
+        for info in infos)
 
 
 class AAConfigParser(object):
@@ -18,17 +67,114 @@ class AAConfigParser(object):
         self._dogs = config_module.dogs
         self._use_gitignore_default = config_module.use_gitignore_default
         self._gitignore_path = config_module.gitignore_path
+        # Optional, config files created by older versions don't have it.
+        self._observer_backend = getattr(config_module, 'observer', 'auto')
+        self._observer_options = {
+            name: getattr(config_module, name) for name in OBSERVER_OPTIONS
+            if hasattr(config_module, name)
+        }
+        self._capture_output = getattr(config_module, 'capture_output',
+                                       False)
+        self._output_options = {
+            name: getattr(config_module, name) for name in OUTPUT_OPTIONS
+            if hasattr(config_module, name)
+        }
+        self._metrics_options = {
+            name: getattr(config_module, name) for name in METRICS_OPTIONS
+            if getattr(config_module, name, None) is not None
+        }
+        self._runtime = getattr(config_module, 'runtime', 'threads')
+        self._max_jobs = getattr(config_module, 'max_jobs', None)
         self._config_module = config_module
 
+    @property
+    def observer_backend(self):
+        """Readonly property, the name of the observer backend to use."""
+        return self._observer_backend
+
+    @property
+    def observer_options(self):
+        """Readonly property, a dict of keyword arguments to create the
+        observer with.
+        """
+        return dict(self._observer_options)
+
+    @property
+    def capture_output(self):
+        """Readonly property, a boolean indicating if the output of the
+        commands goes through an OutputMux.
+        """
+        return self._capture_output
+
+    @property
+    def output_options(self):
+        """Readonly property, a dict of keyword arguments to create the
+        OutputMux with.
+        """
+        return dict(self._output_options)
+
+    @property
+    def export_metrics(self):
+        """Readonly property, a boolean indicating if metrics are recorded
+        and exported: to a file, a port or a socket.
+        """
+        return any(name in self._metrics_options
+                   for name in ('metrics_file', 'metrics_port',
+                                'metrics_socket'))
+
+    @property
+    def metrics_options(self):
+        """Readonly property, a dict of keyword arguments to create the
+        MetricsExporter with.
+        """
+        return dict(self._metrics_options)
+
+    @property
+    def uses_process_pool(self):
+        """Readonly property, a boolean indicating if a dog's command is
+        called in the process pool.
+        """
+        return any(dog.pool == 'process' for dog in self._dogs)
+
+    @property
+    def runtime(self):
+        """Readonly property, the name of the runtime to use."""
+        return self._runtime
+
+    @property
+    def max_jobs(self):
+        """Readonly property, max number of commands running at once, None
+        for the number of CPUs.
+        """
+        return self._max_jobs
+
     def _set_use_gitignore_default(self):
         Dog.use_gitignore_default = self._use_gitignore_default
 
     def _set_gitignore_path(self):
         Dog.gitignore_path = os.path.join(os.curdir, self._gitignore_path)
 
+    def load_gitignore(self):
+        """Parse the gitignore file now, if a dog uses it.
+
+        Otherwise it's parsed by schedule_with(), when the first handler
+        using it is created.
+        """
+        self._set_use_gitignore_default()
+        self._set_gitignore_path()
+        if Dog.gitignore is None and \
+                any(dog.use_gitignore for dog in self._dogs):
+            Dog.gitignore = Dog.parse_gitignore()
+
     def schedule_with(self, observer, cls):
         """Schedule handlers with observer.
 
+        Dogs watching the same tree, or trees under it, share one watch,
+        see cover_watches(), and their handlers only handle the events of
+        their part of it. The handlers of a watch are attached to one
+        EventRouter, which is scheduled for the watch instead of them.
+        Handlers of dogs with dependencies are put in a DogGraph.
+
         Args:
             observer: A Observer object.
             cls: The class to create handler objects.
@@ -36,15 +182,32 @@ class AAConfigParser(object):
         Returns:
             A dict mapping ObservedWatch objects to the corresponding handler
             set attached to them.
+
+        Raises:
+            ValueError: The dependencies of the dogs are not valid, see
+                DogGraph.
         """
         self._set_use_gitignore_default()
         self._set_gitignore_path()
 
-        handler_for_watch = defaultdict(set)
+        cover = cover_watches(dog.watch_info for dog in self._dogs)
+        handlers_for_info = OrderedDict()
         for dog in self._dogs:
-            handler = dog.create_handler(cls)
-            watch = observer.schedule(handler, *dog.watch_info)
-            handler_for_watch[watch].add(handler)
-        handler_for_watch = dict(handler_for_watch)
+            watch_info = cover[dog.watch_info]
+            handler = dog.create_handler(cls, watch_info)
+            handlers_for_info.setdefault(watch_info, []).append(handler)
+
+        routers = OrderedDict(
+            (watch_info, EventRouter(handlers))
+            for watch_info, handlers in handlers_for_info.items())
+        if any(dog.after for dog in self._dogs):
+            # Before the observer may dispatch events to them.
+            DogGraph(handler for router in routers.values()
+                     for handler in router.handlers)
+
+        handler_for_watch = {}
+        for watch_info, router in routers.items():
+            watch = observer.schedule(router, *watch_info)
+            handler_for_watch[watch] = set(router.handlers)
 
         return handler_for_watch
@@ -0,0 +1,199 @@
+"""Define compiled wildcard pattern matchers.
+
+They match paths exactly like pathtools.patterns.match_any_paths(), which
+watchdog handlers use, but translate the patterns once instead of on every
+call, and try them all at once instead of one by one.
+"""
+
+import fnmatch
+import os
+import re
+
+from functools import lru_cache
+
+
+# Characters making a pattern more than a literal string for fnmatch.
+_MAGIC = re.compile('[*?[]')
+
+
+def _normcase(pattern, case_sensitive):
+    """Normalize a pattern or a path the way pathtools does."""
+    if case_sensitive:
+        return pattern
+    # pathtools lowercases and fnmatch.fnmatch() applies normcase().
+    return os.path.normcase(pattern.lower())
+
+
+class GlobSet(object):
+    """A set of wildcard patterns compiled to match paths against at once.
+
+    Patterns are split by kind. The literal prefix common to all patterns,
+    usually the Dog path, is checked once. The rest of a pattern is then
+    looked up in a set if it's a literal string, checked with str.endswith()
+    if it's a '*' followed by a literal string, and matched with one combined
+    regex otherwise.
+
+    Constructor Args:
+        patterns: An iterable of wildcard pattern strings, as fnmatch
+            understands them.
+        case_sensitive: A boolean indicating if matching is case sensitive.
+
+    Attributes:
+        tree_cache_size: Max number of directories match_tree() remembers.
+    """
+
+    tree_cache_size = 4096
+
+    def __init__(self, patterns, case_sensitive=True):
+        self._case_sensitive = case_sensitive
+        self._trees = {}
+        patterns = {_normcase(p, case_sensitive) for p in patterns}
+        prefixes = []
+        for p in patterns:
+            m = _MAGIC.search(p)
+            prefixes.append(p[:m.start()] if m is not None else p)
+        self._prefix = os.path.commonprefix(prefixes)
+        start = len(self._prefix)
+        literals, suffixes, regexes = set(), [], []
+        for p in patterns:
+            rest = p[start:]
+            if _MAGIC.search(rest) is None:
+                literals.add(rest)
+            elif rest.startswith('*') and _MAGIC.search(rest, 1) is None:
+                suffixes.append(rest[1:])
+            else:
+                regexes.append(fnmatch.translate(rest))
+        self._literals = frozenset(literals)
+        self._suffixes = tuple(suffixes)
+        self._regex = re.compile('|'.join(regexes)) if regexes else None
+
+    def match(self, path):
+        """Tell if path matches any of the patterns.
+
+        Args:
+            path: A path string.
+
+        Returns:
+            A boolean, the same as pathtools.patterns.match_path_against().
+        """
+        path = _normcase(path, self._case_sensitive)
+        if not path.startswith(self._prefix):
+            return False
+        rest = path[len(self._prefix):]
+        if rest in self._literals:
+            return True
+        if self._suffixes and rest.endswith(self._suffixes):
+            return True
+        return self._regex is not None and self._regex.match(rest) is not None
+
+    def match_tree(self, path):
+        """Tell if a directory, or any directory above it, matches.
+
+        Directories are matched with a trailing slash. Results are cached,
+        GlobSet objects are shared by handlers with the same patterns, so
+        they share the results as well.
+
+        Args:
+            path: A directory path, without trailing slash.
+
+        Returns:
+            A boolean indicating if the directory tree matches.
+        """
+        matched = self._trees.get(path)
+        if matched is None:
+            parent = os.path.dirname(path)
+            matched = (parent not in ('', path) and self.match_tree(parent)) \
+                or self.match(os.path.join(path, ''))
+            if len(self._trees) >= type(self).tree_cache_size:
+                self._trees.clear()
+            self._trees[path] = matched
+        return matched
+
+
+@lru_cache(maxsize=256)
+def _compile(patterns, case_sensitive):
+    return GlobSet(patterns, case_sensitive)
+
+
+def _memo_match(globset, path, memo):
+    if memo is None:
+        return globset.match(path)
+    key = (globset, path)
+    matched = memo.get(key)
+    if matched is None:
+        matched = memo[key] = globset.match(path)
+    return matched
+
+
+def compile_patterns(patterns, case_sensitive=True):
+    """Get a GlobSet for patterns.
+
+    Handlers of Dogs sharing the same patterns, such as the gitignore ones,
+    share the same GlobSet object.
+
+    Args:
+        patterns: A list of wildcard pattern strings.
+        case_sensitive: A boolean indicating if matching is case sensitive.
+
+    Returns:
+        A GlobSet object.
+    """
+    return _compile(tuple(sorted(set(patterns))), case_sensitive)
+
+
+class PatternMatcher(object):
+    """Compiled version of pathtools.patterns.match_any_paths().
+
+    Constructor Args:
+        included_patterns: A list of wildcard patterns, None to include all
+            paths.
+        excluded_patterns: A list of wildcard patterns, None to exclude no
+            path.
+        case_sensitive: A boolean indicating if matching is case sensitive.
+
+    Raises:
+        ValueError: The same pattern is both included and excluded.
+    """
+
+    def __init__(self, included_patterns=None, excluded_patterns=None,
+                 case_sensitive=True):
+        excluded_patterns = excluded_patterns or []
+        if included_patterns is not None:
+            common = {_normcase(p, case_sensitive) for p in included_patterns}
+            common.intersection_update(_normcase(p, case_sensitive)
+                                       for p in excluded_patterns)
+            if common:
+                raise ValueError('conflicting patterns `%s` included and '
+                                 'excluded' % common)
+            self._included = compile_patterns(included_patterns,
+                                              case_sensitive)
+        else:
+            self._included = None
+        self._excluded = compile_patterns(excluded_patterns, case_sensitive)
+
+    def excludes(self, path):
+        """Tell if path matches any of the excluded patterns."""
+        return self._excluded.match(path)
+
+    def excludes_tree(self, path):
+        """Tell if a directory, or any directory above it, is excluded."""
+        return self._excluded.match_tree(path)
+
+    def match(self, path, memo=None):
+        """Tell if path is included and not excluded.
+
+        Args:
+            path: A path string.
+            memo: A dict to remember results in, matchers sharing patterns
+                and a memo match paths against those patterns only once.
+
+        Returns:
+            A boolean indicating if path matches.
+        """
+        return (self._included is None or
+                _memo_match(self._included, path, memo)) and \
+            not _memo_match(self._excluded, path, memo)
+
+    def match_any(self, paths, memo=None):
+        """Tell if any of paths matches, like match_any_paths() does."""
+        return any(self.match(path, memo) for path in paths)
@@ -0,0 +1,860 @@
+"""Define an incremental polling emitter.
+
+Watchdog's PollingEmitter takes a full DirectorySnapshot of the watched tree
+on every tick, stat'ing every file. TreeSnapshot keeps the tree state between
+ticks instead, and on each tick only stats the directories, then lists and
+stats the entries of the directories that changed. Modifying a file in place
+doesn't change its directory, so such changes are caught by periodic full
+scans, or on every tick in directories that changed recently.
+
+Directory trees ignored by every handler of a watch are not scanned at all.
+
+Large trees, or trees on network storage where each stat waits on a round
+trip, can be scanned by several threads: the subdirectories found are listed
+in parallel as they are found, and the directories stat'ed on each tick are
+split into shards stat'ed in parallel. Scan threads only list and stat, the
+snapshot is updated by the emitter thread, so the diff is the same as a
+serial scan's.
+
+The interval between polls can adapt to activity: it drops to a floor once
+a poll finds changes, and grows by a factor after each poll finding none, up
+to a ceiling, so idle trees are polled rarely and busy ones often. Full scans
+keep to the wall clock, they don't slow down with the polls: a file modified
+in place is found at the latest by the first poll a full scan interval after
+the last full scan, that is within the full scan interval plus the ceiling.
+
+The events of each poll are queued in a transaction, see the transaction
+module. Snapshots can be saved between runs, see the state module. An emitter
+starting from a saved snapshot reports what changed while it wasn't running.
+"""
+
+import errno
+import os
+import queue
+import threading
+import time
+
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from stat import S_ISDIR
+
+from watchdog.events import DirCreatedEvent, DirDeletedEvent
+from watchdog.events import DirModifiedEvent, DirMovedEvent
+from watchdog.events import FileCreatedEvent, FileDeletedEvent
+from watchdog.events import FileModifiedEvent, FileMovedEvent
+from watchdog.observers.api import BaseObserver, EventEmitter
+from watchdog.observers.api import DEFAULT_EMITTER_TIMEOUT
+from watchdog.observers.api import DEFAULT_OBSERVER_TIMEOUT
+
+from .profiling import profiled
+from .transaction import TransactionCollector, queue_transaction
+
+
+# Seconds between two full scans of the tree.
+FULL_SCAN_INTERVAL = 10
+
+# Seconds a directory keeps being rescanned on every tick after it changed.
+HOT_PERIOD = 60
+
+# Factor the polling interval grows by after each poll without changes.
+POLL_BACKOFF = 2
+
+# Directories stat'ed by a scan thread at once, fewer are stat'ed serially.
+SCAN_SHARD_SIZE = 64
+
+
+Entry = namedtuple('Entry', 'ino dev isdir size mtime ctime')
+Entry.__doc__ = """Stat information of a path, times are in nanoseconds."""
+
+SnapshotDiff = namedtuple('SnapshotDiff', (
+    'files_created files_deleted files_modified files_moved '
+    'dirs_created dirs_deleted dirs_modified dirs_moved'
+))
+SnapshotDiff.__doc__ = """Changes found by TreeSnapshot.rescan().
+
+The fields are named after DirectorySnapshotDiff properties, moved fields
+are lists of (src_path, dest_path) tuples, others are lists of paths.
+"""
+
+
+def _entry(st):
+    return Entry(st.st_ino, st.st_dev, S_ISDIR(st.st_mode), st.st_size,
+                 st.st_mtime_ns, st.st_ctime_ns)
+
+
+def _stat(path):
+    """Get the Entry of path, or the OSError raised stat'ing it."""
+    try:
+        return _entry(os.stat(path))
+    except OSError as e:
+        return e
+
+
+def _call_each(func, items):
+    return [func(item) for item in items]
+
+
+class TreeSnapshot(object):
+    """Stat information of a directory tree, updated in place.
+
+    Constructor Args:
+        path: The directory path to take the snapshot of.
+        recursive: A boolean indicating if subdirectories are included.
+        hot_period: Seconds a changed directory keeps being rescanned on
+            every tick.
+        prune: A callable taking a directory path, returning True if the
+            directory tree needn't be scanned. The directory itself is kept
+            in the snapshot, but not what's under it.
+        entries: A dict mapping paths to Entry objects, a snapshot of the
+            tree taken earlier to start from instead of scanning the tree,
+            rescan() then finds what changed since. None to scan the tree.
+        scan_workers: The number of threads scanning the tree, 1 to scan it
+            in the calling thread. The threads are kept until close().
+
+    Attributes:
+        path: Readonly property, the root path of the snapshot.
+        paths: Readonly property, a set of all the paths in the snapshot.
+        entries: Readonly property, a dict mapping all the paths in the
+            snapshot to their Entry objects.
+        restored: Readonly property, a boolean indicating if the snapshot
+            started from entries.
+    """
+
+    def __init__(self, path, recursive=True, hot_period=HOT_PERIOD,
+                 prune=None, entries=None, scan_workers=1):
+        if scan_workers < 1:
+            raise ValueError('scan_workers must be at least 1, not {!r}'
+                             .format(scan_workers))
+        self._path = path
+        self._recursive = recursive
+        self._hot_period = hot_period
+        self._prune = prune
+        self._pool = ThreadPoolExecutor(scan_workers,
+                                        thread_name_prefix='arfarf-scan') \
+                     if scan_workers > 1 else None
+        # path -> Entry
+        self._entries = {}
+        # scanned directory path -> set of its entry paths
+        self._children = {}
+        # directory path -> time until which it's rescanned on every tick
+        self._hot = {}
+        self._restored = entries is not None and path in entries
+        if self._restored:
+            self._restore(entries)
+        else:
+            self._add(path, _entry(os.stat(path)), {})
+
+    @property
+    def path(self):
+        """Readonly property, the root path of the snapshot."""
+        return self._path
+
+    @property
+    def paths(self):
+        """Readonly property, a set of all the paths in the snapshot."""
+        return set(self._entries)
+
+    @property
+    def entries(self):
+        """Readonly property, a dict mapping paths to Entry objects."""
+        return dict(self._entries)
+
+    @property
+    def restored(self):
+        """Readonly property, a boolean indicating if the snapshot started
+        from entries.
+        """
+        return self._restored
+
+    def entry(self, path):
+        """Get the Entry of path, None if path is not in the snapshot."""
+        return self._entries.get(path)
+
+    def close(self):
+        """Stop the scan threads, later scans are done in the calling
+        thread.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _scan_dir(self, path):
+        """List a directory.
+
+        Args:
+            path: A directory path.
+
+        Returns:
+            A (entries, links) tuple. entries is a dict mapping entry paths to
+            their Entry objects, links is a set of the entry paths which are
+            symlinks.
+        """
+        entries, links = {}, set()
+        try:
+            with os.scandir(path) as it:
+                for dentry in it:
+                    try:
+                        entries[dentry.path] = _entry(dentry.stat())
+                        # Told by the directory listing, no lstat needed.
+                        if dentry.is_symlink():
+                            links.add(dentry.path)
+                    except OSError:
+                        # Deleted since listed, or a dangling symlink.
+                        continue
+        except OSError as e:
+            # The directory may have been deleted, or replaced by a file,
+            # since it was found, it's treated as empty then. Unreadable
+            # directories are treated as empty too.
+            if e.errno not in (errno.ENOENT, errno.ENOTDIR, errno.EINVAL,
+                               errno.EACCES):
+                raise
+        return entries, links
+
+    def _should_scan(self, path, entry, link=None):
+        """Tell if a directory is listed, link tells if path is a symlink,
+        None to find out.
+        """
+        if not entry.isdir:
+            return False
+        if path == self._path:
+            return True
+        if link is None:
+            link = os.path.islink(path)
+        return self._recursive and not link and \
+            not (self._prune is not None and self._prune(path))
+
+    def _walk(self, path):
+        """List a directory, and the directories to be scanned under it.
+
+        With scan threads, each directory found is listed by one of them as
+        soon as it's found, so the subtrees of the directory are scanned in
+        parallel.
+
+        Args:
+            path: A directory path.
+
+        Yields:
+            (path, entries) tuples, one for each directory listed, entries is
+            a dict mapping entry paths to their Entry objects.
+        """
+        def subdirs(listing):
+            entries, links = listing
+            return [p for p, e in entries.items()
+                    if self._should_scan(p, e, p in links)]
+
+        pool = self._pool
+        if pool is None:
+            stack = [path]
+            while stack:
+                path = stack.pop()
+                listing = self._scan_dir(path)
+                yield path, listing[0]
+                stack.extend(subdirs(listing))
+            return
+        pending = {pool.submit(self._scan_dir, path): path}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                listing = future.result()
+                yield path, listing[0]
+                for p in subdirs(listing):
+                    pending[pool.submit(self._scan_dir, p)] = p
+
+    def _add(self, path, entry, created, link=None):
+        """Add path, and the subtree under it, to the snapshot."""
+        self._entries[path] = entry
+        created[path] = entry
+        if not self._should_scan(path, entry, link):
+            return
+        for path, entries in self._walk(path):
+            self._children[path] = set(entries)
+            self._entries.update(entries)
+            created.update(entries)
+
+    def _restore(self, entries):
+        """Fill the snapshot with the entries of a snapshot taken earlier.
+
+        Only the entries the snapshot would scan now are kept, so that
+        changes of recursive or prune are taken into account.
+        """
+        def key(path):
+            # The same for 'dir' and 'dir/'.
+            return os.path.dirname(os.path.join(path, ''))
+
+        children = {}
+        for path in entries:
+            if path != self._path:
+                children.setdefault(os.path.dirname(path), set()).add(path)
+        stack = [self._path]
+        while stack:
+            path = stack.pop()
+            entry = self._entries[path] = entries[path]
+            if self._should_scan(path, entry):
+                self._children[path] = children.get(key(path), set())
+                stack.extend(self._children[path])
+
+    def _remove(self, path, deleted):
+        """Remove path, and the subtree under it, from the snapshot."""
+        stack = [path]
+        while stack:
+            path = stack.pop()
+            deleted[path] = self._entries.pop(path)
+            self._hot.pop(path, None)
+            stack.extend(self._children.pop(path, ()))
+
+    def _rescan_dir(self, path, listing, created, deleted, modified):
+        """Update the entries of a directory from a new listing of it.
+
+        Returns:
+            A boolean indicating if any entry changed.
+        """
+        old_children = self._children[path]
+        new_children, links = listing
+        changed = False
+        for p in old_children.difference(new_children):
+            self._remove(p, deleted)
+            changed = True
+        for p, entry in new_children.items():
+            old = self._entries.get(p) if p in old_children else None
+            if old is None:
+                self._add(p, entry, created, p in links)
+            elif (old.ino, old.dev, old.isdir) != \
+                    (entry.ino, entry.dev, entry.isdir):
+                self._remove(p, deleted)
+                self._add(p, entry, created, p in links)
+            elif (old.mtime, old.size) != (entry.mtime, entry.size):
+                modified.add(p)
+                self._entries[p] = entry
+            else:
+                continue
+            changed = True
+        self._children[path] = set(new_children)
+        return changed
+
+    def _map(self, func, items):
+        """Call func with each item, the items are split into shards
+        handled by the scan threads, if any.
+
+        Returns:
+            A list of the results, in the order of items.
+        """
+        pool = self._pool
+        if pool is None or len(items) <= SCAN_SHARD_SIZE:
+            return [func(item) for item in items]
+        shards = [items[i:i + SCAN_SHARD_SIZE]
+                  for i in range(0, len(items), SCAN_SHARD_SIZE)]
+        return [result for shard in pool.map(partial(_call_each, func), shards)
+                for result in shard]
+
+    @profiled
+    def rescan(self, full=False):
+        """Update the snapshot and find what changed since the last scan.
+
+        Args:
+            full: A boolean indicating if every directory is rescanned, or
+                only the ones that changed, or changed recently.
+
+        Returns:
+            A SnapshotDiff object.
+
+        Raises:
+            OSError: The root path can't be stat'ed anymore.
+        """
+        now = time.monotonic()
+        created, deleted, modified = {}, {}, set()
+
+        # Stat every directory first, a directory whose entries changed has
+        # its own mtime changed.
+        dirty = []
+        paths = list(self._children)
+        for path, entry in zip(paths, self._map(_stat, paths)):
+            old = self._entries[path]
+            if isinstance(entry, OSError):
+                if path == self._path:
+                    raise entry
+                # Gone, its parent changed as well and takes care of it.
+                continue
+            if (entry.ino, entry.dev) != (old.ino, old.dev):
+                if path != self._path:
+                    # Replaced, its parent changed as well and takes care of
+                    # it.
+                    continue
+                # The root has no parent, all its entries are new.
+                old = self._entries[path] = entry
+                self._hot[path] = now + self._hot_period
+            stat_changed = (entry.mtime, entry.ctime) != (old.mtime, old.ctime)
+            if stat_changed:
+                if (entry.mtime, entry.size) != (old.mtime, old.size):
+                    modified.add(path)
+                self._entries[path] = entry
+            if full or stat_changed or self._hot.get(path, 0) > now:
+                dirty.append(path)
+            else:
+                self._hot.pop(path, None)
+
+        # Parents first, so subtrees removed with their parent are skipped.
+        dirty.sort()
+        listings = self._map(self._scan_dir, dirty)
+        for path, listing in zip(dirty, listings):
+            if path not in self._children:
+                continue
+            if self._rescan_dir(path, listing, created, deleted,
+                                modified) or path in modified:
+                self._hot[path] = now + self._hot_period
+
+        return self._diff(created, deleted, modified)
+
+    def _diff(self, created, deleted, modified):
+        # Paths deleted, or deleted and recreated, are not reported as
+        # modified.
+        modified.difference_update(deleted)
+        moved = []
+        inode_to_created = {(e.ino, e.dev, e.isdir): p
+                            for p, e in created.items()}
+        for path, entry in list(deleted.items()):
+            dest = inode_to_created.get((entry.ino, entry.dev, entry.isdir))
+            if dest is not None and dest in created:
+                moved.append((path, dest))
+                # Like DirectorySnapshotDiff, changed while moved is reported
+                # as modified on the source path.
+                if (entry.mtime, entry.size) != \
+                        (created[dest].mtime, created[dest].size):
+                    modified.add(path)
+                del deleted[path]
+                del created[dest]
+        entries = self._entries
+        moved_from = {src: entries[dest] for src, dest in moved}
+
+        def isdir(path):
+            return (moved_from.get(path) or entries[path]).isdir
+
+        return SnapshotDiff(
+            files_created=[p for p, e in created.items() if not e.isdir],
+            files_deleted=[p for p, e in deleted.items() if not e.isdir],
+            files_modified=[p for p in modified if not isdir(p)],
+            files_moved=[m for m in moved if not entries[m[1]].isdir],
+            dirs_created=[p for p, e in created.items() if e.isdir],
+            dirs_deleted=[p for p, e in deleted.items() if e.isdir],
+            dirs_modified=[p for p in modified if isdir(p)],
+            dirs_moved=[m for m in moved if entries[m[1]].isdir],
+        )
+
+
+def diff_events(diff):
+    """Get the events of changes found by TreeSnapshot.rescan().
+
+    Args:
+        diff: A SnapshotDiff object.
+
+    Returns:
+        A list of file system event objects.
+    """
+    # Same order as watchdog's PollingEmitter.
+    return (
+        [FileDeletedEvent(p) for p in diff.files_deleted] +
+        [FileModifiedEvent(p) for p in diff.files_modified] +
+        [FileCreatedEvent(p) for p in diff.files_created] +
+        [FileMovedEvent(src, dest) for src, dest in diff.files_moved] +
+        [DirDeletedEvent(p) for p in diff.dirs_deleted] +
+        [DirModifiedEvent(p) for p in diff.dirs_modified] +
+        [DirCreatedEvent(p) for p in diff.dirs_created] +
+        [DirMovedEvent(src, dest) for src, dest in diff.dirs_moved]
+    )
+
+
+def poll_bounds(path, timeout, poll_interval_min=None,
+                poll_interval_max=None, poll_intervals=None):
+    """Get the bounds of the interval between polls of a watch.
+
+    Args:
+        path: The path of the watch.
+        timeout:
+        poll_interval_min:
+        poll_interval_max:
+        poll_intervals: The same as SnapshotEmitter class.
+
+    Returns:
+        A (min, max) tuple of seconds, None if the interval doesn't adapt.
+    """
+    if poll_intervals:
+        path = os.path.abspath(path)
+        for watch_path, bounds in poll_intervals.items():
+            if os.path.abspath(watch_path) == path:
+                return tuple(bounds)
+    if poll_interval_min is None and poll_interval_max is None:
+        return None
+    low = poll_interval_min if poll_interval_min is not None else timeout
+    high = poll_interval_max if poll_interval_max is not None else low
+    return low, high
+
+
+def check_poll_intervals(timeout, poll_interval_min=None,
+                         poll_interval_max=None, poll_backoff=POLL_BACKOFF,
+                         poll_intervals=None, scan_workers=1, **kwargs):
+    """Check the polling options given to SnapshotEmitter are sane.
+
+    Args:
+        timeout:
+        poll_interval_min:
+        poll_interval_max:
+        poll_backoff:
+        poll_intervals:
+        scan_workers: The same as SnapshotEmitter class.
+        kwargs: Other keyword arguments of SnapshotEmitter, ignored.
+
+    Raises:
+        ValueError: A bound isn't positive, a min is above its max, the
+            backoff factor is below 1, or there are no scan workers.
+    """
+    bounds = [poll_bounds('', timeout, poll_interval_min, poll_interval_max)]
+    bounds.extend(tuple(b) for b in (poll_intervals or {}).values())
+    for low, high in filter(None, bounds):
+        if not 0 < low <= high:
+            raise ValueError('invalid polling interval bounds: ({!r}, {!r})'
+                             .format(low, high))
+    if poll_backoff < 1:
+        raise ValueError('poll_backoff must be at least 1, not {!r}'
+                         .format(poll_backoff))
+    if scan_workers < 1:
+        raise ValueError('scan_workers must be at least 1, not {!r}'
+                         .format(scan_workers))
+
+
+class ThreadStartEmitter(EventEmitter):
+    """Base emitter setting up in its own thread.
+
+    Watchdog runs on_thread_start() in the thread starting the emitter, so
+    starting an observer waits for every emitter to scan its tree. This one
+    runs it first thing in its own thread instead, wait_started() waits for
+    it. An emitter stopped meanwhile is stopped once it's set up.
+
+    Constructor Args:
+        event_queue:
+        watch:
+        timeout: The same as EventEmitter class.
+    """
+
+    def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT):
+        super().__init__(event_queue, watch, timeout)
+        self._set_up = threading.Event()
+        self._set_up_lock = threading.Lock()
+        self._set_up_error = None
+
+    def start(self):
+        """Start the thread, it calls on_thread_start() itself."""
+        threading.Thread.start(self)
+
+    def stop(self):
+        """Signal the thread to stop, once it's set up."""
+        self.stopped_event.set()
+        with self._set_up_lock:
+            self.on_thread_stop()
+
+    def run(self):
+        try:
+            with self._set_up_lock:
+                if self.should_keep_running():
+                    self.on_thread_start()
+        except Exception as e:
+            self._set_up_error = e
+            self.stopped_event.set()
+        finally:
+            self._set_up.set()
+        super().run()
+
+    def wait_started(self, timeout=None):
+        """Wait until on_thread_start() returns, in the thread.
+
+        Returns:
+            True if it returned, False on timeout.
+
+        Raises:
+            Exception: The error on_thread_start() raised.
+        """
+        if not self._set_up.wait(timeout):
+            return False
+        if self._set_up_error is not None:
+            raise self._set_up_error
+        return True
+
+
+class SnapshotEmitter(ThreadStartEmitter):
+    """Platform-independent emitter polling a TreeSnapshot.
+
+    Constructor Args:
+        event_queue:
+        watch:
+        timeout: The same as EventEmitter class, timeout is the interval
+            between two polls, unless the interval adapts to activity.
+        full_scan_interval: Min seconds between two full scans of the tree,
+            the first poll this long after the last full scan does one,
+            however long the polls wait.
+        prune: A callable taking the watch and a directory path, returning
+            True if the directory tree needn't be scanned.
+        state: A TreeState object to start from the snapshot saved for the
+            watch, and save the snapshot to. None not to save it.
+        metrics: The Metrics object recording how long scans take, None not
+            to record it.
+        poll_interval_min: Seconds between two polls once a poll found
+            changes, None for timeout.
+        poll_interval_max: Max seconds between two polls while the tree is
+            idle, the interval grows by poll_backoff after each poll without
+            changes up to it. None to keep polling every poll_interval_min.
+            The interval doesn't adapt when neither is given.
+        poll_backoff: The factor the interval grows by.
+        poll_intervals: A dict mapping watch paths to (min, max) tuples
+            replacing poll_interval_min and poll_interval_max for them, None
+            if none does.
+        scan_workers: The number of threads scanning the tree, see
+            TreeSnapshot class. They're kept until the emitter stops.
+
+    Attributes:
+        interval: Readonly property, seconds until the next poll.
+    """
+
+    def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT,
+                 full_scan_interval=FULL_SCAN_INTERVAL, prune=None,
+                 state=None, metrics=None, poll_interval_min=None,
+                 poll_interval_max=None, poll_backoff=POLL_BACKOFF,
+                 poll_intervals=None, scan_workers=1):
+        super().__init__(event_queue, watch, timeout)
+        self._full_scan_interval = full_scan_interval
+        self._prune = partial(prune, watch) if prune is not None else None
+        self._state = state
+        self._metrics = metrics
+        self._bounds = poll_bounds(watch.path, timeout, poll_interval_min,
+                                   poll_interval_max, poll_intervals)
+        self._backoff = poll_backoff
+        self._scan_workers = scan_workers
+        self._interval = self._bounds[0] if self._bounds is not None \
+                         else timeout
+        self._snapshot = None
+        self._last_full_scan = None
+        self._lock = threading.Lock()
+
+    def on_thread_start(self):
+        """Take the initial snapshot, or restore the saved one.
+
+        Changes since the saved snapshot are queued right away, except files
+        modified in place, which the first poll finds with a full scan.
+        """
+        path, recursive = self.watch.path, self.watch.is_recursive
+        saved = self._state.load(path, recursive) \
+                if self._state is not None else None
+        start = time.monotonic()
+        self._snapshot = TreeSnapshot(path, recursive, prune=self._prune,
+                                      entries=saved,
+                                      scan_workers=self._scan_workers)
+        self._observe_scan('initial', start)
+        self._last_full_scan = time.monotonic()
+        if self._snapshot.restored:
+            self._queue_diff(self._snapshot.rescan())
+            self._last_full_scan -= self._full_scan_interval
+        if self._state is not None:
+            self._state.track(path, recursive, self._snapshot, self._lock)
+
+    def on_thread_stop(self):
+        """Stop the scan threads of the snapshot, once the poll running, if
+        any, is done.
+        """
+        with self._lock:
+            if self._snapshot is not None:
+                self._snapshot.close()
+
+    @property
+    def interval(self):
+        """Readonly property, seconds until the next poll."""
+        return self._interval
+
+    def queue_events(self, timeout):
+        """Rescan the snapshot and queue events for the changes found.
+
+        timeout is the interval since the last poll, unless the interval
+        adapts to activity, see the constructor.
+        """
+        # timeout behaves like an interval for polling emitters.
+        if self.stopped_event.wait(self._interval if self._bounds is not None
+                                   else timeout):
+            return
+
+        with self._lock:
+            if not self.should_keep_running():
+                return
+
+            now = time.monotonic()
+            full = now - self._last_full_scan >= self._full_scan_interval
+            if full:
+                self._last_full_scan = now
+            try:
+                diff = self._snapshot.rescan(full=full)
+            except OSError:
+                queue_transaction(self, [DirDeletedEvent(self.watch.path)])
+                diff = None
+            else:
+                self._observe_scan('full' if full else 'incremental', now)
+                events = diff_events(diff)
+                if self._bounds is not None:
+                    low, high = self._bounds
+                    self._interval = low if events else \
+                                     min(self._interval * self._backoff, high)
+                queue_transaction(self, events)
+        if diff is None:
+            # Not holding the lock, on_thread_stop() takes it.
+            self.stop()
+
+    def _observe_scan(self, kind, start):
+        if self._metrics is not None:
+            self._metrics.scan_duration.observe(time.monotonic() - start,
+                                                watch=self.watch.path,
+                                                kind=kind)
+
+    def _queue_diff(self, diff):
+        queue_transaction(self, diff_events(diff))
+
+
+class PruningObserver(BaseObserver):
+    """Base observer telling emitters which directory trees to skip.
+
+    A directory tree is skipped when every handler of the watch has an
+    ignores_tree() method returning True for it, like AutoRunTrick. Handlers
+    should be scheduled before the observer starts, emitters decide what to
+    skip when they start.
+
+    Events are collected into transactions, see the transaction module.
+    Handlers with a dispatch_transaction() method, like EventRouter, are
+    dispatched whole transactions, other handlers are dispatched their events
+    one by one.
+
+    Constructor Args:
+        emitter_class:
+        timeout: The same as BaseObserver class.
+        state: The TreeState object emitters save their snapshots with, None
+            if they don't. Events for the state file are dropped, and the
+            state is saved a last time when the observer stops.
+        settle_time: Seconds a watch must stay quiet after a transaction
+            before it's dispatched, see TransactionCollector class.
+        metrics: The Metrics object recording how long transactions wait to
+            be dispatched, None not to record it.
+        owners: A list of objects with an owns() method telling if a path
+            is a file they write, like MetricsExporter. Events for those
+            files are dropped, like for the state file.
+
+    Attributes:
+        state: Readonly property, the TreeState object, or None.
+    """
+
+    def __init__(self, emitter_class, timeout=DEFAULT_OBSERVER_TIMEOUT,
+                 state=None, settle_time=0, metrics=None, owners=()):
+        super().__init__(emitter_class=emitter_class, timeout=timeout)
+        self._state = state
+        self._owners = ([state] if state is not None else []) + list(owners)
+        self._collector = TransactionCollector(settle_time)
+        self._metrics = metrics
+
+    @property
+    def state(self):
+        """Readonly property, the TreeState object, or None."""
+        return self._state
+
+    def on_thread_stop(self):
+        """Stop the emitters, then save the state."""
+        super().on_thread_stop()
+        if self._state is not None:
+            self._state.close()
+
+    def _owned(self, event):
+        """Tell if event is for the state file, or for files of the
+        owners.
+        """
+        if not self._owners or not hasattr(event, 'src_path'):
+            return False
+        paths = [event.src_path, getattr(event, 'dest_path', None)]
+        return all(any(owner.owns(p) for owner in self._owners)
+                   for p in paths if p)
+
+    def dispatch_events(self, event_queue, timeout):
+        """Override superclass method, collect events into transactions
+        and dispatch the transactions which settled.
+        """
+        collector = self._collector
+        try:
+            event, watch = event_queue.get(block=True,
+                                           timeout=collector.timeout(timeout))
+        except queue.Empty:
+            if not collector.pending:
+                raise
+        else:
+            try:
+                if not self._owned(event):
+                    transaction = collector.add(event, watch)
+                    if transaction is not None:
+                        self._dispatch_transaction(transaction)
+            finally:
+                event_queue.task_done()
+        for transaction in collector.settled(event_queue.empty()):
+            self._dispatch_transaction(transaction)
+
+    @profiled
+    def _dispatch_transaction(self, transaction):
+        if not transaction.events:
+            return
+        watch = transaction.watch
+        if self._metrics is not None:
+            self._metrics.queue_delay.observe(
+                time.monotonic() - transaction.started, watch=watch.path)
+        with self._lock:
+            # Like BaseObserver, handlers may unschedule handlers.
+            for handler in list(self._handlers.get(watch, [])):
+                if handler not in self._handlers.get(watch, []):
+                    continue
+                if hasattr(handler, 'dispatch_transaction'):
+                    handler.dispatch_transaction(transaction)
+                else:
+                    for event in transaction.events:
+                        handler.dispatch(event)
+
+    def ignores_tree(self, watch, path):
+        """Tell if every handler of watch ignores a directory tree.
+
+        Args:
+            watch: An ObservedWatch object.
+            path: A directory path.
+
+        Returns:
+            A boolean indicating if the directory tree needn't be scanned.
+        """
+        with self._lock:
+            handlers = list(self._handlers.get(watch, ()))
+        return bool(handlers) and all(
+            hasattr(handler, 'ignores_tree') and handler.ignores_tree(path)
+            for handler in handlers
+        )
+
+
+class SnapshotObserver(PruningObserver):
+    """Platform-independent observer polling watched paths incrementally.
+
+    Constructor Args:
+        timeout: The same as BaseObserver class.
+        full_scan_interval: The same as SnapshotEmitter class.
+        state:
+        settle_time:
+        metrics: The same as PruningObserver class, it's passed on to the
+            emitters.
+        owners: The same as PruningObserver class.
+        interval_kwargs: Keyword arguments setting the interval between
+            polls, see SnapshotEmitter class.
+    """
+
+    def __init__(self, timeout=DEFAULT_OBSERVER_TIMEOUT,
+                 full_scan_interval=FULL_SCAN_INTERVAL, state=None,
+                 settle_time=0, metrics=None, owners=(), **interval_kwargs):
+        emitter_cls = partial(SnapshotEmitter,
+                              full_scan_interval=full_scan_interval,
+                              prune=self.ignores_tree, state=state,
+                              metrics=metrics, **interval_kwargs)
+        super().__init__(emitter_class=emitter_cls, timeout=timeout,
+                         state=state, settle_time=settle_time,
+                         metrics=metrics, owners=owners)
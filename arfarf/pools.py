@@ -0,0 +1,118 @@
+"""Define the pools running callable commands.
+
+A callable command is called with the list of file system events it's run
+for, in a pool of threads, or in a pool of processes forked once the config
+is imported, so the modules it uses are imported already.
+"""
+
+import os
+import threading
+import traceback
+
+
+POOLS = ('thread', 'process')
+
+
+def _print_error(error):
+    traceback.print_exception(type(error), error, error.__traceback__)
+
+
+class ThreadPool(object):
+    """Call callables in threads.
+
+    Constructor Args:
+        size: Max number of calls running at once.
+    """
+
+    def __init__(self, size):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._executor = ThreadPoolExecutor(size,
+                                            thread_name_prefix='arfarf')
+
+    def submit(self, func, args, callback, error_callback=None):
+        """Call func(*args), then callback() whether it failed or not.
+
+        If it failed, error_callback(error) is called before callback().
+        """
+        def done(future):
+            error = future.exception()
+            if error is not None:
+                _print_error(error)
+                if error_callback is not None:
+                    error_callback(error)
+            callback()
+
+        self._executor.submit(func, *args).add_done_callback(done)
+
+    def close(self):
+        """Wait for running calls and stop the threads."""
+        self._executor.shutdown(wait=True)
+
+
+class ProcessPool(object):
+    """Call callables in pre-forked processes.
+
+    The processes are forked when the pool is created, create it before
+    starting threads. Callables and their arguments must be picklable,
+    callables defined at the top level of a module are.
+
+    Constructor Args:
+        size: Number of processes.
+    """
+
+    def __init__(self, size):
+        import multiprocessing
+
+        context = multiprocessing.get_context('fork')
+        self._pool = context.Pool(size)
+
+    def submit(self, func, args, callback, error_callback=None):
+        """Call func(*args) in a process, then callback() in this one.
+
+        If it failed, error_callback(error) is called before callback().
+        """
+        def failed(error):
+            _print_error(error)
+            if error_callback is not None:
+                error_callback(error)
+            callback()
+
+        self._pool.apply_async(func, args, callback=lambda _: callback(),
+                               error_callback=failed)
+
+    def close(self):
+        """Wait for running calls and stop the processes."""
+        self._pool.close()
+        self._pool.join()
+
+
+class Pools(object):
+    """The pools shared by callable commands, created when first used.
+
+    Constructor Args:
+        size: The size of each pool, None for the number of CPUs.
+    """
+
+    pool_classes = {'thread': ThreadPool, 'process': ProcessPool}
+
+    def __init__(self, size=None):
+        self._size = size or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    def get(self, kind):
+        """Get the pool of a kind, one of POOLS, creating it if needed."""
+        with self._lock:
+            pool = self._pools.get(kind)
+            if pool is None:
+                pool_cls = type(self).pool_classes[kind]
+                pool = self._pools[kind] = pool_cls(self._size)
+            return pool
+
+    def close(self):
+        """Close all the pools."""
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            pool.close()
@@ -0,0 +1,365 @@
+"""Define profilers switched on and off while arfarf runs.
+
+Two kinds of profilers are supported:
+- 'cprofile' runs cProfile on the hot paths only: the scans of polling
+  emitters, the dispatch of events by the observer, routers and handlers,
+  and Dog.create_handler(). They are the functions decorated by profiled().
+  The stats are dumped in the pstats format.
+- 'sampling' samples the stacks of every thread at a fixed interval. The
+  samples are dumped as collapsed stacks, the input of flame graph tools.
+
+ProfileSwitch starts and stops a profiler on SIGUSR1, and dumps a
+tracemalloc snapshot of memory, like the tree snapshots and the content
+cache, on SIGUSR2. The watched trees stay watched meanwhile.
+
+The hot modules import profiled() from here, so cProfile, pstats and
+tracemalloc are only imported once profiling starts.
+"""
+
+import functools
+import os
+import signal
+import sys
+import threading
+import time
+
+from collections import Counter
+
+
+PROFILE_MODES = ('cprofile', 'sampling')
+
+# Seconds between two samples of the sampling profiler.
+SAMPLE_INTERVAL = 0.005
+
+# Number of frames tracemalloc keeps per allocation.
+TRACEMALLOC_FRAMES = 5
+
+# The CallProfiler profiling functions decorated by profiled(), or None.
+_active = None
+
+
+def profiled(func):
+    """Profile the calls of func while a CallProfiler is running.
+
+    Calls made while another profiled function runs in the same thread are
+    part of the profile of that one.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = _active
+        if profiler is None:
+            return func(*args, **kwargs)
+        return profiler.call(func, *args, **kwargs)
+    return wrapper
+
+
+class _Stats(object):
+    """Stats taken from a cProfile.Profile, without disabling it, for
+    pstats.Stats.
+    """
+
+    def __init__(self, profile):
+        profile.snapshot_stats()
+        self.stats = profile.stats
+
+    def create_stats(self):
+        pass
+
+
+class CallProfiler(object):
+    """Run cProfile on the calls of functions decorated by profiled().
+
+    Each thread has a profile of its own, they are merged when dumped.
+
+    Attributes:
+        suffix: The extension of the files dump() writes.
+    """
+
+    suffix = '.pstats'
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._profiles = []
+
+    def start(self):
+        """Start profiling profiled() functions."""
+        global _active
+        _active = self
+
+    def stop(self):
+        """Stop profiling, calls running keep being profiled until they
+        return.
+        """
+        global _active
+        if _active is self:
+            _active = None
+
+    def call(self, func, *args, **kwargs):
+        """Call func(*args, **kwargs) under the profile of the thread."""
+        local = self._local
+        if getattr(local, 'busy', False):
+            return func(*args, **kwargs)
+        profile = getattr(local, 'profile', None)
+        if profile is None:
+            import cProfile
+
+            profile = local.profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12 and later profile one thread at once.
+            return func(*args, **kwargs)
+        local.busy = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            local.busy = False
+            profile.disable()
+
+    def stats(self):
+        """Get the stats of all the threads.
+
+        Returns:
+            A pstats.Stats object, None if nothing was profiled.
+        """
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+        import pstats
+
+        stats = pstats.Stats(_Stats(profiles[0]))
+        for profile in profiles[1:]:
+            stats.add(_Stats(profile))
+        return stats
+
+    def dump(self, path):
+        """Write the stats to path, in the pstats format.
+
+        Returns:
+            A boolean indicating if anything was profiled and written.
+        """
+        stats = self.stats()
+        if stats is None:
+            return False
+        stats.dump_stats(path)
+        return True
+
+
+class SamplingProfiler(object):
+    """Sample the stacks of every thread in a thread of its own.
+
+    Constructor Args:
+        interval: Seconds between two samples.
+
+    Attributes:
+        suffix: The extension of the files dump() writes.
+        samples: Readonly property, a Counter mapping collapsed stacks to
+            the number of samples taken of them.
+    """
+
+    suffix = '.collapsed'
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._samples = Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def samples(self):
+        """Readonly property, a Counter of the collapsed stacks."""
+        with self._lock:
+            return Counter(self._samples)
+
+    def start(self):
+        """Start sampling."""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='arfarf-sampler')
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling, and wait for the last sample."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @staticmethod
+    def _collapse(thread_name, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append('%s (%s:%d)' % (code.co_name,
+                                         os.path.basename(code.co_filename),
+                                         code.co_firstlineno))
+            frame = frame.f_back
+        names.append(thread_name)
+        return ';'.join(reversed(names))
+
+    def sample(self):
+        """Take a sample of the stacks of the other threads."""
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = [self._collapse(names.get(ident, 'thread-%d' % ident), frame)
+                  for ident, frame in sys._current_frames().items()
+                  if ident != me]
+        with self._lock:
+            self._samples.update(stacks)
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            self.sample()
+
+    def dump(self, path):
+        """Write the samples to path, one collapsed stack and its count a
+        line.
+
+        Returns:
+            A boolean indicating if any sample was taken and written.
+        """
+        samples = self.samples
+        if not samples:
+            return False
+        with open(path, 'w') as f:
+            for stack, count in sorted(samples.items()):
+                f.write('%s %d\n' % (stack, count))
+        return True
+
+
+def dump_memory(path, limit=25):
+    """Dump a tracemalloc snapshot, and a summary of it.
+
+    The snapshot is written to path, Snapshot.load() loads it back. The
+    summary, written to path with a .txt extension, has the memory allocated
+    by each module of arfarf, where the tree snapshots, the content cache
+    and the patterns are, then the lines allocating the most memory.
+
+    Args:
+        path: The path of the snapshot file.
+        limit: The number of lines in the summary.
+
+    Returns:
+        The path of the summary file.
+    """
+    import tracemalloc
+
+    snapshot = tracemalloc.take_snapshot()
+    snapshot.dump(path)
+    package = os.path.dirname(os.path.abspath(__file__))
+    by_file = snapshot.filter_traces([
+        tracemalloc.Filter(True, os.path.join(package, '*')),
+    ]).statistics('filename')
+    summary = os.path.splitext(path)[0] + '.txt'
+    with open(summary, 'w') as f:
+        f.write('# memory allocated by arfarf modules\n')
+        for stat in by_file:
+            f.write('%s\n' % stat)
+        f.write('\n# top %d lines\n' % limit)
+        for stat in snapshot.statistics('lineno')[:limit]:
+            f.write('%s\n' % stat)
+    return summary
+
+
+class ProfileSwitch(object):
+    """Start and stop profilers, and dump memory snapshots, on demand.
+
+    Each profiling session is dumped to a file of its own in directory,
+    named after the process id and the session number.
+
+    Constructor Args:
+        mode: One of PROFILE_MODES.
+        directory: The directory files are dumped to.
+        stream: The file the paths of dumped files are reported to.
+
+    Attributes:
+        running: Readonly property, a boolean indicating if a profiler runs.
+    """
+
+    def __init__(self, mode='cprofile', directory='.', stream=sys.stderr):
+        if mode not in PROFILE_MODES:
+            raise ValueError('unknown profile mode %r' % mode)
+        self._mode = mode
+        self._directory = directory
+        self._stream = stream
+        self._profiler = None
+        self._started = None
+        self._sessions = 0
+
+    @property
+    def running(self):
+        """Readonly property, a boolean indicating if a profiler runs."""
+        return self._profiler is not None
+
+    def _path(self, suffix):
+        self._sessions += 1
+        name = 'arfarf-%d-%d%s' % (os.getpid(), self._sessions, suffix)
+        return os.path.join(self._directory, name)
+
+    def _report(self, message):
+        print('arfarf: %s' % message, file=self._stream)
+
+    def start(self):
+        """Start a profiler, if none runs."""
+        if self._profiler is not None:
+            return
+        self._profiler = CallProfiler() if self._mode == 'cprofile' \
+                         else SamplingProfiler()
+        self._profiler.start()
+        self._started = time.monotonic()
+        self._report('%s profiling started' % self._mode)
+
+    def stop(self):
+        """Stop the profiler running, and dump what it profiled.
+
+        Returns:
+            The path of the file dumped, None if nothing was.
+        """
+        profiler, self._profiler = self._profiler, None
+        if profiler is None:
+            return None
+        profiler.stop()
+        path = self._path(profiler.suffix)
+        seconds = time.monotonic() - self._started
+        if not profiler.dump(path):
+            self._report('nothing profiled in %.1f s' % seconds)
+            return None
+        self._report('%.1f s of %s profiling dumped to %s'
+                     % (seconds, self._mode, path))
+        return path
+
+    def toggle(self):
+        """Stop the profiler running, or start one."""
+        if self._profiler is None:
+            self.start()
+        else:
+            self.stop()
+
+    def snapshot_memory(self):
+        """Dump a snapshot of memory, see dump_memory().
+
+        Memory allocations are traced from then on if they weren't, the
+        snapshot then has the memory allocated since.
+
+        Returns:
+            The path of the summary file.
+        """
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._report('tracing memory allocations from now on')
+        summary = dump_memory(self._path('.tracemalloc'))
+        self._report('memory snapshot dumped, summary in %s' % summary)
+        return summary
+
+    def install(self):
+        """Toggle profiling on SIGUSR1, dump memory on SIGUSR2."""
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.toggle())
+        signal.signal(signal.SIGUSR2,
+                      lambda signum, frame: self.snapshot_memory())
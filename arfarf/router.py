@@ -0,0 +1,124 @@
+"""Define the event router of a watch.
+"""
+
+from watchdog.events import FileSystemEventHandler
+
+from .profiling import profiled
+
+
+class EventRouter(FileSystemEventHandler):
+    """Dispatch the events of a watch to all the handlers attached to it.
+
+    The router is scheduled instead of the handlers. An event's paths are
+    prepared once, and the handlers' patterns are matched in one pass where
+    the patterns they share are tried only once.
+
+    Handlers providing event_paths(), wants() and handle(), like
+    AutoRunTrick, are routed this way. Other handlers are dispatched every
+    event and filter events themselves.
+
+    A transaction is routed event by event, then each handler is handed all
+    its events at once, by handle_transaction() if it has one, with the time
+    the transaction started.
+
+    Constructor Args:
+        handlers: An iterable of handler objects, in the order events are
+            dispatched to them. Duplicates are dropped.
+
+    Attributes:
+        handlers: Readonly property, a tuple of the handlers.
+    """
+
+    def __init__(self, handlers):
+        super().__init__()
+        unique = []
+        for handler in handlers:
+            if handler not in unique:
+                unique.append(handler)
+        self._handlers = tuple(unique)
+
+    def __repr__(self):
+        return '<EventRouter: {!r}>'.format(self._handlers)
+
+    @property
+    def handlers(self):
+        """Readonly property, a tuple of the handlers."""
+        return self._handlers
+
+    @staticmethod
+    def _routable(handler):
+        return hasattr(handler, 'wants') and hasattr(handler, 'handle')
+
+    def route(self, event):
+        """Find the handlers an event should be dispatched to.
+
+        Args:
+            event: A file system event object.
+
+        Returns:
+            A list of handlers.
+        """
+        paths = None
+        memo = {}
+        routed = []
+        for handler in self._handlers:
+            if not self._routable(handler):
+                routed.append(handler)
+                continue
+            if paths is None:
+                paths = handler.event_paths(event)
+            if handler.wants(event, paths, memo):
+                routed.append(handler)
+        return routed
+
+    @profiled
+    def dispatch(self, event):
+        """Override superclass method, dispatch event to routed handlers.
+
+        Args:
+            event: The event object to dispatch.
+        """
+        for handler in self.route(event):
+            if self._routable(handler):
+                handler.handle(event)
+            else:
+                handler.dispatch(event)
+
+    @profiled
+    def dispatch_transaction(self, transaction):
+        """Dispatch the events of a transaction to routed handlers.
+
+        Args:
+            transaction: A Transaction object.
+        """
+        # id(handler) -> events routed to it
+        routed = {}
+        for event in transaction.events:
+            for handler in self.route(event):
+                routed.setdefault(id(handler), []).append(event)
+        for handler in self._handlers:
+            events = routed.get(id(handler))
+            if not events:
+                continue
+            if not self._routable(handler):
+                for event in events:
+                    handler.dispatch(event)
+            elif hasattr(handler, 'handle_transaction'):
+                handler.handle_transaction(events, transaction.started)
+            else:
+                for event in events:
+                    handler.handle(event)
+
+    def ignores_tree(self, path):
+        """Tell if every handler ignores a directory tree.
+
+        Args:
+            path: A directory path.
+
+        Returns:
+            A boolean, see AutoRunTrick.ignores_tree().
+        """
+        return bool(self._handlers) and all(
+            hasattr(handler, 'ignores_tree') and handler.ignores_tree(path)
+            for handler in self._handlers
+        )
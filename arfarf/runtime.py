@@ -0,0 +1,322 @@
+"""Define the asyncio runtime.
+
+In the default 'threads' runtime, commands are started and stopped in the
+observer threads, and debouncing takes a thread per Dog. In the 'asyncio'
+runtime, observer threads only hand events over to one event loop, which
+debounces them, runs the commands as asyncio subprocesses and awaits their
+exit, so the number of threads doesn't grow with the number of Dogs.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import signal
+import sys
+
+from functools import partial
+
+from .changes import Delivery
+from .observers import wait_started
+from .startup import StartupProfile
+from .supervisor import renice
+from .tricks import AutoRunTrick
+
+
+class AsyncScheduler(object):
+    """Asyncio version of Scheduler.
+
+    Commands take a slot before they start and give it back once they exit.
+    Waiting commands take free slots by priority, then in the order they
+    started waiting. A command superseded while waiting is cancelled, which
+    drops it.
+
+    Constructor Args:
+        max_jobs: The same as Scheduler class.
+    """
+
+    def __init__(self, max_jobs=None):
+        self._max_jobs = max_jobs or os.cpu_count() or 1
+        self._running = 0
+        self._waiters = []
+        self._counter = itertools.count()
+
+    @property
+    def running(self):
+        """Readonly property, the number of slots taken."""
+        return self._running
+
+    async def acquire(self, priority=0):
+        """Wait for a free slot and take it.
+
+        Args:
+            priority: An int, higher priorities take slots first.
+        """
+        if self._running < self._max_jobs and not self._waiters:
+            self._running += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters,
+                       (-priority, next(self._counter), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before the cancellation.
+                self.release()
+            raise
+
+    def release(self):
+        """Give a slot back, handing it over to the next waiter if any."""
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._running -= 1
+
+
+class AsyncAutoRunTrick(AutoRunTrick):
+    """AutoRunTrick running its command in an asyncio event loop.
+
+    Only on_any_event() may be called from other threads, other methods must
+    be called in the loop.
+
+    Constructor Args:
+        loop: The event loop to run commands in.
+        scheduler: The AsyncScheduler object shared by the handlers, None
+            not to limit how many commands run at once.
+        The other args are the same as AutoRunTrick class.
+    """
+
+    def __init__(self, *args, loop, scheduler=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self._worker is not None:
+            raise ValueError('worker dogs need the threads runtime')
+        if self._after:
+            raise ValueError('dogs with dependencies need the threads '
+                             'runtime')
+        self._loop = loop
+        self._scheduler = scheduler
+        self._task = None
+        self._burst = []
+        self._first = None
+        self._timer = None
+
+    def on_any_event(self, event):
+        """Override superclass on_any_event, pass event to the loop."""
+        self._loop.call_soon_threadsafe(self._push, event)
+
+    def on_events(self, events):
+        """Override superclass on_events, pass events to the loop."""
+        self._loop.call_soon_threadsafe(self._push_events, events)
+
+    def _push(self, event):
+        self._push_events([event])
+
+    def _push_events(self, events):
+        if self._changes_mode is not None:
+            for event in events:
+                self._changes.add(event)
+        if not self._debounce:
+            self._burst = events
+            self._flush()
+            return
+        now = self._loop.time()
+        if not self._burst:
+            self._first = now
+        self._burst.extend(events)
+        deadline = now + self._debounce
+        if self._max_delay is not None:
+            deadline = min(deadline, self._first + self._max_delay)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self._loop.call_at(deadline, self._flush)
+
+    def _flush(self):
+        events, self._burst = self._burst, []
+        self._timer = None
+        if self._callable is not None:
+            self._call(events)
+        elif self._command is None:
+            # The default logger logs every event.
+            for event in events:
+                self.start(event=event)
+        else:
+            self.start(event=events[-1])
+
+    def start(self, event=None):
+        """Override superclass start, run the command in a task.
+
+        The running command is cancelled, the new one starts once it's gone.
+        """
+        if self._callable is not None or self._command is None:
+            super().start(event=event)
+            return
+        previous = self._task
+        if previous is not None:
+            previous.cancel()
+        self._task = self._loop.create_task(self._run(previous))
+
+    def stop(self):
+        """Override superclass stop, cancel the running command.
+
+        It returns immediately, use aclose() to wait for the command to exit.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._burst = []
+        if self._task is not None:
+            self._task.cancel()
+
+    async def aclose(self):
+        """Stop the command and wait for it to exit."""
+        self.stop()
+        if self._task is not None:
+            await asyncio.wait([self._task])
+            self._task = None
+
+    async def _run(self, previous):
+        if previous is not None:
+            try:
+                await asyncio.wait([previous])
+            except asyncio.CancelledError:
+                # Don't let the next command start before previous exits.
+                await asyncio.wait([previous])
+                raise
+        if self._scheduler is not None:
+            await self._scheduler.acquire(self._priority)
+        delivery = None
+        kwargs = {}
+        if self._changes_mode is not None:
+            changes = self._changes.take()
+            delivery = Delivery(self._changes_mode, changes)
+            kwargs = delivery.popen_kwargs
+        output = type(self).output
+        output = output.open(self.label) if output is not None else None
+        if output is not None:
+            kwargs.update(output.popen_kwargs)
+        try:
+            try:
+                if self._shell:
+                    process = await asyncio.create_subprocess_shell(
+                        self._args, start_new_session=True, **kwargs)
+                else:
+                    process = await asyncio.create_subprocess_exec(
+                        *self._args, start_new_session=True, **kwargs)
+            except Exception:
+                if delivery is not None:
+                    # Deliver the changes again to the next run.
+                    self._changes.restore(changes)
+                raise
+            finally:
+                if output is not None:
+                    output.spawned()
+            renice(process.pid, self._nice, self._ionice)
+            started = self._record_spawn()
+            if delivery is not None and delivery.data is not None:
+                process.stdin.write(delivery.data)
+                process.stdin.close()
+            try:
+                await process.wait()
+            except asyncio.CancelledError:
+                if delivery is not None:
+                    # Deliver the changes again to the next run.
+                    self._changes.restore(changes)
+                await self._terminate(process)
+                raise
+            finally:
+                if output is not None:
+                    output.exited(process)
+                self._record_exit(started, process.returncode)
+        finally:
+            if delivery is not None:
+                delivery.close()
+            if self._scheduler is not None:
+                self._scheduler.release()
+
+    async def _terminate(self, process):
+        try:
+            os.killpg(process.pid, self._stop_signal)
+        except OSError:
+            # Process is already gone.
+            return
+        try:
+            await asyncio.wait_for(process.wait(), self._kill_after)
+        except asyncio.TimeoutError:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            await process.wait()
+
+
+def _set_child_watcher(loop):
+    """Wait for child processes with pidfds, not with a thread each."""
+    # Python 3.12 and later pick pidfds by themselves.
+    if sys.version_info >= (3, 12) or \
+            not hasattr(asyncio, 'PidfdChildWatcher'):
+        return
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except (AttributeError, OSError):
+        return
+    watcher = asyncio.PidfdChildWatcher()
+    watcher.attach_loop(loop)
+    asyncio.set_child_watcher(watcher)
+
+
+async def _serve(observer, handlers, profile):
+    loop = asyncio.get_running_loop()
+    try:
+        # The emitters take their initial snapshots in their threads.
+        with profile.phase('initial scan'):
+            observer.start()
+            with profile.phase('initial runs'):
+                for handler in handlers:
+                    if handler.run_at_start:
+                        handler.start()
+            await loop.run_in_executor(None, wait_started, observer)
+        profile.report()
+        await asyncio.Future()
+    finally:
+        observer.stop()
+        if observer.is_alive():
+            observer.join()
+        await asyncio.gather(*(handler.aclose() for handler in handlers))
+
+
+def run(parser, observer, profile=None):
+    """Run the dogs of a config in the asyncio runtime until interrupted.
+
+    Args:
+        parser: An AAConfigParser object.
+        observer: An Observer object, not started yet.
+        profile: The StartupProfile object to time the rest of startup with,
+            it's reported once the initial scan is done.
+    """
+    if profile is None:
+        profile = StartupProfile()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    _set_child_watcher(loop)
+    scheduler = AsyncScheduler(parser.max_jobs)
+    with profile.phase('scheduling'):
+        handler_for_watch = parser.schedule_with(
+            observer,
+            partial(AsyncAutoRunTrick, loop=loop, scheduler=scheduler))
+    handlers = set.union(*tuple(handler_for_watch.values()))
+    # Fork the process pool before the observer threads start, if it's not
+    # forked yet.
+    if any(handler.pool == 'process' for handler in handlers):
+        AutoRunTrick.pools.get('process')
+    task = loop.create_task(_serve(observer, handlers, profile))
+    try:
+        loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        task.cancel()
+        loop.run_until_complete(asyncio.wait([task]))
+    finally:
+        loop.close()
+        AutoRunTrick.pools.close()
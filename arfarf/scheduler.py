@@ -0,0 +1,110 @@
+"""Define the scheduler limiting how many commands run at once.
+"""
+
+import os
+import threading
+import traceback
+
+from collections import OrderedDict
+
+
+class Scheduler(object):
+    """Run jobs of all handlers, at most max_jobs at once.
+
+    A job is a callable starting a command, it returns the process started,
+    or None if it didn't start any. A job raising an error is reported and
+    started none. Jobs start right away while fewer than
+    max_jobs processes run, and are queued otherwise. Once a process exits,
+    queued jobs start by priority, then in the order they were submitted.
+
+    Each handler has at most one queued job, a job submitted while another
+    one of the same handler is queued supersedes it.
+
+    Constructor Args:
+        supervisor: The Supervisor object telling when processes exit.
+        max_jobs: Max number of processes running at once, None for the
+            number of CPUs.
+
+    Attributes:
+        max_jobs: Readonly property, max number of processes running at once.
+        running: Readonly property, the number of processes running.
+        queued: Readonly property, the number of jobs waiting.
+    """
+
+    def __init__(self, supervisor, max_jobs=None):
+        self._supervisor = supervisor
+        self._max_jobs = max_jobs or os.cpu_count() or 1
+        self._lock = threading.RLock()
+        self._running = 0
+        # Map handlers to their queued (priority, job) tuples.
+        self._queue = OrderedDict()
+
+    @property
+    def max_jobs(self):
+        """Readonly property, max number of processes running at once."""
+        return self._max_jobs
+
+    @property
+    def running(self):
+        """Readonly property, the number of processes running."""
+        with self._lock:
+            return self._running
+
+    @property
+    def queued(self):
+        """Readonly property, the number of jobs waiting."""
+        with self._lock:
+            return len(self._queue)
+
+    def submit(self, owner, job, priority=0):
+        """Start job now if a slot is free, or queue it.
+
+        Args:
+            owner: The handler submitting job.
+            job: A callable taking no argument and returning a
+                subprocess.Popen object or None.
+            priority: An int, jobs with higher priority start first.
+        """
+        with self._lock:
+            if owner in self._queue:
+                # Superseded, it keeps its place.
+                self._queue[owner] = (priority, job)
+                return
+            if self._running >= self._max_jobs:
+                self._queue[owner] = (priority, job)
+                return
+            self._running += 1
+        self._start(job)
+
+    def cancel(self, owner):
+        """Drop the queued job of owner, if any."""
+        with self._lock:
+            self._queue.pop(owner, None)
+
+    def _start(self, job):
+        # The slot is taken already, job may submit again, so no lock here.
+        try:
+            process = job()
+        except Exception:
+            # Raising would kill the thread dispatching events, or the one
+            # telling processes exited.
+            traceback.print_exc()
+            process = None
+        if process is None:
+            self._release()
+        else:
+            self._supervisor.watch(process, self._exited)
+
+    def _exited(self, process):
+        self._release()
+
+    def _release(self):
+        with self._lock:
+            self._running -= 1
+            if not self._queue:
+                return
+            # max() keeps the first submitted among equal priorities.
+            owner = max(self._queue, key=lambda o: self._queue[o][0])
+            _, job = self._queue.pop(owner)
+            self._running += 1
+        self._start(job)
@@ -0,0 +1,98 @@
+"""Define helpers making arfarf start fast.
+
+The observer starts scanning as soon as handlers are scheduled, in the
+threads of its emitters, and the initial runs of the commands are started in
+parallel meanwhile, without waiting for them. StartupProfile times the phases
+of startup for the --startup-profile option.
+"""
+
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+# Max number of threads starting initial runs.
+MAX_STARTERS = 8
+
+
+class StartupProfile(object):
+    """Time the phases of startup.
+
+    Constructor Args:
+        clock: A callable returning the current time in seconds.
+
+    Attributes:
+        stream: The file report() writes to, None not to report.
+        phases: Readonly property, a list of (phase name, seconds) tuples, in
+            the order the phases ended.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.stream = None
+        self._clock = clock
+        self._start = clock()
+        self._phases = []
+
+    @property
+    def phases(self):
+        """Readonly property, a list of (phase name, seconds) tuples."""
+        return list(self._phases)
+
+    @contextmanager
+    def phase(self, name):
+        """Time the code run in the with statement as a phase."""
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self._phases.append((name, self._clock() - start))
+
+    def report(self):
+        """Write the time of each phase, and the total since the profile was
+        created, to stream.
+        """
+        if self.stream is None:
+            return
+        total = self._clock() - self._start
+        for name, seconds in self._phases + [('total', total)]:
+            print('{:<20}{:>10.1f} ms'.format(name, seconds * 1000),
+                  file=self.stream)
+        self.stream.flush()
+
+
+def start_handlers(handlers, max_workers=MAX_STARTERS):
+    """Start the initial runs of the handlers wanting one, in parallel.
+
+    Handlers in a DogGraph are started by their graph, in dependency order.
+
+    It returns without waiting for the runs to start, shut the executor
+    returned down to wait for them, before stopping the handlers.
+
+    Args:
+        handlers: An iterable of AutoRunTrick objects.
+        max_workers: Max number of threads starting runs at once.
+
+    Returns:
+        The ThreadPoolExecutor object starting the runs.
+    """
+    def done(future):
+        error = future.exception()
+        if error is not None:
+            traceback.print_exception(type(error), error,
+                                      error.__traceback__)
+
+    graphs = []
+    for handler in handlers:
+        if handler.graph is not None and handler.graph not in graphs:
+            graphs.append(handler.graph)
+    starts = [graph.start for graph in graphs] + \
+             [handler.start for handler in handlers
+              if handler.run_at_start and handler.graph is None]
+    executor = ThreadPoolExecutor(max(1, min(max_workers, len(starts))),
+                                  thread_name_prefix='arfarf-start')
+    for start in starts:
+        executor.submit(start).add_done_callback(done)
+    executor.shutdown(wait=False)
+    return executor
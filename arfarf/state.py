@@ -0,0 +1,241 @@
+"""Define the tree state saved between runs.
+
+Observers need a snapshot of each watched tree to tell what changed in it.
+The snapshots are saved to a state file periodically and when arfarf exits,
+and loaded when it starts again. A watch then starts from its saved snapshot:
+what changed while arfarf wasn't running is found by the first scan and
+reported as events, and polling emitters don't stat every file before their
+first poll.
+
+The state file is binary. It starts with MAGIC and the CRC-32 of the rest,
+then has a section per tree: a header, the root path, the stat records of the
+paths sorted by path, and the paths relative to the root, NUL separated, in
+the same order.
+"""
+
+import os
+import struct
+import threading
+import traceback
+import zlib
+
+from .polling import Entry
+
+
+MAGIC = b'ARFARF-STATE\x00\x01'
+
+# Seconds between two saves of the state file.
+SAVE_INTERVAL = 60
+
+# recursive, root path length, number of paths, paths length
+_HEADER = struct.Struct('<?III')
+# The Entry fields.
+_RECORD = struct.Struct('<QQ?Qqq')
+_CRC = struct.Struct('<I')
+
+
+def encode_trees(trees):
+    """Encode tree snapshots to the state file format.
+
+    Args:
+        trees: A dict mapping (root path, recursive) tuples to dicts mapping
+            the paths of the tree, root included, to their Entry objects.
+
+    Returns:
+        A bytes object.
+    """
+    chunks = []
+    for (root, recursive), entries in sorted(trees.items()):
+        prefix = os.path.join(root, '')
+        paths = sorted(entries)
+        names = b'\0'.join(os.fsencode(p[len(prefix):] if p != root else '')
+                           for p in paths)
+        broot = os.fsencode(root)
+        chunks.append(_HEADER.pack(recursive, len(broot), len(paths),
+                                   len(names)))
+        chunks.append(broot)
+        chunks.extend(_RECORD.pack(*entries[p]) for p in paths)
+        chunks.append(names)
+    data = b''.join(chunks)
+    return MAGIC + _CRC.pack(zlib.crc32(data)) + data
+
+
+def decode_trees(data):
+    """Decode the tree snapshots of a state file.
+
+    Args:
+        data: A bytes object returned by encode_trees().
+
+    Returns:
+        The dict encode_trees() was called with.
+
+    Raises:
+        ValueError: data is not in the state file format, or it's truncated.
+    """
+    if not data.startswith(MAGIC):
+        raise ValueError('not an arfarf state file')
+    offset = len(MAGIC)
+    try:
+        crc, = _CRC.unpack_from(data, offset)
+    except struct.error as e:
+        raise ValueError(str(e))
+    offset += _CRC.size
+    view = memoryview(data)[offset:]
+    if zlib.crc32(view) != crc:
+        raise ValueError('corrupted arfarf state file')
+    trees = {}
+    offset = 0
+    while offset < len(view):
+        try:
+            recursive, root_len, count, names_len = \
+                _HEADER.unpack_from(view, offset)
+        except struct.error as e:
+            raise ValueError(str(e))
+        offset += _HEADER.size
+        root = os.fsdecode(bytes(view[offset:offset + root_len]))
+        offset += root_len
+        records_len = count * _RECORD.size
+        records = _RECORD.iter_unpack(view[offset:offset + records_len])
+        offset += records_len
+        names = bytes(view[offset:offset + names_len]).split(b'\0') \
+                if count else []
+        offset += names_len
+        if len(names) != count:
+            raise ValueError('truncated arfarf state file')
+        trees[(root, recursive)] = {
+            os.path.join(root, os.fsdecode(name)) if name else root:
+                Entry(*record)
+            for name, record in zip(names, records)
+        }
+    return trees
+
+
+class TreeState(object):
+    """Snapshots of the watched trees, saved to a file between runs.
+
+    Emitters load the snapshot saved for their watch when they start, then
+    have their own snapshot saved from then on.
+
+    The state file is written in place, not replaced, so writing it doesn't
+    modify the directory it's in. Events for the state file are not meant
+    for handlers, see owns().
+
+    Constructor Args:
+        path: The state file path.
+        save_interval: Seconds between two saves while running.
+
+    Attributes:
+        path: Readonly property, the state file path.
+    """
+
+    def __init__(self, path, save_interval=SAVE_INTERVAL):
+        self._path = path
+        self._abspath = os.path.abspath(path)
+        self._name = os.path.basename(self._abspath)
+        self._save_interval = save_interval
+        self._lock = threading.Lock()
+        # (root, recursive) -> entries, None until the file is read
+        self._saved = None
+        # (root, recursive) -> (snapshot, lock, refresh)
+        self._trees = {}
+        # The CRC-32 of the data last written.
+        self._written = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def path(self):
+        """Readonly property, the state file path."""
+        return self._path
+
+    def load(self, root, recursive):
+        """Get the snapshot entries saved for a tree.
+
+        Args:
+            root: The root path of the watch.
+            recursive: A boolean, the recursive flag of the watch.
+
+        Returns:
+            A dict mapping paths to their Entry objects, None if nothing was
+            saved for the tree.
+        """
+        with self._lock:
+            if self._saved is None:
+                self._saved = self._read()
+            return self._saved.pop((root, recursive), None)
+
+    def _read(self):
+        try:
+            with open(self._path, 'rb') as f:
+                return decode_trees(f.read())
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            # Unreadable, torn by a crash, or from another version, the
+            # trees start cold then.
+            traceback.print_exc()
+            return {}
+
+    def track(self, root, recursive, snapshot, lock, refresh=False):
+        """Save a tree snapshot with the state from now on.
+
+        Args:
+            root: The root path of the watch.
+            recursive: A boolean, the recursive flag of the watch.
+            snapshot: A TreeSnapshot object.
+            lock: The lock to hold while reading or rescanning snapshot.
+            refresh: A boolean indicating if snapshot is rescanned before it's
+                saved, because nothing else keeps it up to date.
+        """
+        with self._lock:
+            self._trees[(root, recursive)] = (snapshot, lock, refresh)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                daemon=True)
+                self._thread.start()
+
+    def owns(self, path):
+        """Tell if path is the state file."""
+        return os.path.basename(path) == self._name and \
+            os.path.abspath(path) == self._abspath
+
+    def save(self, final=False):
+        """Write the tracked snapshots to the state file, if they changed.
+
+        Args:
+            final: A boolean indicating if the snapshots refreshed are fully
+                rescanned, files modified in place are missed otherwise.
+        """
+        with self._lock:
+            trees = dict(self._trees)
+        entries = {}
+        for key, (snapshot, lock, refresh) in trees.items():
+            with lock:
+                if refresh:
+                    try:
+                        snapshot.rescan(full=final)
+                    except OSError:
+                        # The root is gone.
+                        continue
+                entries[key] = snapshot.entries
+        data = encode_trees(entries)
+        crc = zlib.crc32(data)
+        if crc == self._written:
+            return
+        with open(self._path, 'wb') as f:
+            f.write(data)
+        self._written = crc
+
+    def close(self):
+        """Stop saving periodically and save the state a last time."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.save(final=True)
+
+    def _run(self):
+        while not self._stopped.wait(self._save_interval):
+            try:
+                self.save()
+            except OSError:
+                traceback.print_exc()
@@ -0,0 +1,278 @@
+"""Define the supervisor owning command processes.
+"""
+
+import os
+import re
+import selectors
+import shlex
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import traceback
+
+
+# ioprio_set() syscall numbers, Python has no binding for it.
+_IOPRIO_SET = {'x86_64': 251, 'aarch64': 30, 'i386': 289, 'i686': 289}
+_IOPRIO_WHO_PGRP = 2
+_IOPRIO_CLASS_SHIFT = 13
+
+# Characters only a shell gives a meaning to, quotes are handled by shlex.
+_SHELL_SYNTAX = re.compile(r'[|&;<>()$`*?[\]{}~#!\\\n]|^\s*\w+=')
+
+
+def parse_command(command):
+    """Get the arguments to start a command with.
+
+    An argv list or tuple is run directly. A string is split like a shell
+    does and run directly too, unless it uses shell syntax such as pipes,
+    redirections, variables or globs, or it starts with a shell builtin; it
+    is run by /bin/sh then. Running commands directly saves starting a shell
+    on each run, and signals reach the command instead of the shell.
+
+    Args:
+        command: A string, or a list or tuple of strings.
+
+    Returns:
+        A (args, shell) tuple, args is a tuple of strings where the program
+        is found on PATH already, or the command string if shell is True.
+    """
+    if isinstance(command, (list, tuple)):
+        args = tuple(command)
+    else:
+        if _SHELL_SYNTAX.search(command) is not None:
+            return command, True
+        try:
+            args = tuple(shlex.split(command))
+        except ValueError:
+            # Unbalanced quotes, let the shell report it.
+            return command, True
+    program = shutil.which(args[0]) if args else None
+    if program is None:
+        if isinstance(command, str):
+            # Builtins and functions aren't found on PATH.
+            return command, True
+        # Let it fail the way Popen does.
+        return args, False
+    return (program,) + args[1:], False
+
+
+def _killpg(process, sig):
+    """Send sig to the process group of process.
+
+    Returns:
+        A boolean, False if the process group is already gone.
+    """
+    try:
+        # Processes are session leaders, so their pgid is their pid.
+        os.killpg(process.pid, sig)
+    except OSError:
+        return False
+    return True
+
+
+def _set_ioprio(pgid, ionice):
+    """Set the I/O scheduling class of a process group where supported.
+
+    Args:
+        pgid: A process group id.
+        ionice: An I/O scheduling class, 1 realtime, 2 best-effort or
+            3 idle, as ionice(1) takes it, or a (class, level) tuple.
+    """
+    import ctypes
+    import platform
+
+    number = _IOPRIO_SET.get(platform.machine())
+    if number is None:
+        return
+    ioclass, level = ionice if isinstance(ionice, tuple) else (ionice, 4)
+    ioprio = ioclass << _IOPRIO_CLASS_SHIFT | level
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.syscall(number, _IOPRIO_WHO_PGRP, pgid, ioprio)
+
+
+def renice(pgid, nice=None, ionice=None):
+    """Lower the CPU and I/O priorities of a process group.
+
+    The whole group is set, in case its leader forked already.
+
+    Args:
+        pgid: A process group id.
+        nice: An int added to the niceness of the group, None to keep it.
+        ionice: The I/O scheduling class of the group, see _set_ioprio(),
+            None to keep it.
+    """
+    try:
+        if nice:
+            os.setpriority(os.PRIO_PGRP, pgid,
+                           os.getpriority(os.PRIO_PGRP, pgid) + nice)
+        if ionice is not None:
+            _set_ioprio(pgid, ionice)
+    except OSError:
+        # Group is already gone, or raising priority is not allowed.
+        pass
+
+
+def _pidfd_open(pid):
+    """Get a file descriptor readable once process pid exits, or None."""
+    try:
+        return os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        # Python < 3.9, Linux < 5.3 or not Linux at all.
+        return None
+
+
+class Supervisor(object):
+    """Start command processes and stop them without blocking the caller.
+
+    Stopping a process sends a signal to its process group and returns. A
+    reaper thread, started on the first stop or watch, waits for the
+    processes to exit, calls back those watching them, and sends SIGKILL to
+    those still running kill_after seconds after being stopped. It sleeps on
+    pidfds where the platform has them, and polls otherwise.
+
+    Attributes:
+        poll_interval: Seconds between checks of stopping processes when
+            pidfds are not available.
+        stopping: Readonly property, the number of processes being stopped.
+    """
+
+    poll_interval = 0.25
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        # Map stopping processes to the time to kill them at.
+        self._deadlines = {}
+        # Map watched processes to callables to call once they exit.
+        self._callbacks = {}
+        self._wakeup = None
+        self._thread = None
+
+    @property
+    def stopping(self):
+        """Readonly property, the number of processes being stopped."""
+        with self._cond:
+            return len(self._deadlines)
+
+    def spawn(self, args, nice=None, ionice=None, **kwargs):
+        """Start a process in a new session, so it can be stopped as a group.
+
+        Args:
+            args: The same as subprocess.Popen.
+            nice:
+            ionice: The same as renice().
+            kwargs: The same as subprocess.Popen.
+
+        Returns:
+            A subprocess.Popen object.
+        """
+        process = subprocess.Popen(args, start_new_session=True, **kwargs)
+        renice(process.pid, nice, ionice)
+        return process
+
+    def watch(self, process, callback):
+        """Call callback(process) in the reaper thread once process exits.
+
+        It's called right away if process has exited already.
+
+        Args:
+            process: A subprocess.Popen object returned by spawn().
+            callback: A callable taking process.
+        """
+        if process.poll() is not None:
+            callback(process)
+            return
+        with self._cond:
+            self._callbacks.setdefault(process, []).append(callback)
+            self._start_reaper()
+        os.write(self._wakeup[1], b'\0')
+
+    def terminate(self, process, stop_signal=signal.SIGINT, kill_after=10):
+        """Stop a process group, returning immediately.
+
+        Args:
+            process: A subprocess.Popen object returned by spawn().
+            stop_signal: The signal to send first.
+            kill_after: Seconds to wait before sending SIGKILL.
+        """
+        if process.poll() is not None:
+            return
+        if not _killpg(process, stop_signal):
+            return
+        with self._cond:
+            self._deadlines[process] = time.monotonic() + kill_after
+            self._start_reaper()
+        os.write(self._wakeup[1], b'\0')
+
+    def _start_reaper(self):
+        if self._thread is None:
+            self._wakeup = os.pipe()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout=None):
+        """Wait for every stopping process to exit.
+
+        Args:
+            timeout: Max seconds to wait, None to wait until they exit.
+
+        Returns:
+            A boolean, False if processes are still running after timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._deadlines, timeout)
+
+    def _reap(self, selector, pidfds):
+        """Forget exited processes, kill overdue ones.
+
+        Returns:
+            Seconds until the next deadline, None if there's none.
+        """
+        now = time.monotonic()
+        timeout = None
+        exited = []
+        with self._cond:
+            processes = set(self._deadlines).union(self._callbacks)
+            for process in processes:
+                deadline = self._deadlines.get(process, float('inf'))
+                if process.poll() is not None:
+                    self._deadlines.pop(process, None)
+                    exited.append((process, self._callbacks.pop(process, [])))
+                    fd = pidfds.pop(process, None)
+                    if fd is not None:
+                        selector.unregister(fd)
+                        os.close(fd)
+                    continue
+                if process not in pidfds:
+                    pidfds[process] = fd = _pidfd_open(process.pid)
+                    if fd is not None:
+                        selector.register(fd, selectors.EVENT_READ)
+                if deadline <= now:
+                    _killpg(process, signal.SIGKILL)
+                    # Wait for it to exit without killing it again.
+                    self._deadlines[process] = deadline = float('inf')
+                if pidfds[process] is None:
+                    deadline = min(deadline, now + type(self).poll_interval)
+                if timeout is None or deadline - now < timeout:
+                    timeout = max(deadline - now, 0)
+            if not self._deadlines:
+                self._cond.notify_all()
+        # Call back without the lock, callbacks may stop other processes.
+        for process, callbacks in exited:
+            for callback in callbacks:
+                try:
+                    callback(process)
+                except Exception:
+                    traceback.print_exc()
+        return None if timeout == float('inf') else timeout
+
+    def _run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._wakeup[0], selectors.EVENT_READ)
+        pidfds = {}
+        while True:
+            timeout = self._reap(selector, pidfds)
+            for key, _ in selector.select(timeout):
+                if key.fd == self._wakeup[0]:
+                    os.read(key.fd, 512)
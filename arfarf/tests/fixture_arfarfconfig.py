@@ -5,6 +5,9 @@ use_gitignore_default = False
 
 gitignore_path = '.gitignore'
 
+observer = 'auto'
+runtime = 'threads'
+
 dogs = (
     dog(),
 )
@@ -19,7 +19,9 @@ class ArfTestCase(unittest.TestCase):
         result = self.parser.parse_args([])
         self.assertEqual(
             result,
-            Namespace(config=None, gitignore=None, template=False)
+            Namespace(config=None, gitignore=None, template=False,
+                      observer=None, runtime=None, startup_profile=False,
+                      profile=None, profile_dir='.')
         )
 
     def test__create_main_argparser_with_config_option(self):
@@ -28,7 +30,9 @@ class ArfTestCase(unittest.TestCase):
         self.assertEqual(lresult, sresult)
         self.assertEqual(
             lresult,
-            Namespace(config='dogs.py', gitignore=None, template=False)
+            Namespace(config='dogs.py', gitignore=None, template=False,
+                      observer=None, runtime=None, startup_profile=False,
+                      profile=None, profile_dir='.')
         )
 
     def test__create_main_argparser_with_gitignore_option(self):
@@ -37,7 +41,9 @@ class ArfTestCase(unittest.TestCase):
         self.assertEqual(lresult, sresult)
         self.assertEqual(
             lresult,
-            Namespace(config=None, gitignore='.gitignore', template=False)
+            Namespace(config=None, gitignore='.gitignore', template=False,
+                      observer=None, runtime=None, startup_profile=False,
+                      profile=None, profile_dir='.')
         )
 
     def test__create_main_argparser_with_template_option(self):
@@ -46,9 +52,54 @@ class ArfTestCase(unittest.TestCase):
         self.assertEqual(lresult, sresult)
         self.assertEqual(
             lresult,
-            Namespace(config=None, gitignore=None, template=True)
+            Namespace(config=None, gitignore=None, template=True,
+                      observer=None, runtime=None, startup_profile=False,
+                      profile=None, profile_dir='.')
         )
 
+    def test__create_main_argparser_with_observer_option(self):
+        lresult = self.parser.parse_args(['--observer', 'polling'])
+        sresult = self.parser.parse_args(['-o', 'polling'])
+        self.assertEqual(lresult, sresult)
+        self.assertEqual(
+            lresult,
+            Namespace(config=None, gitignore=None, template=False,
+                      observer='polling', runtime=None, startup_profile=False,
+                      profile=None, profile_dir='.')
+        )
+
+    def test__create_main_argparser_with_unknown_observer(self):
+        def error(self, *args, **kwargs):
+            raise SystemExit
+
+        with patch.object(argparse.ArgumentParser, 'error', new=error):
+            with self.assertRaises(SystemExit):
+                self.parser.parse_args(['--observer', 'unknown'])
+
+    def test__create_main_argparser_with_runtime_option(self):
+        lresult = self.parser.parse_args(['--runtime', 'asyncio'])
+        sresult = self.parser.parse_args(['-r', 'asyncio'])
+        self.assertEqual(lresult, sresult)
+        self.assertEqual(
+            lresult,
+            Namespace(config=None, gitignore=None, template=False,
+                      observer=None, runtime='asyncio', startup_profile=False,
+                      profile=None, profile_dir='.')
+        )
+
+    def test__create_main_argparser_with_startup_profile_option(self):
+        result = self.parser.parse_args(['--startup-profile'])
+        self.assertTrue(result.startup_profile)
+
+    def test__create_main_argparser_with_profile_option(self):
+        lresult = self.parser.parse_args(['--profile', 'sampling',
+                                          '--profile-dir', '/tmp'])
+        sresult = self.parser.parse_args(['-p', 'sampling',
+                                          '--profile-dir', '/tmp'])
+        self.assertEqual(lresult, sresult)
+        self.assertEqual((lresult.profile, lresult.profile_dir),
+                         ('sampling', '/tmp'))
+
     def test__create_main_argparser_with_unknown_option(self):
         def error(self, *args, **kwargs):
             raise SystemExit
@@ -94,6 +145,28 @@ class ArfTestCase(unittest.TestCase):
             _apply_main_args(args)
             me.assert_called_once_with("File not found: './nonexist_gitignore'")
 
+    def test__apply_main_args_with_observer_option(self):
+        from ..arf import _apply_main_args
+
+        arglist = ['-c', 'arfarf/tests/fixture_arfarfconfig.py',
+                   '--observer', 'inotify']
+        args = self.parser.parse_args(arglist)
+        configm = _apply_main_args(args)
+        self.assertEqual(configm.observer, 'inotify')
+        # reset the shared module so other tests see the fixture value
+        configm.observer = 'auto'
+
+    def test__apply_main_args_with_runtime_option(self):
+        from ..arf import _apply_main_args
+
+        arglist = ['-c', 'arfarf/tests/fixture_arfarfconfig.py',
+                   '--runtime', 'asyncio']
+        args = self.parser.parse_args(arglist)
+        configm = _apply_main_args(args)
+        self.assertEqual(configm.runtime, 'asyncio')
+        # reset the shared module so other tests see the fixture value
+        configm.runtime = 'threads'
+
     def test__apply_main_args_with_template_option(self):
         from ..arf import _apply_main_args
         from tempfile import TemporaryDirectory
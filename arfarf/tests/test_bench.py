@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from ..bench.__main__ import main
+from ..bench.suite import BENCHMARKS, run
+from ..bench.trees import branch_switch, editor_save, gitignore_patterns
+from ..bench.trees import tree_paths
+
+
+class TreesTestCase(unittest.TestCase):
+
+    def test_tree_paths(self):
+        paths = tree_paths(10, depth=2, fanout=2)
+        self.assertEqual(len(set(paths)), 10)
+        self.assertEqual(paths[0], os.path.join('d0', 'd0', 'f0.py'))
+        self.assertEqual(paths[5], os.path.join('d1', 'd0', 'f5.py'))
+        self.assertEqual({os.path.dirname(p) for p in paths},
+                         {os.path.join(a, b) for a in ('d0', 'd1')
+                          for b in ('d0', 'd1')})
+
+    def test_gitignore_patterns(self):
+        self.assertEqual(gitignore_patterns(2), ['*.o', '__pycache__/'])
+        self.assertEqual(len(set(gitignore_patterns(50))), 50)
+
+    def test_bursts(self):
+        paths = ['/tree/f%d.py' % i for i in range(100)]
+        events = branch_switch(paths, 20)
+        self.assertEqual(len(events), 20)
+        self.assertEqual([e.event_type for e in events[:3]],
+                         ['deleted', 'created', 'modified'])
+        events = editor_save('/tree/f0.py')
+        self.assertEqual(events[-1].src_path, '/tree/f0.py~')
+
+
+class RunTestCase(unittest.TestCase):
+
+    params = dict(files=40, depth=2, fanout=2, gitignore=10, dogs=2,
+                  burst=10, saves=2, trials=1, observer='polling',
+                  interval=0.05, repeat=1)
+
+    def test_run(self):
+        results = run(**self.params)
+        self.assertEqual(set(results), {'meta', 'params', 'results'})
+        self.assertEqual(set(results['results']),
+                         set(BENCHMARKS) | {'make_tree'})
+        self.assertEqual(results['results']['scan']['entries'], 47)
+        latency = results['results']['latency']
+        self.assertEqual(latency['editor_save']['trials'], 1)
+        json.dumps(results)
+
+    def test_unknown_benchmark(self):
+        with self.assertRaises(ValueError):
+            run(['unknown'], **self.params)
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'results.json')
+            main(['scan', '--files', '10', '--output', output])
+            with open(output) as f:
+                results = json.load(f)
+        self.assertEqual(set(results['results']), {'make_tree', 'scan'})
+        with patch('sys.stderr'):
+            with self.assertRaises(SystemExit):
+                main(['unknown'])
@@ -0,0 +1,97 @@
+import os
+import subprocess
+import unittest
+
+from watchdog.events import DirMovedEvent, FileCreatedEvent
+from watchdog.events import FileDeletedEvent, FileModifiedEvent
+
+from ..changes import ChangeSet, Delivery, encode_changes, event_changes
+
+
+class EventChangesTestCase(unittest.TestCase):
+
+    def test_event_changes(self):
+        self.assertEqual(event_changes(FileCreatedEvent('path/a.py')),
+                         [('created', 'path/a.py')])
+        self.assertEqual(event_changes(DirMovedEvent('path/a', 'path/b')),
+                         [('moved_from', 'path/a/'), ('moved_to', 'path/b/')])
+
+
+class ChangeSetTestCase(unittest.TestCase):
+
+    def test_add_keeps_latest_change(self):
+        changes = ChangeSet()
+        changes.add(FileCreatedEvent('a'))
+        changes.add(FileCreatedEvent('b'))
+        changes.add(FileModifiedEvent('a'))
+        self.assertEqual(len(changes), 2)
+        self.assertEqual(changes.changes, [('created', 'b'), ('modified', 'a')])
+
+    def test_take(self):
+        changes = ChangeSet()
+        changes.add(FileCreatedEvent('a'))
+        self.assertEqual(changes.take(), [('created', 'a')])
+        self.assertEqual(changes.take(), [])
+
+    def test_restore_keeps_newer_changes(self):
+        changes = ChangeSet()
+        changes.add(FileCreatedEvent('a'))
+        changes.add(FileCreatedEvent('b'))
+        taken = changes.take()
+        changes.add(FileDeletedEvent('b'))
+        changes.add(FileCreatedEvent('c'))
+        changes.restore(taken)
+        self.assertEqual(changes.changes,
+                         [('created', 'a'), ('deleted', 'b'), ('created', 'c')])
+
+
+class DeliveryTestCase(unittest.TestCase):
+
+    changes = [('created', 'a.py'), ('moved_to', 'dir name/')]
+
+    def run_command(self, delivery, command):
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,
+                                   **delivery.popen_kwargs)
+        delivery.feed(process)
+        outs = process.stdout.read()
+        process.wait()
+        delivery.close(process)
+        return outs
+
+    def test_encode_changes(self):
+        self.assertEqual(encode_changes(self.changes, b'\0'),
+                         b'created\ta.py\0moved_to\tdir name/\0')
+
+    def test_env(self):
+        delivery = Delivery('env', self.changes)
+        self.assertIsNone(delivery.data)
+        outs = self.run_command(delivery, 'printf %s "$ARFARF_CHANGES"')
+        self.assertEqual(outs, b'created\ta.py\nmoved_to\tdir name/')
+
+    def test_env_too_long(self):
+        changes = [('created', 'dir/file%d.py' % i) for i in range(5000)]
+        delivery = Delivery('env', changes)
+        env = delivery.popen_kwargs['env']
+        self.assertNotIn('ARFARF_CHANGES', env)
+        path = env['ARFARF_CHANGES_FILE']
+        outs = self.run_command(
+            delivery, 'test -z "${ARFARF_CHANGES+set}" && '
+                      'cat "$ARFARF_CHANGES_FILE"')
+        self.assertEqual(outs, encode_changes(changes, b'\0'))
+        self.assertFalse(os.path.exists(path))
+
+    def test_stdin(self):
+        delivery = Delivery('stdin', self.changes)
+        outs = self.run_command(delivery, 'cat')
+        self.assertEqual(outs, b'created\ta.py\0moved_to\tdir name/\0')
+
+    def test_file(self):
+        delivery = Delivery('file', self.changes)
+        path = delivery.popen_kwargs['env']['ARFARF_CHANGES_FILE']
+        outs = self.run_command(delivery, 'cat "$ARFARF_CHANGES_FILE"')
+        self.assertEqual(outs, b'created\ta.py\0moved_to\tdir name/\0')
+        self.assertFalse(os.path.exists(path))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            Delivery('unknown', self.changes)
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from ..content import ContentCache, ContentTracker, LRUCache, hash_file
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_get_put(self):
+        cache = LRUCache(2)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+
+    def test_least_recently_used_dropped(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+
+class ContentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'file')
+        self.write(b'hello')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+
+    def test_hash_file(self):
+        digest = hash_file(self.path)
+        self.assertEqual(digest, hash_file(self.path))
+        self.write(b'world')
+        self.assertNotEqual(digest, hash_file(self.path))
+
+    def test_digest_cached_by_version(self):
+        cache = ContentCache()
+        with patch('arfarf.content.hash_file',
+                   side_effect=hash_file) as m:
+            digest = cache.digest(self.path)
+            self.assertEqual(cache.digest(self.path), digest)
+            self.assertEqual(m.call_count, 1)
+            st = os.stat(self.path)
+            os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+            self.assertEqual(cache.digest(self.path), digest)
+            self.assertEqual(m.call_count, 2)
+
+    def test_digest_not_regular_file(self):
+        cache = ContentCache()
+        self.assertIsNone(cache.digest(self.dir))
+        self.assertIsNone(cache.digest(os.path.join(self.dir, 'missing')))
+
+    def test_tracker_changed(self):
+        tracker = ContentTracker(ContentCache())
+        # Seen for the first time.
+        self.assertTrue(tracker.changed(self.path))
+        self.assertFalse(tracker.changed(self.path))
+        # Rewritten with the same content.
+        self.write(b'hello')
+        self.assertFalse(tracker.changed(self.path))
+        self.write(b'world')
+        self.assertTrue(tracker.changed(self.path))
+        os.remove(self.path)
+        self.assertTrue(tracker.changed(self.path))
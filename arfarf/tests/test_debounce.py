@@ -0,0 +1,77 @@
+import threading
+import time
+import unittest
+
+from ..debounce import Debouncer
+
+
+class DebouncerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.bursts = []
+        self.called = threading.Event()
+
+    def callback(self, items):
+        self.bursts.append(items)
+        self.called.set()
+
+    def test_burst_collapsed_after_quiet_period(self):
+        debouncer = Debouncer(self.callback, 0.1)
+        for i in range(5):
+            debouncer.push(i)
+        self.assertEqual(debouncer.pending, 5)
+        self.assertTrue(self.called.wait(2))
+        self.assertEqual(self.bursts, [[0, 1, 2, 3, 4]])
+        self.assertEqual(debouncer.pending, 0)
+
+    def test_extend(self):
+        debouncer = Debouncer(self.callback, 0.1)
+        debouncer.extend([0, 1])
+        debouncer.push(2)
+        self.assertTrue(self.called.wait(2))
+        self.assertEqual(self.bursts, [[0, 1, 2]])
+
+    def test_quiet_period_restarts_on_push(self):
+        debouncer = Debouncer(self.callback, 0.2)
+        debouncer.push(0)
+        time.sleep(0.1)
+        debouncer.push(1)
+        time.sleep(0.15)
+        self.assertEqual(self.bursts, [])
+        self.assertTrue(self.called.wait(2))
+        self.assertEqual(self.bursts, [[0, 1]])
+
+    def test_max_delay(self):
+        debouncer = Debouncer(self.callback, 0.2, max_delay=0.3)
+        start = time.monotonic()
+        while not self.called.is_set() and time.monotonic() - start < 2:
+            debouncer.push(None)
+            time.sleep(0.05)
+        self.assertTrue(self.called.is_set())
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_cancel(self):
+        debouncer = Debouncer(self.callback, 0.1)
+        debouncer.push(0)
+        debouncer.push(1)
+        self.assertEqual(debouncer.cancel(), [0, 1])
+        self.assertFalse(self.called.wait(0.3))
+        debouncer.push(2)
+        self.assertTrue(self.called.wait(2))
+        self.assertEqual(self.bursts, [[2]])
+
+    def test_callback_error_keeps_thread(self):
+        def callback(items):
+            self.callback(items)
+            raise RuntimeError('dummy')
+
+        from unittest.mock import patch
+        debouncer = Debouncer(callback, 0.05)
+        with patch('traceback.print_exc') as m:
+            debouncer.push(0)
+            self.assertTrue(self.called.wait(2))
+            self.called.clear()
+            debouncer.push(1)
+            self.assertTrue(self.called.wait(2))
+        self.assertEqual(self.bursts, [[0], [1]])
+        self.assertTrue(m.called)
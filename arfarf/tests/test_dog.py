@@ -50,16 +50,41 @@ class DogTestCase(unittest.TestCase):
         path: os.curdir, '.'
         recursive: True, catches all events
         use_gitignore: False, not all people use git, I do ,though
+        debounce: None, run the command on every event
+        max_delay: None, no limit
+        priority: 0
+        nice: None, keep niceness
+        ionice: None, keep I/O scheduling class
+        changes: None, don't tell commands what changed
+        worker: None, restart commands on changes
+        restart_patterns: None
+        pool: 'thread', call callable commands in threads
+        verify_content: False, run commands whether content changed or not
+        run_at_start: True, run commands when arfarf starts
+        name: None, unnamed
+        after: None, no dependencies
         """
         try:
             d = Dog()
         except:
             self.fail('Dog should be able to call without args.')
         # log = 'echo ${event_object} ${event_src_path} is ${event_type}${if_moved}'
-        expected = (None, None, None, False, '.', True, False)
+        expected = (None, None, None, False, '.', True, False, None, None, 0,
+                    None, None, None, None, None, 'thread', False, True, None,
+                    ())
         self.assertEqual(d.key, expected)
 
 
+    def test_use_gitignore_property(self):
+        self.assertTrue(Dog(use_gitignore=True).use_gitignore)
+        self.assertFalse(Dog(use_gitignore=False).use_gitignore)
+        with patch.object(Dog, 'use_gitignore_default', True):
+            self.assertTrue(Dog(use_gitignore=None).use_gitignore)
+
+    def test_pool_property(self):
+        self.assertEqual(Dog(print, pool='process').pool, 'process')
+        self.assertIsNone(Dog('make', pool='process').pool)
+
     def test_watch_info_property(self):
         dog = Dog(command='echo hello')
         winfo = dog.watch_info
@@ -80,7 +105,11 @@ class DogTestCase(unittest.TestCase):
         monitored_path = 'monitored/path'
         dog = Dog(command='echo hello', patterns=['*.py'],
                   ignore_patterns=['more_ipattern'], use_gitignore=True,
-                  path=monitored_path, recursive=True, ignore_directories=True)
+                  path=monitored_path, recursive=True, ignore_directories=True,
+                  debounce=0.5, max_delay=2, priority=1, nice=10, ionice=3,
+                  worker='stdin', restart_patterns=['setup.py'],
+                  pool='process', verify_content=True,
+                  run_at_start=False, name='test', after=['build'])
         MockClass = MagicMock()
         _ = dog.create_handler(MockClass)
         ignores = [os.path.join(monitored_path, p) for p in self.patterns] + \
@@ -89,5 +118,34 @@ class DogTestCase(unittest.TestCase):
             command='echo hello',
             patterns=['monitored/path/*.py'],
             ignore_patterns=ignores,
-            ignore_directories=True
+            ignore_directories=True,
+            debounce=0.5,
+            max_delay=2,
+            priority=1,
+            nice=10,
+            ionice=3,
+            changes=None,
+            worker='stdin',
+            restart_patterns=['monitored/path/setup.py'],
+            pool='process',
+            verify_content=True,
+            run_at_start=False,
+            name='test',
+            after=['build'],
+            scope=None,
+            rebase=None
         )
+
+    def test_create_handler_for_covering_watch(self):
+        dog = Dog(command='make', patterns=['*.c'], path='./src/',
+                  recursive=False)
+        MockClass = MagicMock()
+        dog.create_handler(MockClass, ('.', True))
+        kwargs = MockClass.call_args[1]
+        self.assertEqual(kwargs['patterns'], ['./src/*.c'])
+        self.assertEqual(kwargs['scope'], ('./src', False))
+        self.assertEqual(kwargs['rebase'], ('./src', './src/'))
+        self.assertEqual(dog.rebase(('src', False)), ('src', None))
+        self.assertEqual(dog.rebase((os.getcwd(), True)),
+                         (os.path.join(os.getcwd(), 'src'),
+                          (os.path.join(os.getcwd(), 'src'), False)))
@@ -0,0 +1,128 @@
+import unittest
+
+from unittest.mock import ANY, MagicMock, patch
+
+from ..graph import DogGraph, DONE, FAILED, RUNNING, SKIPPED, WAITING
+
+
+def handler(name=None, after=(), run_at_start=True):
+    # name is a MagicMock constructor argument, set it afterwards.
+    mock = MagicMock(after=tuple(after), worker=None,
+                     run_at_start=run_at_start, graph=None)
+    mock.name = name
+    return mock
+
+
+class DogGraphTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # codegen -> build -> (test, lint)
+        self.codegen = handler('codegen')
+        self.build = handler('build', ['codegen'])
+        self.test = handler('test', ['build'])
+        self.lint = handler(after=['build'])
+        self.other = handler('other')
+        self.graph = DogGraph([self.test, self.lint, self.build,
+                               self.codegen, self.other])
+
+    def finish(self, handler, succeeded=True):
+        """Let the run started last for handler be done."""
+        events, done = handler.run_step.call_args[0]
+        done(succeeded)
+
+    def test_handlers_in_dependency_order(self):
+        self.assertEqual(self.graph.handlers,
+                         (self.codegen, self.build, self.test, self.lint))
+        for h in self.graph.handlers:
+            self.assertIs(h.graph, self.graph)
+        self.assertIsNone(self.other.graph)
+
+    def test_dependents_run_after(self):
+        self.graph.trigger(self.codegen, ['event'])
+        self.codegen.run_step.assert_called_once_with(['event'], ANY)
+        self.assertFalse(self.build.run_step.called)
+        self.assertEqual(self.graph.state(self.build), WAITING)
+        self.finish(self.codegen)
+        self.build.run_step.assert_called_once_with([], ANY)
+        self.assertFalse(self.test.run_step.called)
+        self.finish(self.build)
+        # Independent branches run at once.
+        self.assertTrue(self.test.run_step.called)
+        self.assertTrue(self.lint.run_step.called)
+        self.assertEqual(self.graph.state(self.test), RUNNING)
+        self.finish(self.test)
+        self.assertEqual(self.graph.state(self.test), DONE)
+
+    def test_failure_skips_dependents(self):
+        self.graph.trigger(self.codegen, [])
+        with patch('sys.stderr'):
+            self.finish(self.codegen, succeeded=False)
+        self.assertEqual(self.graph.state(self.codegen), FAILED)
+        for h in (self.build, self.test, self.lint):
+            self.assertFalse(h.run_step.called)
+            self.assertEqual(self.graph.state(h), SKIPPED)
+        # They wait for the failed command to succeed.
+        with patch('sys.stderr'):
+            self.graph.trigger(self.test, [])
+        self.assertFalse(self.test.run_step.called)
+        self.graph.trigger(self.codegen, [])
+        self.finish(self.codegen)
+        self.assertTrue(self.build.run_step.called)
+
+    def test_only_descendants_run(self):
+        self.graph.trigger(self.build, ['event'])
+        self.assertFalse(self.codegen.run_step.called)
+        self.build.run_step.assert_called_once_with(['event'], ANY)
+        self.finish(self.build)
+        self.graph.trigger(self.test, [])
+        self.finish(self.test)
+        self.assertEqual(self.test.run_step.call_count, 2)
+        self.assertEqual(self.build.run_step.call_count, 1)
+
+    def test_due_while_running(self):
+        self.graph.trigger(self.build, [])
+        self.graph.trigger(self.build, ['event'])
+        self.build.stop_step.assert_called_once_with()
+        self.assertEqual(self.build.run_step.call_count, 1)
+        # Stopped, it's run again whatever its exit status.
+        self.finish(self.build, succeeded=False)
+        self.assertEqual(self.build.run_step.call_count, 2)
+        self.assertEqual(self.build.run_step.call_args[0][0], ['event'])
+        self.assertFalse(self.test.run_step.called)
+
+    def test_start(self):
+        self.build = handler('build', ['codegen'], run_at_start=False)
+        graph = DogGraph([self.codegen, self.build, self.test])
+        graph.start()
+        self.assertTrue(self.codegen.run_step.called)
+        self.finish(self.codegen)
+        self.assertFalse(self.build.run_step.called)
+        # build never ran, test doesn't wait for it.
+        self.assertTrue(self.test.run_step.called)
+
+    def test_stop(self):
+        self.graph.trigger(self.codegen, [])
+        self.graph.stop()
+        self.finish(self.codegen)
+        self.assertFalse(self.build.run_step.called)
+        self.graph.trigger(self.test, [])
+        self.assertFalse(self.test.run_step.called)
+
+    def test_unknown_name(self):
+        with self.assertRaises(ValueError):
+            DogGraph([handler('a', ['b'])])
+
+    def test_duplicate_name(self):
+        with self.assertRaises(ValueError):
+            DogGraph([handler('a'), handler('a'), handler('b', ['a'])])
+
+    def test_circular_dependencies(self):
+        with self.assertRaises(ValueError):
+            DogGraph([handler('a', ['c']), handler('b', ['a']),
+                      handler('c', ['b'])])
+
+    def test_worker(self):
+        worker = handler('worker')
+        worker.worker = 'stdin'
+        with self.assertRaises(ValueError):
+            DogGraph([worker, handler('a', ['worker'])])
@@ -0,0 +1,121 @@
+import http.client
+import os
+import socket
+import tempfile
+import unittest
+
+from ..metrics import Counter, Histogram, Metrics, MetricsExporter
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def test_counter(self):
+        counter = Counter('hits_total', 'Hits.')
+        counter.inc(dog='a')
+        counter.inc(2, dog='a')
+        counter.inc(dog='b "quoted"')
+        self.assertEqual(counter.value(dog='a'), 3)
+        self.assertEqual(counter.value(dog='c'), 0)
+        self.assertEqual(counter.samples(), [
+            ('hits_total', (('dog', 'a'),), 3),
+            ('hits_total', (('dog', 'b "quoted"'),), 1),
+        ])
+
+    def test_histogram(self):
+        histogram = Histogram('wait_seconds', 'Waits.', buckets=(0.1, 1))
+        histogram.observe(0.05, watch='/w')
+        histogram.observe(0.5, watch='/w')
+        histogram.observe(5, watch='/w')
+        self.assertEqual(histogram.count(watch='/w'), 3)
+        self.assertEqual(histogram.samples(), [
+            ('wait_seconds_bucket', (('watch', '/w'), ('le', '0.1')), 1),
+            ('wait_seconds_bucket', (('watch', '/w'), ('le', '1')), 2),
+            ('wait_seconds_bucket', (('watch', '/w'), ('le', '+Inf')), 3),
+            ('wait_seconds_sum', (('watch', '/w'),), 5.55),
+            ('wait_seconds_count', (('watch', '/w'),), 3),
+        ])
+        with histogram.time(watch='/v'):
+            pass
+        self.assertEqual(histogram.count(watch='/v'), 1)
+
+    def test_render(self):
+        metrics = Metrics()
+        metrics.events_received.inc(dog='say "hi"\n')
+        metrics.command_exits.inc(dog='build', status=1)
+        text = metrics.render()
+        self.assertIn('# TYPE arfarf_events_received_total counter\n', text)
+        self.assertIn('arfarf_events_received_total{dog="say \\"hi\\"\\n"} '
+                      '1\n', text)
+        self.assertIn('arfarf_command_exits_total{dog="build",status="1"} '
+                      '1\n', text)
+        self.assertIn('# TYPE arfarf_scan_duration_seconds histogram\n',
+                      text)
+
+
+class MetricsExporterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+        self.metrics.events_matched.inc(dog='build')
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_write(self):
+        path = os.path.join(self.tmp.name, 'metrics.prom')
+        exporter = MetricsExporter(self.metrics, metrics_file=path,
+                                   metrics_interval=60)
+        exporter.start()
+        self.assertTrue(os.path.exists(path))
+        exporter.close()
+        with open(path) as f:
+            self.assertEqual(f.read(), self.metrics.render())
+        self.assertEqual(os.listdir(self.tmp.name), ['metrics.prom'])
+
+    def test_owns(self):
+        path = os.path.join(self.tmp.name, 'metrics.prom')
+        exporter = MetricsExporter(self.metrics, metrics_file=path)
+        self.assertTrue(exporter.owns(path))
+        self.assertFalse(exporter.owns(os.path.join(self.tmp.name, 'a.prom')))
+        self.assertFalse(MetricsExporter(self.metrics).owns(path))
+
+    def test_serve_port(self):
+        exporter = MetricsExporter(self.metrics, metrics_port=0)
+        exporter.start()
+        try:
+            connection = http.client.HTTPConnection(*exporter.address,
+                                                    timeout=5)
+            connection.request('GET', '/metrics')
+            response = connection.getresponse()
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.read().decode(),
+                             self.metrics.render())
+            connection.request('GET', '/other')
+            response = connection.getresponse()
+            response.read()
+            self.assertEqual(response.status, 404)
+            connection.close()
+        finally:
+            exporter.close()
+
+    def test_serve_socket(self):
+        path = os.path.join(self.tmp.name, 'metrics.sock')
+        exporter = MetricsExporter(self.metrics, metrics_socket=path)
+        exporter.start()
+        try:
+            with socket.socket(socket.AF_UNIX) as sock:
+                sock.settimeout(5)
+                sock.connect(path)
+                sock.sendall(b'GET /metrics HTTP/1.0\r\n\r\n')
+                response = b''
+                while True:
+                    data = sock.recv(65536)
+                    if not data:
+                        break
+                    response += data
+        finally:
+            exporter.close()
+        self.assertTrue(response.startswith(b'HTTP/1.0 200'))
+        self.assertTrue(response.endswith(self.metrics.render().encode()))
+        self.assertFalse(os.path.exists(path))
@@ -0,0 +1,96 @@
+import errno
+import unittest
+
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from watchdog.observers.api import EventQueue, ObservedWatch
+
+from ..observers import FallbackEmitter, FallbackObserver, create_observer
+from ..polling import SnapshotEmitter, SnapshotObserver
+
+
+class FallbackEmitterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.td = TemporaryDirectory()
+        self.watch = ObservedWatch(self.td.name, True)
+        self.emitter = FallbackEmitter(EventQueue(), self.watch)
+
+    def tearDown(self):
+        self.emitter.on_thread_stop()
+        self.td.cleanup()
+
+    def _native_failing_with(self, err):
+        native = MagicMock()
+        native.return_value.on_thread_start.side_effect = OSError(err, '')
+        return patch.object(FallbackEmitter, 'native_emitter_class', native)
+
+    def test_use_native_emitter_when_available(self):
+        native = MagicMock()
+        with patch.object(FallbackEmitter, 'native_emitter_class', native):
+            self.emitter.on_thread_start()
+        self.assertIs(self.emitter.emitter, native.return_value)
+        native.assert_called_once_with(event_queue=self.emitter._batch,
+                                       watch=self.watch,
+                                       timeout=self.emitter.timeout)
+
+    def test_native_events_queued_in_transaction(self):
+        from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+        from ..transaction import BEGIN, END
+
+        native = MagicMock()
+        events = [FileCreatedEvent('a'), FileModifiedEvent('a')]
+        with patch.object(FallbackEmitter, 'native_emitter_class', native):
+            self.emitter.on_thread_start()
+        batch = self.emitter._batch
+        native.return_value.queue_events.side_effect = \
+            lambda timeout: batch.extend((e, self.watch) for e in events)
+        self.emitter.queue_events(0)
+        queue = self.emitter._event_queue
+        items = [queue.get()[0] for _ in range(queue.qsize())]
+        self.assertEqual(items, [BEGIN] + events + [END])
+        self.assertEqual(batch, [])
+
+    def test_fall_back_when_inotify_watches_exhausted(self):
+        for err in (errno.ENOSPC, errno.EMFILE):
+            with self._native_failing_with(err):
+                self.emitter.on_thread_start()
+            self.assertIsInstance(self.emitter.emitter, SnapshotEmitter)
+
+    def test_fall_back_when_platform_has_no_native_emitter(self):
+        with patch.object(FallbackEmitter, 'native_emitter_class', None):
+            self.emitter.on_thread_start()
+        self.assertIsInstance(self.emitter.emitter, SnapshotEmitter)
+
+    def test_other_errors_are_raised(self):
+        with self._native_failing_with(errno.EACCES):
+            with self.assertRaises(OSError):
+                self.emitter.on_thread_start()
+
+    def test_queue_events_delegated(self):
+        native = MagicMock()
+        with patch.object(FallbackEmitter, 'native_emitter_class', native):
+            self.emitter.on_thread_start()
+        self.emitter.queue_events(0.5)
+        native.return_value.queue_events.assert_called_once_with(0.5)
+        self.emitter.stop()
+        native.return_value.stop.assert_called_once_with()
+
+
+class CreateObserverTestCase(unittest.TestCase):
+
+    def test_create_observer(self):
+        self.assertIsInstance(create_observer(), FallbackObserver)
+        self.assertIsInstance(create_observer('auto'), FallbackObserver)
+        self.assertIsInstance(create_observer('polling'), SnapshotObserver)
+
+    def test_create_observer_with_unsupported_inotify(self):
+        with patch('arfarf.observers.InotifyObserver', None):
+            with self.assertRaises(ValueError):
+                create_observer('inotify')
+
+    def test_create_observer_with_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_observer('unknown')
@@ -0,0 +1,103 @@
+import io
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+
+from unittest.mock import patch
+
+from ..output import OutputMux
+
+
+class SlowStream(io.BytesIO):
+    """A terminal blocked until released."""
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+
+    def writelines(self, lines):
+        self.released.wait(2)
+        super().writelines(lines)
+
+
+class OutputMuxTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = io.BytesIO()
+        self.mux = OutputMux(self.stream)
+
+    def tearDown(self):
+        self.mux.close()
+
+    def spawn(self, label, script, mux=None):
+        run = (mux or self.mux).open(label)
+        try:
+            process = subprocess.Popen(['sh', '-c', script],
+                                       **run.popen_kwargs)
+        finally:
+            run.spawned()
+        process.wait()
+        run.exited(process)
+        return run
+
+    def wait_lines(self, run, count):
+        for _ in range(40):
+            if len(run.lines) >= count:
+                return
+            time.sleep(0.05)
+        self.fail('%r has %d lines' % (run, len(run.lines)))
+
+    def test_lines_prefixed(self):
+        run = self.spawn('build', 'echo a; echo b >&2; printf c')
+        self.wait_lines(run, 3)
+        self.mux.close()
+        self.assertEqual(sorted(run.lines), [b'a\n', b'b\n', b'c\n'])
+        self.assertEqual(run.returncode, 0)
+        self.assertEqual(sorted(self.stream.getvalue().splitlines()),
+                         [b'[build] a', b'[build] b', b'[build] c'])
+
+    def test_ring_buffers(self):
+        mux = OutputMux(self.stream, output_lines=2, output_runs=2)
+        self.addCleanup(mux.close)
+        runs = [self.spawn('test', 'seq 3', mux) for _ in range(3)]
+        for run in runs:
+            self.wait_lines(run, 2)
+        self.assertEqual(mux.history('test'), runs[1:])
+        self.assertEqual(runs[2].lines, [b'2\n', b'3\n'])
+        self.assertEqual(mux.history('other'), [])
+
+    def test_dump(self):
+        run = self.spawn('test', 'echo a; exit 3')
+        self.wait_lines(run, 1)
+        dump = io.BytesIO()
+        self.mux.dump(dump)
+        header, line = dump.getvalue().splitlines()
+        self.assertTrue(header.startswith(b'--- test at '))
+        self.assertTrue(header.endswith(b', exited 3'))
+        self.assertEqual(line, b'a')
+
+    def test_log_files(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            mux = OutputMux(self.stream, log_dir=log_dir)
+            run = self.spawn('make -j4', 'echo a; echo b', mux)
+            self.wait_lines(run, 2)
+            mux.close()
+            with open(os.path.join(log_dir, 'make_-j4.log'), 'rb') as f:
+                self.assertEqual(f.read(), b'a\nb\n')
+
+    def test_slow_terminal_drops_lines(self):
+        stream = SlowStream()
+        mux = OutputMux(stream)
+        self.addCleanup(mux.close)
+        with patch.object(OutputMux, 'terminal_buffer', 64):
+            run = self.spawn('test', 'seq 1000', mux)
+            # The command didn't wait for the terminal.
+            self.assertEqual(run.returncode, 0)
+            self.wait_lines(run, 1000)
+        self.assertGreater(mux.dropped, 0)
+        stream.released.set()
+        mux.close()
+        self.assertIn(b'lines dropped', stream.getvalue())
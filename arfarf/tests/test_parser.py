@@ -1,3 +1,4 @@
+import os
 import unittest
 
 from unittest.mock import MagicMock, patch, sentinel, mock_open
@@ -52,19 +53,10 @@ class AAConfigParserTestCase(unittest.TestCase):
         self.parser.gitignore_path = '.gitignore'
         observer = Observer()
         result = self.parser.schedule_with(observer, self.HandlerClass)
-        # expected
-        handlers = []
-        for dog in self.dogs:
-            handler = dog.create_handler(self.HandlerClass)
-            handlers.append(handler)
-        watches = []
-        for dog in self.dogs:
-            watch = ObservedWatch(*dog.watch_info)
-            watches.append(watch)
+        # expected, '..' covers the other paths
         handler_for_watch = {
-            watches[0]: set([handlers[0], handlers[1]]),
-            watches[2]: set([handlers[2]]),
-            watches[3]: set([handlers[3]]),
+            ObservedWatch('..', True): set([sentinel.a, sentinel.b,
+                                            sentinel.c, sentinel.d]),
         }
 
         self.maxDiff = None
@@ -72,6 +64,74 @@ class AAConfigParserTestCase(unittest.TestCase):
         self.assertEqual(result, handler_for_watch)
         patcher.stop()
 
+    def test_schedule_with_one_router_per_watch(self):
+        from ..router import EventRouter
+
+        observer = MagicMock()
+        with patch.object(Dog, 'parse_gitignore', return_value=[]):
+            self.parser.schedule_with(observer, self.HandlerClass)
+        routers = [c[0][0] for c in observer.schedule.call_args_list]
+        infos = [c[0][1:] for c in observer.schedule.call_args_list]
+        self.assertEqual(infos, [('..', True)])
+        self.assertTrue(all(isinstance(r, EventRouter) for r in routers))
+        self.assertEqual(routers[0].handlers, (sentinel.a, sentinel.b,
+                                               sentinel.c, sentinel.d))
+        self.HandlerClass.assert_called_with(
+            command='echo dog4', patterns=None, ignore_patterns=None,
+            ignore_directories=False, debounce=None, max_delay=None,
+            priority=0, nice=None, ionice=None, changes=None, worker=None,
+            restart_patterns=None, pool='thread', verify_content=False,
+            run_at_start=True, name=None, after=None,
+            scope=(os.path.join('..', os.path.basename(os.getcwd())), False),
+            rebase=(os.path.join('..', os.path.basename(os.getcwd())), '.'))
+
+    def test_cover_watches(self):
+        from ..parser import cover_watches
+
+        cover = cover_watches([('src', True), ('.', False), ('src/a', True),
+                               ('lib', False), ('lib', False), ('./', True),
+                               ('lib/b', False), ('/', False)])
+        self.assertEqual(list(cover.items()), [
+            (('src', True), ('./', True)),
+            (('.', False), ('./', True)),
+            (('src/a', True), ('./', True)),
+            (('lib', False), ('./', True)),
+            (('./', True), ('./', True)),
+            (('lib/b', False), ('./', True)),
+            (('/', False), ('/', False)),
+        ])
+        cover = cover_watches([('src', False), ('./src/', False),
+                               ('src/a', True)])
+        self.assertEqual(list(cover.values()), [('src', False),
+                                                ('src', False),
+                                                ('src/a', True)])
+
+    def test_schedule_with_dependencies(self):
+        from ..tricks import AutoRunTrick
+
+        self.wdmm.dogs = (
+            Dog(command='make test', name='test', after=['build']),
+            Dog(command='make', name='build', path='..'),
+            Dog(command='echo hello'),
+        )
+        parser = AAConfigParser(self.wdmm)
+        with patch.object(Dog, 'parse_gitignore', return_value=[]):
+            result = parser.schedule_with(Observer(), AutoRunTrick)
+        handlers = set.union(*result.values())
+        graphs = {handler.name: handler.graph for handler in handlers}
+        self.assertIsNotNone(graphs['test'])
+        self.assertIs(graphs['test'], graphs['build'])
+        self.assertIsNone(graphs[None])
+
+    def test_schedule_with_unknown_dependency(self):
+        from ..tricks import AutoRunTrick
+
+        self.wdmm.dogs = (Dog(command='make test', after=['build']),)
+        parser = AAConfigParser(self.wdmm)
+        with patch.object(Dog, 'parse_gitignore', return_value=[]):
+            with self.assertRaises(ValueError):
+                parser.schedule_with(MagicMock(), AutoRunTrick)
+
     def test__parse_gitignore_called_at_most_once_in_create_handler(self):
         with patch.object(Dog, 'parse_gitignore') as mg:
             observer = Observer()
@@ -79,6 +139,41 @@ class AAConfigParserTestCase(unittest.TestCase):
             self.assertIs(Dog.parse_gitignore, mg)
         mg.assert_called_once_with()
 
+    def test_load_gitignore(self):
+        with patch.object(Dog, 'parse_gitignore', return_value=['*.pyc']) \
+                as mg:
+            self.parser.load_gitignore()
+            self.assertEqual(Dog.gitignore, ['*.pyc'])
+            self.parser.schedule_with(Observer(), self.HandlerClass)
+        mg.assert_called_once_with()
+
+    def test_load_gitignore_not_used(self):
+        self.wdmm.dogs = (Dog(use_gitignore=False),)
+        parser = AAConfigParser(self.wdmm)
+        with patch.object(Dog, 'parse_gitignore') as mg:
+            parser.load_gitignore()
+        self.assertFalse(mg.called)
+        self.assertIsNone(Dog.gitignore)
+
+    def test_uses_process_pool(self):
+        self.assertFalse(self.parser.uses_process_pool)
+        self.wdmm.dogs = (Dog(), Dog(print, pool='process'))
+        self.assertTrue(AAConfigParser(self.wdmm).uses_process_pool)
+
+    def test_metrics_options(self):
+        config = MagicMock(spec=['dogs', 'use_gitignore_default',
+                                 'gitignore_path', 'metrics_port',
+                                 'metrics_file', 'metrics_interval'])
+        config.metrics_port = 9100
+        config.metrics_file = None
+        config.metrics_interval = 5
+        parser = AAConfigParser(config)
+        self.assertTrue(parser.export_metrics)
+        self.assertEqual(parser.metrics_options,
+                         {'metrics_port': 9100, 'metrics_interval': 5})
+        config.metrics_port = None
+        self.assertFalse(AAConfigParser(config).export_metrics)
+
     def test_construct_using_config_module(self):
         import config_module
 
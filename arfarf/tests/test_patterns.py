@@ -0,0 +1,74 @@
+import itertools
+import unittest
+
+from pathtools.patterns import match_any_paths, match_path_against
+
+from ..patterns import GlobSet, PatternMatcher, compile_patterns
+
+
+PATTERNS = [
+    'relative/path/*.py', 'relative/path/src/', 'relative/path/*.rst',
+    'relative/path/__pycache__/', 'relative/path/*.py[cod]',
+    'relative/path/build', 'relative/path/doc?/', 'relative/path/[',
+    'relative/path/\\#hash', 'relative/path/trailing\\ ', 'relative/path/*',
+    'relative/path/*/*.txt', 'relative/path/*.PY', '*.log', '*',
+]
+
+PATHS = [
+    'relative/path/dummy.py', 'relative/path/sub/dummy.py',
+    'relative/path/DUMMY.PY', 'relative/path/src/', 'relative/path/src',
+    'relative/path/index.rst', 'relative/path/__pycache__/',
+    'relative/path/x.pyc', 'relative/path/build', 'relative/path/docs/',
+    'relative/path/[', 'relative/path/\\#hash', 'relative/path/trailing\\ ',
+    'relative/path/a/b.txt', 'relative/path/', 'other/path/debug.log',
+    'relative', '',
+]
+
+
+class GlobSetTestCase(unittest.TestCase):
+
+    def test_match_same_as_pathtools(self):
+        for n in (0, 1, 2, len(PATTERNS)):
+            for patterns in itertools.combinations(PATTERNS, n):
+                for case_sensitive in (True, False):
+                    globset = GlobSet(patterns, case_sensitive)
+                    for path in PATHS:
+                        expected = match_path_against(path, patterns,
+                                                      case_sensitive)
+                        self.assertEqual(globset.match(path), expected,
+                                         (path, patterns, case_sensitive))
+
+    def test_compile_patterns_shares_globsets(self):
+        globset = compile_patterns(['b/*.py', 'a/*.py'])
+        self.assertIs(globset, compile_patterns(['a/*.py', 'b/*.py']))
+        self.assertIsNot(globset, compile_patterns(['a/*.py', 'b/*.py'],
+                                                   case_sensitive=False))
+
+
+class PatternMatcherTestCase(unittest.TestCase):
+
+    def test_match_any_same_as_pathtools(self):
+        included_choices = (None, [], ['relative/path/*.py'],
+                            ['relative/path/*', '*.log'])
+        excluded_choices = (None, [], ['relative/path/__pycache__/'],
+                            ['relative/path/*.py[cod]', '*.rst'])
+        for included, excluded, case_sensitive in itertools.product(
+                included_choices, excluded_choices, (True, False)):
+            matcher = PatternMatcher(included, excluded, case_sensitive)
+            for paths in itertools.combinations(PATHS, 2):
+                expected = match_any_paths(paths, included, excluded,
+                                           case_sensitive)
+                self.assertEqual(matcher.match_any(paths), expected,
+                                 (paths, included, excluded))
+
+    def test_conflicting_patterns(self):
+        with self.assertRaises(ValueError):
+            PatternMatcher(['*.py'], ['*.py'])
+        with self.assertRaises(ValueError):
+            PatternMatcher(['*.py'], ['*.PY'], case_sensitive=False)
+        PatternMatcher(['*.py'], ['*.PY'], case_sensitive=True)
+
+    def test_excludes(self):
+        matcher = PatternMatcher(None, ['path/build/'])
+        self.assertTrue(matcher.excludes('path/build/'))
+        self.assertFalse(matcher.excludes('path/build/file'))
@@ -0,0 +1,537 @@
+import os
+import time
+import unittest
+
+from tempfile import TemporaryDirectory
+from unittest.mock import ANY, MagicMock, patch
+
+from watchdog.observers.api import EventQueue, ObservedWatch
+
+from ..polling import PruningObserver, SnapshotEmitter, TreeSnapshot
+from ..transaction import BEGIN, END
+from ..tricks import AutoRunTrick
+
+
+class TreeSnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.td = TemporaryDirectory()
+        self.root = self.td.name
+        self._mkdir('src')
+        self._mkdir('src/pkg')
+        self._write('README')
+        self._write('src/main.py')
+        self._write('src/pkg/mod.py')
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def _path(self, path):
+        return os.path.join(self.root, path)
+
+    def _mkdir(self, path):
+        os.mkdir(self._path(path))
+
+    def _write(self, path, data=''):
+        with open(self._path(path), 'w') as f:
+            f.write(data)
+
+    def _touch(self, path, ns):
+        """Set path mtime, st_mtime_ns may be too coarse to tell writes."""
+        os.utime(self._path(path), ns=(ns, ns))
+
+    def test_initial_snapshot(self):
+        snapshot = TreeSnapshot(self.root)
+        expected = {self.root} | {self._path(p) for p in (
+            'src', 'src/pkg', 'README', 'src/main.py', 'src/pkg/mod.py')}
+        self.assertEqual(snapshot.paths, expected)
+        self.assertTrue(snapshot.entry(self._path('src')).isdir)
+        self.assertFalse(snapshot.entry(self._path('README')).isdir)
+
+    def test_non_recursive_snapshot(self):
+        snapshot = TreeSnapshot(self.root, recursive=False)
+        expected = {self.root, self._path('src'), self._path('README')}
+        self.assertEqual(snapshot.paths, expected)
+
+    def test_rescan_without_changes(self):
+        snapshot = TreeSnapshot(self.root)
+        diff = snapshot.rescan(full=True)
+        self.assertFalse(any(diff))
+
+    def test_rescan_created_and_deleted(self):
+        snapshot = TreeSnapshot(self.root)
+        self._write('src/new.py')
+        self._mkdir('src/pkg/sub')
+        os.remove(self._path('README'))
+        diff = snapshot.rescan()
+        self.assertEqual(diff.files_created, [self._path('src/new.py')])
+        self.assertEqual(diff.dirs_created, [self._path('src/pkg/sub')])
+        self.assertEqual(diff.files_deleted, [self._path('README')])
+        self.assertIn(self._path('src'), diff.dirs_modified)
+
+    def test_rescan_moved(self):
+        snapshot = TreeSnapshot(self.root)
+        os.rename(self._path('src/pkg'), self._path('pkg'))
+        diff = snapshot.rescan()
+        self.assertEqual(diff.dirs_moved,
+                         [(self._path('src/pkg'), self._path('pkg'))])
+        self.assertEqual(diff.files_moved, [(self._path('src/pkg/mod.py'),
+                                             self._path('pkg/mod.py'))])
+        self.assertEqual(diff.dirs_deleted, [])
+        self.assertEqual(diff.dirs_created, [])
+
+    def test_rescan_skips_directories_not_changed(self):
+        snapshot = TreeSnapshot(self.root)
+        with patch.object(snapshot, '_scan_dir') as m:
+            diff = snapshot.rescan()
+        self.assertFalse(m.called)
+        self.assertFalse(any(diff))
+
+    def test_modified_in_place_found_by_full_scan(self):
+        snapshot = TreeSnapshot(self.root)
+        self._write('src/pkg/mod.py', 'changed')
+        self._touch('src/pkg/mod.py', 10 ** 9)
+        # The directory didn't change, only a full scan sees the file.
+        self.assertEqual(snapshot.rescan().files_modified, [])
+        diff = snapshot.rescan(full=True)
+        self.assertEqual(diff.files_modified, [self._path('src/pkg/mod.py')])
+
+    def test_modified_in_place_found_in_hot_directory(self):
+        snapshot = TreeSnapshot(self.root)
+        self._write('src/pkg/other.py')
+        snapshot.rescan()
+        self._write('src/pkg/mod.py', 'changed')
+        self._touch('src/pkg/mod.py', 10 ** 9)
+        diff = snapshot.rescan()
+        self.assertEqual(diff.files_modified, [self._path('src/pkg/mod.py')])
+
+    def test_hot_directory_cools_down(self):
+        snapshot = TreeSnapshot(self.root, hot_period=0)
+        self._write('src/pkg/other.py')
+        snapshot.rescan()
+        self._write('src/pkg/mod.py', 'changed')
+        self._touch('src/pkg/mod.py', 10 ** 9)
+        self.assertEqual(snapshot.rescan().files_modified, [])
+
+    def test_pruned_directories_not_scanned(self):
+        pruned = self._path('src/pkg')
+        snapshot = TreeSnapshot(self.root, prune=lambda p: p == pruned)
+        self.assertIn(pruned, snapshot.paths)
+        self.assertNotIn(self._path('src/pkg/mod.py'), snapshot.paths)
+        self._write('src/pkg/new.py')
+        diff = snapshot.rescan(full=True)
+        self.assertEqual(diff.files_created, [])
+
+    def test_restore(self):
+        saved = TreeSnapshot(self.root).entries
+        snapshot = TreeSnapshot(self.root, entries=saved)
+        self.assertTrue(snapshot.restored)
+        self.assertEqual(snapshot.entries, saved)
+        with patch.object(snapshot, '_scan_dir') as m:
+            diff = snapshot.rescan()
+        self.assertFalse(m.called)
+        self.assertFalse(any(diff))
+
+    def test_restore_finds_changes_since_saved(self):
+        saved = TreeSnapshot(self.root).entries
+        self._write('src/new.py')
+        os.remove(self._path('src/pkg/mod.py'))
+        snapshot = TreeSnapshot(self.root, entries=saved)
+        diff = snapshot.rescan()
+        self.assertEqual(diff.files_created, [self._path('src/new.py')])
+        self.assertEqual(diff.files_deleted, [self._path('src/pkg/mod.py')])
+
+    def test_restore_drops_pruned_entries(self):
+        saved = TreeSnapshot(self.root).entries
+        pruned = self._path('src/pkg')
+        snapshot = TreeSnapshot(self.root, prune=lambda p: p == pruned,
+                                entries=saved)
+        self.assertIn(pruned, snapshot.paths)
+        self.assertNotIn(self._path('src/pkg/mod.py'), snapshot.paths)
+
+    def test_not_restored_without_root(self):
+        snapshot = TreeSnapshot(self.root, entries={})
+        self.assertFalse(snapshot.restored)
+        self.assertIn(self._path('README'), snapshot.paths)
+
+    def test_rescan_raises_when_root_deleted(self):
+        snapshot = TreeSnapshot(self._path('src'))
+        os.rename(self._path('src'), self._path('gone'))
+        with self.assertRaises(OSError):
+            snapshot.rescan()
+
+    def test_symlinked_directories_not_scanned(self):
+        os.symlink(self._path('src'), self._path('link'))
+        snapshot = TreeSnapshot(self.root)
+        self.assertTrue(snapshot.entry(self._path('link')).isdir)
+        self.assertNotIn(self._path('link/main.py'), snapshot.paths)
+
+    @patch('arfarf.polling.SCAN_SHARD_SIZE', 1)
+    def test_parallel_scan(self):
+        for i in range(4):
+            self._mkdir('dir%d' % i)
+            self._mkdir('dir%d/sub' % i)
+            self._write('dir%d/sub/file' % i)
+        serial = TreeSnapshot(self.root)
+        parallel = TreeSnapshot(self.root, scan_workers=4)
+        self.addCleanup(parallel.close)
+        self.assertEqual(parallel.entries, serial.entries)
+        pool = parallel._pool
+
+        self._write('dir0/sub/new')
+        os.remove(self._path('dir1/sub/file'))
+        os.rename(self._path('dir2'), self._path('moved'))
+        self._mkdir('dir3/sub/new')
+        self._write('dir3/sub/new/file')
+        self._write('src/pkg/mod.py', 'changed')
+        self._touch('src/pkg/mod.py', 10 ** 9)
+        expected = serial.rescan(full=True)
+        diff = parallel.rescan(full=True)
+        self.assertEqual({k: sorted(v) for k, v in diff._asdict().items()},
+                         {k: sorted(v) for k, v in expected._asdict().items()})
+        self.assertEqual(diff.files_modified, [self._path('src/pkg/mod.py')])
+        self.assertEqual(parallel.entries, serial.entries)
+        # The same threads scan every time.
+        self.assertIs(parallel._pool, pool)
+        parallel.close()
+        self.assertIsNone(parallel._pool)
+        self._write('after')
+        self.assertEqual(parallel.rescan().files_created,
+                         [self._path('after')])
+
+    def test_scan_workers_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            TreeSnapshot(self.root, scan_workers=0)
+
+
+class SnapshotEmitterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.td = TemporaryDirectory()
+        self.queue = EventQueue()
+        watch = ObservedWatch(self.td.name, True)
+        self.emitter = SnapshotEmitter(self.queue, watch)
+        self.emitter.on_thread_start()
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def _events(self):
+        events = []
+        while not self.queue.empty():
+            event, _ = self.queue.get()
+            if event in (BEGIN, END):
+                events.append(event)
+            else:
+                events.append((event.event_type, event.src_path))
+        return events
+
+    def test_queue_events(self):
+        path = os.path.join(self.td.name, 'file')
+        with open(path, 'w'):
+            pass
+        self.emitter.queue_events(0)
+        self.assertEqual(self._events(), [BEGIN, ('created', path),
+                                          ('modified', self.td.name), END])
+
+    def test_queue_nothing_without_changes(self):
+        self.emitter.queue_events(0)
+        self.assertEqual(self._events(), [])
+
+    def test_start_from_saved_state(self):
+        state = MagicMock()
+        state.load.return_value = self.emitter._snapshot.entries
+        path = os.path.join(self.td.name, 'file')
+        with open(path, 'w'):
+            pass
+        emitter = SnapshotEmitter(self.queue, self.emitter.watch,
+                                  state=state)
+        emitter.on_thread_start()
+        state.load.assert_called_once_with(self.td.name, True)
+        state.track.assert_called_once_with(
+            self.td.name, True, emitter._snapshot, emitter._lock)
+        self.assertEqual(self._events(), [BEGIN, ('created', path),
+                                          ('modified', self.td.name), END])
+
+    def test_interval_adapts_to_activity(self):
+        emitter = SnapshotEmitter(self.queue, self.emitter.watch,
+                                  poll_interval_min=0.5, poll_interval_max=3)
+        emitter.on_thread_start()
+        waits = []
+        with patch.object(emitter.stopped_event, 'wait',
+                          side_effect=lambda t: waits.append(t)):
+            for _ in range(4):
+                emitter.queue_events(1)
+            with open(os.path.join(self.td.name, 'file'), 'w'):
+                pass
+            emitter.queue_events(1)
+            emitter.queue_events(1)
+        self.assertEqual(waits, [0.5, 1, 2, 3, 3, 0.5])
+        self.assertEqual(emitter.interval, 1)
+        # Without bounds, the interval is timeout.
+        with patch.object(self.emitter.stopped_event, 'wait',
+                          return_value=False) as wait:
+            self.emitter.queue_events(0.25)
+        wait.assert_called_once_with(0.25)
+
+    def test_full_scans_keep_to_wall_clock(self):
+        emitter = SnapshotEmitter(self.queue, self.emitter.watch,
+                                  full_scan_interval=8,
+                                  poll_interval_min=0.5, poll_interval_max=8)
+        emitter.on_thread_start()
+        fulls = []
+        rescan = emitter._snapshot.rescan
+        clock = [time.monotonic()]
+
+        def wait(timeout):
+            clock[0] += timeout
+            return False
+
+        with patch.object(emitter.stopped_event, 'wait', side_effect=wait), \
+                patch('time.monotonic', side_effect=lambda: clock[0]), \
+                patch.object(emitter._snapshot, 'rescan',
+                             side_effect=lambda full: fulls.append(full) or
+                             rescan(full)):
+            for _ in range(9):
+                emitter.queue_events(1)
+        # Polls at 0.5, 1.5, 3.5 and 7.5 seconds, then every 8 seconds, each
+        # a full scan however long the polls wait.
+        self.assertEqual(fulls, [False] * 4 + [True] * 5)
+        self.assertEqual(emitter.interval, 8)
+
+    def test_scan_threads_stopped_with_emitter(self):
+        emitter = SnapshotEmitter(self.queue, self.emitter.watch,
+                                  scan_workers=2)
+        emitter.on_thread_start()
+        with patch.object(emitter._snapshot, 'close',
+                          wraps=emitter._snapshot.close) as close:
+            emitter.stop()
+        close.assert_called_once_with()
+
+    def test_initial_snapshot_taken_in_thread(self):
+        import threading
+
+        release = threading.Event()
+        emitter = SnapshotEmitter(self.queue, self.emitter.watch)
+        with patch('arfarf.polling.TreeSnapshot',
+                   side_effect=lambda *a, **kw: release.wait(5) and
+                   TreeSnapshot(*a, **kw)):
+            emitter.start()
+            try:
+                self.assertFalse(emitter.wait_started(0.05))
+                release.set()
+                self.assertTrue(emitter.wait_started(5))
+            finally:
+                release.set()
+                emitter.stop()
+                emitter.join(5)
+        self.assertFalse(emitter.is_alive())
+
+    def test_initial_snapshot_error_raised_by_wait_started(self):
+        emitter = SnapshotEmitter(self.queue, self.emitter.watch)
+        with patch('arfarf.polling.TreeSnapshot', side_effect=OSError):
+            emitter.start()
+            with self.assertRaises(OSError):
+                emitter.wait_started(5)
+        emitter.join(5)
+        self.assertFalse(emitter.is_alive())
+
+    def test_stopped_while_starting(self):
+        import threading
+
+        release = threading.Event()
+        emitter = SnapshotEmitter(self.queue, self.emitter.watch,
+                                  scan_workers=2)
+        with patch('arfarf.polling.TreeSnapshot',
+                   side_effect=lambda *a, **kw: release.wait(5) and
+                   TreeSnapshot(*a, **kw)):
+            emitter.start()
+            stopper = threading.Thread(target=emitter.stop)
+            stopper.start()
+            release.set()
+            stopper.join(5)
+            emitter.join(5)
+        # Stopped once set up, the scan threads didn't outlive it.
+        self.assertFalse(emitter.is_alive())
+        self.assertIsNone(emitter._snapshot._pool)
+
+    def test_interval_bounds_per_watch(self):
+        from ..polling import check_poll_intervals, poll_bounds
+
+        intervals = {os.path.join(self.td.name, ''): (2, 60)}
+        emitter = SnapshotEmitter(self.queue, self.emitter.watch,
+                                  poll_interval_max=5,
+                                  poll_intervals=intervals)
+        self.assertEqual(emitter.interval, 2)
+        self.assertEqual(poll_bounds('/other', 1, None, 5, intervals),
+                         (1, 5))
+        self.assertIsNone(poll_bounds('/other', 1))
+        check_poll_intervals(1, poll_interval_max=5, poll_intervals=intervals,
+                             full_scan_interval=10)
+        for kwargs in ({'poll_interval_max': 0.5},
+                       {'poll_intervals': {'.': (0, 1)}},
+                       {'poll_backoff': 0.5},
+                       {'scan_workers': 0}):
+            with self.assertRaises(ValueError):
+                check_poll_intervals(1, **kwargs)
+
+    def test_scan_duration_recorded(self):
+        from ..metrics import Metrics
+
+        metrics = Metrics()
+        emitter = SnapshotEmitter(self.queue, self.emitter.watch,
+                                  full_scan_interval=0, metrics=metrics)
+        emitter.on_thread_start()
+        emitter.queue_events(0)
+        for kind in ('initial', 'full'):
+            self.assertEqual(metrics.scan_duration.count(watch=self.td.name,
+                                                         kind=kind), 1)
+
+    def test_queue_events_when_root_deleted(self):
+        self.td.cleanup()
+        self.emitter.queue_events(0)
+        self.assertEqual(self._events(), [BEGIN, ('deleted', self.td.name),
+                                          END])
+        self.assertFalse(self.emitter.should_keep_running())
+
+
+class PruningObserverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.td = TemporaryDirectory()
+        self.observer = PruningObserver(emitter_class=MagicMock())
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_ignores_tree(self):
+        build = os.path.join(self.td.name, 'build')
+        handler1 = AutoRunTrick(ignore_patterns=[os.path.join(build, '')])
+        handler2 = AutoRunTrick(ignore_patterns=['*/build/', '*.pyc'])
+        watch = self.observer.schedule(handler1, self.td.name, True)
+        self.observer.schedule(handler2, self.td.name, True)
+        self.assertTrue(self.observer.ignores_tree(watch, build))
+        self.assertFalse(self.observer.ignores_tree(watch, self.td.name))
+
+    def test_events_for_state_file_dropped(self):
+        from watchdog.events import FileModifiedEvent
+
+        from ..state import TreeState
+
+        state = TreeState(os.path.join(self.td.name, 'state'))
+        observer = PruningObserver(emitter_class=MagicMock(), state=state)
+        handler = MagicMock(spec=['dispatch'])
+        watch = observer.schedule(handler, self.td.name, True)
+        observer.event_queue.put((FileModifiedEvent(state.path), watch))
+        path = os.path.join(self.td.name, 'file')
+        observer.event_queue.put((FileModifiedEvent(path), watch))
+        observer.dispatch_events(observer.event_queue, 0)
+        observer.dispatch_events(observer.event_queue, 0)
+        self.assertEqual(handler.dispatch.call_count, 1)
+        self.assertEqual(handler.dispatch.call_args[0][0].src_path, path)
+
+    def test_events_for_owned_files_dropped(self):
+        from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+        from ..metrics import Metrics, MetricsExporter
+
+        path = os.path.join(self.td.name, 'metrics.prom')
+        exporter = MetricsExporter(Metrics(), metrics_file=path)
+        observer = PruningObserver(emitter_class=MagicMock(),
+                                   owners=[exporter])
+        handler = MagicMock(spec=['dispatch'])
+        watch = observer.schedule(handler, self.td.name, True)
+        other = os.path.join(self.td.name, 'file')
+        for event in (FileCreatedEvent(path), FileModifiedEvent(path),
+                      FileCreatedEvent(other)):
+            observer.event_queue.put((event, watch))
+            observer.dispatch_events(observer.event_queue, 0)
+        self.assertEqual([c[0][0].src_path
+                          for c in handler.dispatch.call_args_list], [other])
+
+    def test_metrics_file_in_tree_runs_nothing(self):
+        from ..metrics import Metrics, MetricsExporter
+        from ..polling import SnapshotObserver
+
+        path = os.path.join(self.td.name, 'metrics.prom')
+        exporter = MetricsExporter(Metrics(), metrics_file=path,
+                                   metrics_interval=0.05)
+        observer = SnapshotObserver(timeout=0.05, full_scan_interval=0,
+                                    owners=[exporter])
+        handler = MagicMock(spec=['dispatch_transaction'])
+        observer.schedule(handler, self.td.name, True)
+        exporter.start()
+        observer.start()
+        try:
+            time.sleep(0.5)
+        finally:
+            observer.stop()
+            observer.join()
+            exporter.close()
+        self.assertFalse(handler.dispatch_transaction.called)
+
+    def test_transactions_dispatched(self):
+        from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+        handler = MagicMock(spec=['dispatch_transaction'])
+        plain = MagicMock(spec=['dispatch'])
+        watch = self.observer.schedule(handler, self.td.name, True)
+        self.observer.schedule(plain, self.td.name, True)
+        events = [FileCreatedEvent('a'), FileModifiedEvent('a'),
+                  FileModifiedEvent('b')]
+        queue = self.observer.event_queue
+        for item in [BEGIN] + events[:2] + [END, BEGIN] + events[2:] + [END]:
+            queue.put((item, watch))
+        while not queue.empty():
+            self.observer.dispatch_events(queue, 0)
+        handler.dispatch_transaction.assert_called_once_with(ANY)
+        transaction = handler.dispatch_transaction.call_args[0][0]
+        # The queue was not drained when the first one ended, merged.
+        self.assertEqual(transaction.events, events)
+        self.assertEqual(transaction.ticks, 2)
+        self.assertEqual([c[0][0] for c in plain.dispatch.call_args_list],
+                         events)
+
+    def test_queue_delay_recorded(self):
+        from watchdog.events import FileCreatedEvent
+
+        from ..metrics import Metrics
+
+        metrics = Metrics()
+        observer = PruningObserver(emitter_class=MagicMock(),
+                                   metrics=metrics)
+        watch = observer.schedule(MagicMock(spec=['dispatch']), self.td.name,
+                                  True)
+        queue = observer.event_queue
+        for item in (BEGIN, FileCreatedEvent('a'), END):
+            queue.put((item, watch))
+        while not queue.empty():
+            observer.dispatch_events(queue, 0)
+        self.assertEqual(metrics.queue_delay.count(watch=self.td.name), 1)
+
+    def test_transaction_waits_to_settle(self):
+        from watchdog.events import FileCreatedEvent
+
+        observer = PruningObserver(emitter_class=MagicMock(),
+                                   settle_time=60)
+        handler = MagicMock(spec=['dispatch_transaction'])
+        watch = observer.schedule(handler, self.td.name, True)
+        queue = observer.event_queue
+        for item in (BEGIN, FileCreatedEvent('a'), END):
+            queue.put((item, watch))
+        for _ in range(3):
+            observer.dispatch_events(queue, 0)
+        self.assertFalse(handler.dispatch_transaction.called)
+        with patch('time.monotonic', return_value=time.monotonic() + 61):
+            observer.dispatch_events(queue, 0)
+        self.assertTrue(handler.dispatch_transaction.called)
+
+    def test_ignores_tree_needs_all_handlers(self):
+        build = os.path.join(self.td.name, 'build')
+        watch = self.observer.schedule(
+            AutoRunTrick(ignore_patterns=['*/build/']), self.td.name, True
+        )
+        self.observer.schedule(AutoRunTrick(), self.td.name, True)
+        self.assertFalse(self.observer.ignores_tree(watch, build))
+        self.observer.schedule(MagicMock(spec=[]), self.td.name, True)
+        self.assertFalse(self.observer.ignores_tree(watch, build))
@@ -0,0 +1,70 @@
+import os
+import threading
+import unittest
+
+from unittest.mock import patch
+
+from ..pools import Pools, ProcessPool, ThreadPool
+
+
+def getpid(path):
+    with open(path, 'w') as f:
+        f.write(str(os.getpid()))
+
+
+def fail():
+    raise RuntimeError('dummy')
+
+
+class PoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.done = threading.Event()
+
+    def test_thread_pool(self):
+        pool = ThreadPool(2)
+        result = []
+        pool.submit(result.append, (1,), self.done.set)
+        self.assertTrue(self.done.wait(2))
+        pool.close()
+        self.assertEqual(result, [1])
+
+    def test_thread_pool_error(self):
+        pool = ThreadPool(2)
+        with patch('traceback.print_exception') as m:
+            pool.submit(fail, (), self.done.set)
+            self.assertTrue(self.done.wait(2))
+            pool.close()
+        self.assertTrue(m.called)
+
+    def test_process_pool(self):
+        import tempfile
+
+        pool = ProcessPool(1)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'pid')
+            pool.submit(getpid, (path,), self.done.set)
+            self.assertTrue(self.done.wait(5))
+            with open(path) as f:
+                self.assertNotEqual(int(f.read()), os.getpid())
+        pool.close()
+
+    def test_process_pool_error(self):
+        pool = ProcessPool(1)
+        with patch('traceback.print_exception') as m:
+            pool.submit(fail, (), self.done.set)
+            self.assertTrue(self.done.wait(5))
+        pool.close()
+        self.assertTrue(m.called)
+
+
+class PoolsTestCase(unittest.TestCase):
+
+    def test_get(self):
+        pools = Pools(1)
+        pool = pools.get('thread')
+        self.assertIsInstance(pool, ThreadPool)
+        self.assertIs(pools.get('thread'), pool)
+        pools.close()
+        self.assertIsNot(pools.get('thread'), pool)
+        pools.close()
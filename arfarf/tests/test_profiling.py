@@ -0,0 +1,116 @@
+import io
+import os
+import pstats
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+
+from ..profiling import CallProfiler, ProfileSwitch, SamplingProfiler
+from ..profiling import profiled
+
+
+@profiled
+def _inner(n):
+    return sum(range(n))
+
+
+@profiled
+def _outer(n):
+    return _inner(n) + 1
+
+
+class CallProfilerTestCase(unittest.TestCase):
+
+    def test_profiles_profiled_calls(self):
+        profiler = CallProfiler()
+        _outer(10)
+        profiler.start()
+        try:
+            self.assertEqual(_outer(10), 46)
+            thread = threading.Thread(target=_inner, args=(10,))
+            thread.start()
+            thread.join()
+        finally:
+            profiler.stop()
+        _outer(10)
+        stats = profiler.stats().stats
+        calls = {func[2]: stat[1] for func, stat in stats.items()}
+        # The nested call is in the profile of the outer one.
+        self.assertEqual(calls['_outer'], 1)
+        self.assertEqual(calls['_inner'], 2)
+
+    def test_nothing_profiled(self):
+        profiler = CallProfiler()
+        self.assertIsNone(profiler.stats())
+        self.assertFalse(profiler.dump(os.devnull))
+
+
+class SamplingProfilerTestCase(unittest.TestCase):
+
+    def test_sample(self):
+        stop = threading.Event()
+        thread = threading.Thread(target=stop.wait, name='waiter')
+        thread.start()
+        profiler = SamplingProfiler()
+        try:
+            profiler.sample()
+        finally:
+            stop.set()
+            thread.join()
+        stacks = [s for s in profiler.samples if s.startswith('waiter;')]
+        self.assertEqual(len(stacks), 1)
+        self.assertIn(';wait (threading.py:', stacks[0])
+
+
+class ProfileSwitchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stream = io.StringIO()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            ProfileSwitch('unknown')
+
+    def test_toggle_cprofile(self):
+        switch = ProfileSwitch('cprofile', self.tmp.name, self.stream)
+        switch.toggle()
+        self.assertTrue(switch.running)
+        _outer(10)
+        switch.toggle()
+        self.assertFalse(switch.running)
+        name = 'arfarf-%d-1.pstats' % os.getpid()
+        self.assertEqual(os.listdir(self.tmp.name), [name])
+        stats = pstats.Stats(os.path.join(self.tmp.name, name))
+        self.assertIn('_outer', {func[2] for func in stats.stats})
+        self.assertIn(name, self.stream.getvalue())
+
+    def test_toggle_sampling(self):
+        switch = ProfileSwitch('sampling', self.tmp.name, self.stream)
+        switch.start()
+        time.sleep(0.05)
+        path = switch.stop()
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit()
+                            for line in lines))
+
+    def test_snapshot_memory(self):
+        tracing = tracemalloc.is_tracing()
+        switch = ProfileSwitch('cprofile', self.tmp.name, self.stream)
+        try:
+            summary = switch.snapshot_memory()
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+        self.assertTrue(summary.endswith('.txt'))
+        with open(summary) as f:
+            self.assertIn('# memory allocated by arfarf modules', f.read())
+        snapshot = os.path.splitext(summary)[0] + '.tracemalloc'
+        tracemalloc.Snapshot.load(snapshot)
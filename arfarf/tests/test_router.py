@@ -0,0 +1,76 @@
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+from watchdog.events import DirModifiedEvent, FileCreatedEvent
+
+from ..patterns import GlobSet
+from ..router import EventRouter
+from ..tricks import AutoRunTrick
+
+
+class EventRouterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        ignores = ['path/build/', 'path/*.pyc']
+        self.py = AutoRunTrick('echo py', ['path/*.py'], ignores)
+        self.rst = AutoRunTrick('echo rst', ['path/*.rst'], ignores)
+        self.dirs = AutoRunTrick('echo dirs', None, ignores,
+                                 ignore_directories=True)
+        self.router = EventRouter([self.py, self.rst, self.dirs, self.py])
+
+    def test_handlers_keep_order_without_duplicates(self):
+        self.assertEqual(self.router.handlers, (self.py, self.rst, self.dirs))
+
+    def test_route(self):
+        event = FileCreatedEvent('path/dummy.py')
+        self.assertEqual(self.router.route(event), [self.py, self.dirs])
+        event = DirModifiedEvent('path/src')
+        self.assertEqual(self.router.route(event), [])
+        event = FileCreatedEvent('path/build/dummy.py')
+        self.assertEqual(self.router.route(event), [])
+
+    def test_route_matches_shared_patterns_once(self):
+        event = FileCreatedEvent('path/dummy.py')
+        # Let ignores_tree() cache its results first.
+        self.router.route(event)
+        with patch.object(GlobSet, 'match', autospec=True,
+                          side_effect=GlobSet.match) as m:
+            self.router.route(event)
+        # 'path/*.py' and 'path/*.rst', then the shared excluded patterns
+        # only once for self.py and self.dirs.
+        self.assertEqual(m.call_count, 3)
+
+    def test_dispatch(self):
+        event = FileCreatedEvent('path/dummy.rst')
+        with patch.object(AutoRunTrick, 'on_any_event') as m:
+            self.router.dispatch(event)
+        self.assertEqual(m.call_count, 2)
+
+    def test_dispatch_to_handlers_not_routable(self):
+        handler = MagicMock(spec=['dispatch'])
+        router = EventRouter([handler])
+        event = FileCreatedEvent('path/dummy.py')
+        router.dispatch(event)
+        handler.dispatch.assert_called_once_with(event)
+
+    def test_dispatch_transaction(self):
+        from ..transaction import Transaction
+
+        events = [FileCreatedEvent('path/a.py'), FileCreatedEvent('path/b.py'),
+                  FileCreatedEvent('path/c.rst')]
+        plain = MagicMock(spec=['dispatch'])
+        router = EventRouter([self.py, self.rst, plain])
+        with patch.object(AutoRunTrick, 'on_events', autospec=True) as m:
+            router.dispatch_transaction(Transaction('watch', events))
+        self.assertEqual(m.call_args_list, [((self.py, events[:2]),),
+                                            ((self.rst, events[2:]),)])
+        self.assertEqual([c[0][0] for c in plain.dispatch.call_args_list],
+                         events)
+
+    def test_ignores_tree(self):
+        self.assertTrue(self.router.ignores_tree('path/build'))
+        self.assertFalse(self.router.ignores_tree('path/src'))
+        router = EventRouter([self.py, AutoRunTrick()])
+        self.assertFalse(router.ignores_tree('path/build'))
+        self.assertFalse(EventRouter([]).ignores_tree('path/build'))
@@ -0,0 +1,211 @@
+import asyncio
+import os
+import signal
+import tempfile
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+from watchdog.events import FileModifiedEvent
+
+from ..runtime import AsyncAutoRunTrick, AsyncScheduler, run
+from ..startup import StartupProfile
+
+
+class AsyncAutoRunTrickTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.out = os.path.join(self.tmpdir.name, 'out')
+
+    def tearDown(self):
+        self.loop.close()
+        self.tmpdir.cleanup()
+
+    def handler(self, command, **kwargs):
+        return AsyncAutoRunTrick(command, loop=self.loop, **kwargs)
+
+    def read_out(self):
+        with open(self.out) as f:
+            return f.read()
+
+    def run_loop(self, seconds):
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+
+    def test_start(self):
+        handler = self.handler('echo hello >> %s' % self.out)
+        handler.start()
+        self.loop.run_until_complete(handler._task)
+        self.assertEqual(self.read_out(), 'hello\n')
+
+    def test_start_without_shell(self):
+        handler = self.handler(['touch', self.out])
+        handler.start()
+        self.loop.run_until_complete(handler._task)
+        self.assertEqual(self.read_out(), '')
+
+    def test_on_any_event_from_other_thread(self):
+        handler = self.handler('echo hello >> %s' % self.out)
+        event = FileModifiedEvent('/source/path/file')
+        self.loop.run_until_complete(
+            self.loop.run_in_executor(None, handler.on_any_event, event))
+        self.run_loop(0.01)
+        self.loop.run_until_complete(handler._task)
+        self.assertEqual(self.read_out(), 'hello\n')
+
+    def test_restart_waits_for_previous_command(self):
+        command = 'trap "echo stopped >> {0}" INT; echo started >> {0}; ' \
+                  'sleep 10'.format(self.out)
+        handler = self.handler(command)
+        handler.start()
+        self.run_loop(0.2)
+        handler.start()
+        self.run_loop(0.3)
+        self.loop.run_until_complete(handler.aclose())
+        self.assertEqual(self.read_out(),
+                         'started\nstopped\nstarted\nstopped\n')
+
+    def test_stop_escalates_to_sigkill(self):
+        handler = self.handler('trap "" INT; sleep 10', kill_after=0.2)
+        handler.start()
+        self.run_loop(0.2)
+        with patch('os.killpg', wraps=os.killpg) as m:
+            self.loop.run_until_complete(
+                asyncio.wait_for(handler.aclose(), 2))
+        self.assertEqual([c[0][1] for c in m.call_args_list],
+                         [signal.SIGINT, signal.SIGKILL])
+
+    def test_changes_delivered(self):
+        handler = self.handler('cat > %s' % self.out, changes='stdin')
+        handler._push(FileModifiedEvent('/source/path/file'))
+        self.loop.run_until_complete(handler._task)
+        self.assertEqual(self.read_out(), 'modified\t/source/path/file\0')
+
+    def test_changes_of_failed_run_delivered_again(self):
+        handler = self.handler(['/nonexistent/prog'], changes='stdin')
+        handler._push(FileModifiedEvent('/source/path/file'))
+        with self.assertRaises(OSError):
+            self.loop.run_until_complete(handler._task)
+        self.assertEqual(handler._changes.changes,
+                         [('modified', '/source/path/file')])
+
+    def test_callable_command(self):
+        import threading
+
+        calls = []
+        called = threading.Event()
+
+        def command(events):
+            calls.append(events)
+            called.set()
+
+        handler = self.handler(command, debounce=0.05)
+        events = [FileModifiedEvent('/source/path/file%d' % i)
+                  for i in range(2)]
+        for event in events:
+            handler._push(event)
+        self.run_loop(0.1)
+        self.assertTrue(called.wait(2))
+        self.assertEqual(calls, [events])
+
+    def test_worker_not_supported(self):
+        with self.assertRaises(ValueError):
+            self.handler('cat', worker='stdin')
+
+    def test_debounce(self):
+        handler = self.handler('echo hello >> %s' % self.out, debounce=0.05)
+        for i in range(5):
+            handler._push(FileModifiedEvent('/source/path/file%d' % i))
+        self.run_loop(0.1)
+        self.loop.run_until_complete(handler._task)
+        self.assertEqual(self.read_out(), 'hello\n')
+
+    def test_debounce_command_default(self):
+        handler = self.handler(None, debounce=0.05)
+        with patch('builtins.print') as m:
+            for i in range(3):
+                handler._push(FileModifiedEvent('/source/path/file%d' % i))
+            self.run_loop(0.1)
+        self.assertEqual(m.call_count, 3)
+
+    def test_stop_drops_debounced_events(self):
+        handler = self.handler('echo hello >> %s' % self.out, debounce=0.05)
+        handler._push(FileModifiedEvent('/source/path/file'))
+        handler.stop()
+        self.run_loop(0.1)
+        self.assertIsNone(handler._task)
+
+
+class AsyncSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.scheduler = AsyncScheduler(max_jobs=1)
+        self.started = []
+
+    def tearDown(self):
+        self.loop.close()
+
+    async def job(self, name, priority=0):
+        await self.scheduler.acquire(priority)
+        self.started.append(name)
+        await asyncio.sleep(0.01)
+        self.scheduler.release()
+
+    def test_priority_and_cancel(self):
+        async def main():
+            tasks = [self.loop.create_task(self.job('a')),
+                     self.loop.create_task(self.job('low', -1)),
+                     self.loop.create_task(self.job('dropped')),
+                     self.loop.create_task(self.job('high', 1))]
+            await asyncio.sleep(0)
+            tasks[2].cancel()
+            await asyncio.wait(tasks)
+
+        self.loop.run_until_complete(main())
+        self.assertEqual(self.started, ['a', 'high', 'low'])
+        self.assertEqual(self.scheduler.running, 0)
+
+
+class RunTestCase(unittest.TestCase):
+
+    def test_run_until_interrupted(self):
+        handler = MagicMock()
+        handler.aclose.side_effect = lambda: asyncio.sleep(0)
+        parser = MagicMock()
+        parser.schedule_with.return_value = {'watch': {handler}}
+        observer = MagicMock()
+
+        def interrupt():
+            raise KeyboardInterrupt
+
+        # Interrupt once the loop waits for events.
+        observer.start.side_effect = \
+            lambda: asyncio.get_running_loop().call_soon(interrupt)
+        with patch('arfarf.runtime._set_child_watcher'), \
+                patch('asyncio.set_event_loop'):
+            run(parser, observer)
+        handler.start.assert_called_once_with()
+        observer.stop.assert_called_once_with()
+        handler.aclose.assert_called_once_with()
+
+    def test_run_without_initial_run(self):
+        handler = MagicMock(run_at_start=False)
+        handler.aclose.side_effect = lambda: asyncio.sleep(0)
+        parser = MagicMock()
+        parser.schedule_with.return_value = {'watch': {handler}}
+        observer = MagicMock()
+
+        def interrupt():
+            raise KeyboardInterrupt
+
+        observer.start.side_effect = \
+            lambda: asyncio.get_running_loop().call_soon(interrupt)
+        profile = StartupProfile()
+        with patch('arfarf.runtime._set_child_watcher'), \
+                patch('asyncio.set_event_loop'):
+            run(parser, observer, profile)
+        self.assertFalse(handler.start.called)
+        self.assertEqual([name for name, _ in profile.phases],
+                         ['scheduling', 'initial runs', 'initial scan'])
@@ -0,0 +1,84 @@
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+from ..scheduler import Scheduler
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.supervisor = MagicMock()
+        self.scheduler = Scheduler(self.supervisor, max_jobs=2)
+        self.started = []
+
+    def job(self, name, process=True):
+        def start():
+            self.started.append(name)
+            return MagicMock(name=name) if process else None
+        return start
+
+    def exit_first(self):
+        """Let the first watched process exit."""
+        (process, callback), _ = self.supervisor.watch.call_args_list.pop(0)
+        callback(process)
+
+    def test_max_jobs_default(self):
+        import os
+        self.assertEqual(Scheduler(self.supervisor).max_jobs, os.cpu_count())
+
+    def test_submit_starts_while_slots_free(self):
+        self.scheduler.submit('a', self.job('a'))
+        self.scheduler.submit('b', self.job('b'))
+        self.scheduler.submit('c', self.job('c'))
+        self.assertEqual(self.started, ['a', 'b'])
+        self.assertEqual(self.scheduler.running, 2)
+        self.assertEqual(self.scheduler.queued, 1)
+        self.exit_first()
+        self.assertEqual(self.started, ['a', 'b', 'c'])
+        self.assertEqual(self.scheduler.running, 2)
+        self.assertEqual(self.scheduler.queued, 0)
+
+    def test_priority(self):
+        self.scheduler.submit('a', self.job('a'))
+        self.scheduler.submit('b', self.job('b'))
+        self.scheduler.submit('low', self.job('low'), priority=-1)
+        self.scheduler.submit('c', self.job('c'))
+        self.scheduler.submit('d', self.job('d'))
+        self.scheduler.submit('high', self.job('high'), priority=1)
+        for _ in range(4):
+            self.exit_first()
+        self.assertEqual(self.started,
+                         ['a', 'b', 'high', 'c', 'd', 'low'])
+
+    def test_superseded_job_dropped(self):
+        self.scheduler.submit('a', self.job('a'))
+        self.scheduler.submit('b', self.job('b'))
+        self.scheduler.submit('c', self.job('c1'))
+        self.scheduler.submit('d', self.job('d'))
+        self.scheduler.submit('c', self.job('c2'))
+        self.assertEqual(self.scheduler.queued, 2)
+        self.exit_first()
+        self.exit_first()
+        self.assertEqual(self.started, ['a', 'b', 'c2', 'd'])
+
+    def test_cancel(self):
+        self.scheduler.submit('a', self.job('a'))
+        self.scheduler.submit('b', self.job('b'))
+        self.scheduler.submit('c', self.job('c'))
+        self.scheduler.cancel('c')
+        self.exit_first()
+        self.assertEqual(self.started, ['a', 'b'])
+        self.assertEqual(self.scheduler.running, 1)
+
+    def test_job_without_process_frees_slot(self):
+        self.scheduler.submit('a', self.job('a', process=False))
+        self.assertEqual(self.scheduler.running, 0)
+        self.supervisor.watch.assert_not_called()
+
+    def test_job_error_frees_slot(self):
+        def job():
+            raise OSError
+        with patch('sys.stderr'):
+            self.scheduler.submit('a', job)
+        self.assertEqual(self.scheduler.running, 0)
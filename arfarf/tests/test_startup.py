@@ -0,0 +1,94 @@
+import io
+import os
+import subprocess
+import sys
+import threading
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+from ..startup import StartupProfile, start_handlers
+
+
+class StartupProfileTestCase(unittest.TestCase):
+
+    def test_phases(self):
+        clock = MagicMock(side_effect=[0, 1, 3, 3, 3.5, 4])
+        profile = StartupProfile(clock=clock)
+        with profile.phase('config import'):
+            pass
+        with profile.phase('initial scan'):
+            pass
+        self.assertEqual(profile.phases,
+                         [('config import', 2), ('initial scan', 0.5)])
+        profile.stream = io.StringIO()
+        profile.report()
+        lines = profile.stream.getvalue().splitlines()
+        self.assertEqual(lines, [
+            'config import           2000.0 ms',
+            'initial scan             500.0 ms',
+            'total                   4000.0 ms',
+        ])
+
+    def test_phase_timed_on_error(self):
+        profile = StartupProfile()
+        with self.assertRaises(ValueError):
+            with profile.phase('scheduling'):
+                raise ValueError
+        self.assertEqual(profile.phases[0][0], 'scheduling')
+
+    def test_report_without_stream(self):
+        profile = StartupProfile()
+        with patch('builtins.print') as m:
+            profile.report()
+        self.assertFalse(m.called)
+
+
+class StartHandlersTestCase(unittest.TestCase):
+
+    def test_start_in_parallel(self):
+        barrier = threading.Barrier(3, timeout=2)
+        handlers = [MagicMock(run_at_start=True, graph=None) for _ in range(3)]
+        for handler in handlers:
+            handler.start.side_effect = barrier.wait
+        start_handlers(handlers).shutdown(wait=True)
+        for handler in handlers:
+            handler.start.assert_called_once_with()
+        self.assertFalse(barrier.broken)
+
+    def test_handlers_not_run_at_start(self):
+        handler = MagicMock(run_at_start=False, graph=None)
+        start_handlers([handler]).shutdown(wait=True)
+        self.assertFalse(handler.start.called)
+
+    def test_errors_printed(self):
+        handler = MagicMock(run_at_start=True, graph=None)
+        handler.start.side_effect = RuntimeError('dummy')
+        with patch('traceback.print_exception') as m:
+            start_handlers([handler]).shutdown(wait=True)
+        self.assertTrue(m.called)
+
+    def test_graphs_started_once(self):
+        graph = MagicMock()
+        handlers = [MagicMock(run_at_start=True, graph=graph)
+                    for _ in range(2)]
+        start_handlers(handlers).shutdown(wait=True)
+        graph.start.assert_called_once_with()
+        for handler in handlers:
+            self.assertFalse(handler.start.called)
+
+
+class ImportsTestCase(unittest.TestCase):
+
+    def test_heavy_modules_imported_once_needed(self):
+        deferred = ('cProfile', 'pstats', 'tracemalloc', 'arfarf.content',
+                    'arfarf.worker', 'arfarf.metrics', 'arfarf.graph',
+                    'arfarf.output')
+        code = ('import sys, arfarf.dog, arfarf.tricks; '
+                'print(" ".join(m for m in %r if m in sys.modules))'
+                % (deferred,))
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=root)
+        self.assertEqual(output.decode().split(), [])
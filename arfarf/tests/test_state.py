@@ -0,0 +1,93 @@
+import os
+import threading
+import unittest
+
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from ..polling import Entry, TreeSnapshot
+from ..state import TreeState, decode_trees, encode_trees
+
+
+class EncodeTestCase(unittest.TestCase):
+
+    def test_round_trip(self):
+        trees = {
+            ('.', True): {
+                '.': Entry(1, 2, True, 4096, 10, 11),
+                './src': Entry(3, 2, True, 4096, -5, 12),
+                './src/main.py': Entry(4, 2, False, 100, 13, 14),
+            },
+            ('/abs/path/', False): {
+                '/abs/path/': Entry(5, 6, True, 0, 0, 0),
+                '/abs/path/\udcff': Entry(7, 6, False, 1, 2, 3),
+            },
+            ('empty', True): {},
+        }
+        self.assertEqual(decode_trees(encode_trees(trees)), trees)
+
+    def test_bad_data(self):
+        data = encode_trees({('.', True): {'.': Entry(1, 2, True, 3, 4, 5)}})
+        for bad in (b'', b'garbage', data[:-1], data[:-1] + b'x'):
+            with self.assertRaises(ValueError):
+                decode_trees(bad)
+
+
+class TreeStateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.td = TemporaryDirectory()
+        self.root = os.path.join(self.td.name, 'root')
+        os.mkdir(self.root)
+        with open(os.path.join(self.root, 'file'), 'w'):
+            pass
+        self.path = os.path.join(self.td.name, 'state')
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_load_without_file(self):
+        self.assertIsNone(TreeState(self.path).load(self.root, True))
+
+    def test_load_bad_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'garbage')
+        with patch('traceback.print_exc') as m:
+            self.assertIsNone(TreeState(self.path).load(self.root, True))
+        self.assertTrue(m.called)
+
+    def test_save_and_load(self):
+        snapshot = TreeSnapshot(self.root)
+        state = TreeState(self.path, save_interval=60)
+        state.track(self.root, True, snapshot, threading.Lock())
+        state.close()
+        state = TreeState(self.path)
+        self.assertEqual(state.load(self.root, True), snapshot.entries)
+        self.assertIsNone(state.load(self.root, False))
+
+    def test_save_refreshed(self):
+        snapshot = TreeSnapshot(self.root)
+        state = TreeState(self.path, save_interval=60)
+        state.track(self.root, True, snapshot, threading.Lock(),
+                    refresh=True)
+        new = os.path.join(self.root, 'new')
+        with open(new, 'w'):
+            pass
+        state.close()
+        self.assertIn(new, TreeState(self.path).load(self.root, True))
+
+    def test_save_skipped_when_unchanged(self):
+        state = TreeState(self.path, save_interval=60)
+        state.track(self.root, True, TreeSnapshot(self.root),
+                    threading.Lock())
+        state.save()
+        os.remove(self.path)
+        state.save()
+        self.assertFalse(os.path.exists(self.path))
+        state.close()
+
+    def test_owns(self):
+        state = TreeState(self.path)
+        self.assertTrue(state.owns(self.path))
+        self.assertFalse(state.owns(os.path.join(self.root, 'state')))
+        self.assertFalse(state.owns(self.path + '.tmp'))
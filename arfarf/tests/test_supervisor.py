@@ -0,0 +1,118 @@
+import signal
+import subprocess
+import time
+import unittest
+
+from unittest.mock import patch
+
+from ..supervisor import Supervisor, parse_command
+
+
+class SupervisorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.supervisor = Supervisor()
+
+    def test_spawn_new_session(self):
+        process = self.supervisor.spawn('echo hello', shell=True,
+                                        stdout=subprocess.PIPE)
+        outs, _ = process.communicate()
+        self.assertEqual(outs, b'hello\n')
+
+    def test_terminate_returns_immediately(self):
+        process = self.supervisor.spawn(['sleep', '10'])
+        start = time.monotonic()
+        self.supervisor.terminate(process, signal.SIGTERM, kill_after=5)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertTrue(self.supervisor.wait(2))
+        self.assertEqual(process.returncode, -signal.SIGTERM)
+        self.assertEqual(self.supervisor.stopping, 0)
+
+    def test_terminate_escalates_to_sigkill(self):
+        process = self.supervisor.spawn(
+            'trap "" INT; sleep 10', shell=True)
+        time.sleep(0.1)
+        self.supervisor.terminate(process, signal.SIGINT, kill_after=0.2)
+        self.assertEqual(self.supervisor.stopping, 1)
+        self.assertTrue(self.supervisor.wait(2))
+        self.assertEqual(process.returncode, -signal.SIGKILL)
+
+    def test_terminate_kills_process_group(self):
+        process = self.supervisor.spawn('sleep 10 & wait', shell=True)
+        time.sleep(0.1)
+        self.supervisor.terminate(process, signal.SIGTERM)
+        self.assertTrue(self.supervisor.wait(2))
+
+    def test_terminate_exited_process(self):
+        process = self.supervisor.spawn(['true'])
+        process.wait()
+        self.supervisor.terminate(process)
+        self.assertEqual(self.supervisor.stopping, 0)
+
+    def test_terminate_without_pidfd(self):
+        self.supervisor.poll_interval = 0.05
+        with patch('arfarf.supervisor._pidfd_open', return_value=None):
+            process = self.supervisor.spawn(['sleep', '10'])
+            self.supervisor.terminate(process, signal.SIGTERM)
+            self.assertTrue(self.supervisor.wait(2))
+        self.assertEqual(process.returncode, -signal.SIGTERM)
+
+    def test_watch(self):
+        exited = []
+        process = self.supervisor.spawn(['sleep', '0.1'])
+        self.supervisor.watch(process, exited.append)
+        for _ in range(40):
+            if exited:
+                break
+            time.sleep(0.05)
+        self.assertEqual(exited, [process])
+        self.assertEqual(self.supervisor.stopping, 0)
+
+    def test_watch_exited_process(self):
+        exited = []
+        process = self.supervisor.spawn(['true'])
+        process.wait()
+        self.supervisor.watch(process, exited.append)
+        self.assertEqual(exited, [process])
+
+    def test_spawn_nice(self):
+        import os
+
+        process = self.supervisor.spawn(['sleep', '10'], nice=5)
+        try:
+            self.assertEqual(os.getpriority(os.PRIO_PROCESS, process.pid),
+                             os.getpriority(os.PRIO_PROCESS, 0) + 5)
+        finally:
+            process.kill()
+            process.wait()
+
+    def test_spawn_ionice(self):
+        with patch('arfarf.supervisor._set_ioprio') as m:
+            process = self.supervisor.spawn(['true'], ionice=3)
+            process.wait()
+        m.assert_called_once_with(process.pid, 3)
+
+
+class ParseCommandTestCase(unittest.TestCase):
+
+    def test_simple_command_run_directly(self):
+        args, shell = parse_command('echo "hello world"')
+        self.assertFalse(shell)
+        self.assertTrue(args[0].endswith('/echo'))
+        self.assertEqual(args[1:], ('hello world',))
+
+    def test_shell_syntax(self):
+        for command in ('echo a | cat', 'make && make test', 'echo a; echo b',
+                        'echo $HOME', 'ls *.py', 'FOO=1 make', 'cat < in',
+                        'echo ~', 'echo a\\nb', 'echo "unbalanced', ''):
+            self.assertEqual(parse_command(command), (command, True))
+
+    def test_builtin(self):
+        self.assertEqual(parse_command('cd dir'), ('cd dir', True))
+
+    def test_argv(self):
+        args, shell = parse_command(['echo', 'a;b'])
+        self.assertFalse(shell)
+        self.assertEqual(args[1:], ('a;b',))
+        self.assertEqual(parse_command(['nonexistent-program', 'a']),
+                         (('nonexistent-program', 'a'), False))
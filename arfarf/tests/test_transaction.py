@@ -0,0 +1,88 @@
+import time
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+from ..transaction import BEGIN, END, Transaction, TransactionCollector
+from ..transaction import queue_transaction
+
+
+class QueueTransactionTestCase(unittest.TestCase):
+
+    def test_queue_transaction(self):
+        emitter = MagicMock()
+        event = FileCreatedEvent('a')
+        queue_transaction(emitter, [event])
+        self.assertEqual([c[0][0] for c in emitter.queue_event.call_args_list],
+                         [BEGIN, event, END])
+
+    def test_nothing_queued_without_events(self):
+        emitter = MagicMock()
+        queue_transaction(emitter, [])
+        self.assertFalse(emitter.queue_event.called)
+
+
+class TransactionCollectorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.collector = TransactionCollector()
+        self.created = FileCreatedEvent('a')
+        self.modified = FileModifiedEvent('a')
+
+    def test_collect(self):
+        collector = self.collector
+        self.assertIsNone(collector.add(BEGIN, 'w'))
+        self.assertIsNone(collector.add(self.created, 'w'))
+        self.assertEqual(collector.settled(True), [])
+        self.assertIsNone(collector.add(END, 'w'))
+        transaction, = collector.settled(True)
+        self.assertEqual(transaction.watch, 'w')
+        self.assertEqual(transaction.events, [self.created])
+        self.assertEqual(collector.pending, 0)
+
+    def test_event_outside_markers(self):
+        transaction = self.collector.add(self.created, 'w')
+        self.assertIsInstance(transaction, Transaction)
+        self.assertEqual(transaction.events, [self.created])
+        self.assertEqual(self.collector.pending, 0)
+
+    def test_watches_collected_apart(self):
+        collector = self.collector
+        for item, watch in ((BEGIN, 'w1'), (BEGIN, 'w2'),
+                            (self.created, 'w1'), (self.modified, 'w2'),
+                            (END, 'w2')):
+            collector.add(item, watch)
+        transaction, = collector.settled(True)
+        self.assertEqual(transaction.watch, 'w2')
+        self.assertEqual(transaction.events, [self.modified])
+        self.assertEqual(collector.pending, 1)
+
+    def test_merged_until_settled(self):
+        collector = TransactionCollector(settle_time=60)
+        for item in (BEGIN, self.created, END):
+            collector.add(item, 'w')
+        self.assertEqual(collector.settled(True), [])
+        self.assertLessEqual(collector.timeout(1), 1)
+        for item in (BEGIN, self.modified, END):
+            collector.add(item, 'w')
+        with patch('time.monotonic', return_value=time.monotonic() + 61):
+            transaction, = collector.settled(True)
+        self.assertEqual(transaction.events, [self.created, self.modified])
+        self.assertEqual(transaction.ticks, 2)
+
+    def test_held_while_queue_not_drained(self):
+        collector = self.collector
+        for item in (BEGIN, self.created, END):
+            collector.add(item, 'w')
+        self.assertEqual(collector.settled(False), [])
+        later = time.monotonic() + TransactionCollector.max_hold
+        with patch('time.monotonic', return_value=later):
+            self.assertEqual(len(collector.settled(False)), 1)
+
+    def test_timeout(self):
+        self.assertEqual(self.collector.timeout(1), 1)
+        for item in (BEGIN, self.created, END):
+            self.collector.add(item, 'w')
+        self.assertEqual(self.collector.timeout(1), 0)
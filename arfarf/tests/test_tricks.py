@@ -1,5 +1,7 @@
+import signal
 import unittest
 import subprocess
+import time
 
 from unittest.mock import patch
 
@@ -14,14 +16,25 @@ class AutoRunTrickTestCase(unittest.TestCase):
         from io import StringIO
         self.patcher = patch('sys.stdout', new_callable=StringIO)
         self.mock_out = self.patcher.start()
+        # Don't let commands of other tests hold the scheduler slots.
+        from ..scheduler import Scheduler
+        scheduler = Scheduler(AutoRunTrick.supervisor, max_jobs=64)
+        self.scheduler_patcher = patch.object(AutoRunTrick, 'scheduler',
+                                              new=scheduler)
+        self.scheduler_patcher.start()
 
     def tearDown(self):
+        self.scheduler_patcher.stop()
         self.patcher.stop()
 
     def test_command_property(self):
         handler = AutoRunTrick(command='echo hello')
         self.assertEqual('echo hello', handler.command)
 
+    def test_run_at_start_property(self):
+        self.assertTrue(AutoRunTrick().run_at_start)
+        self.assertFalse(AutoRunTrick(run_at_start=False).run_at_start)
+
     def test_command_default_cls_attr(self):
         expected = ('${event_object} ${event_src_path} is '
                     '${event_type}${if_moved}')
@@ -126,6 +139,291 @@ class AutoRunTrickTestCase(unittest.TestCase):
         handler.stop()
         self.assertIs(handler._process, None)
 
+    def test_stop_does_not_wait(self):
+        handler = AutoRunTrick('trap "" INT; sleep 10', kill_after=0.2)
+        handler.start()
+        process = handler._process
+        time.sleep(0.1)
+        start = time.monotonic()
+        handler.stop()
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertIsNone(process.poll())
+        self.assertTrue(AutoRunTrick.supervisor.wait(2))
+        self.assertIsNotNone(process.poll())
+
+    def test_start_waits_for_scheduler(self):
+        from unittest.mock import MagicMock
+        from ..scheduler import Scheduler
+
+        scheduler = Scheduler(MagicMock(), max_jobs=1)
+        first = AutoRunTrick('sleep 10')
+        second = AutoRunTrick('echo hello', priority=1)
+        with patch.object(AutoRunTrick, 'scheduler', new=scheduler), \
+                patch('subprocess.Popen', new=self.PipePopen):
+            first.start()
+            second.start()
+            self.assertIsNone(second._process)
+            first.stop()
+            # The supervisor tells the scheduler the first command exited.
+            process, callback = scheduler._supervisor.watch.call_args[0]
+            callback(process)
+        outs, _ = second._process.communicate()
+        self.assertEqual(outs, b'hello\n')
+
+    def test_changes_delivered(self):
+        from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+        handler = AutoRunTrick('printf %s "$ARFARF_CHANGES"', changes='env')
+        with patch('subprocess.Popen', new=self.PipePopen):
+            handler.on_any_event(FileCreatedEvent('path/a.py'))
+            outs, _ = handler._process.communicate()
+            self.assertEqual(outs, b'created\tpath/a.py')
+            handler.on_any_event(FileModifiedEvent('path/b.py'))
+            outs, _ = handler._process.communicate()
+        self.assertEqual(outs, b'modified\tpath/b.py')
+
+    def test_changes_of_killed_run_delivered_again(self):
+        from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+        handler = AutoRunTrick('sleep 10', stop_signal=signal.SIGTERM,
+                               changes='env')
+        handler.on_any_event(FileCreatedEvent('path/a.py'))
+        handler._args = 'printf %s "$ARFARF_CHANGES"'
+        handler._shell = True
+        with patch('subprocess.Popen', new=self.PipePopen):
+            handler.on_any_event(FileModifiedEvent('path/b.py'))
+        outs, _ = handler._process.communicate()
+        self.assertEqual(outs, b'created\tpath/a.py\nmodified\tpath/b.py')
+
+    def test_changes_of_failed_run_delivered_again(self):
+        from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+        handler = AutoRunTrick(['/nonexistent/prog'], changes='env')
+        with patch('sys.stderr'):
+            handler.on_any_event(FileCreatedEvent('path/a.py'))
+        self.assertIsNone(handler._process)
+        handler._args = 'printf %s "$ARFARF_CHANGES"'
+        handler._shell = True
+        with patch('subprocess.Popen', new=self.PipePopen):
+            handler.on_any_event(FileModifiedEvent('path/b.py'))
+        outs, _ = handler._process.communicate()
+        self.assertEqual(outs, b'created\tpath/a.py\nmodified\tpath/b.py')
+
+    def test_start_without_shell(self):
+        handler = AutoRunTrick('echo hello')
+        with patch('subprocess.Popen', new=self.PipePopen):
+            handler.start()
+        outs, _ = handler._process.communicate()
+        self.assertEqual(outs, b'hello\n')
+        self.assertEqual(handler._process.args[1:], ('hello',))
+        self.assertTrue(handler._process.args[0].endswith('/echo'))
+
+    def test_start_argv_list(self):
+        handler = AutoRunTrick(['printf', '%s', 'a;b'])
+        self.assertEqual(handler.command, ('printf', '%s', 'a;b'))
+        hash(handler)
+        with patch('subprocess.Popen', new=self.PipePopen):
+            handler.start()
+        outs, _ = handler._process.communicate()
+        self.assertEqual(outs, b'a;b')
+
+    def test_worker_notified(self):
+        from watchdog.events import FileModifiedEvent
+
+        handler = AutoRunTrick('cat', stop_signal=signal.SIGTERM,
+                               worker='stdin', restart_patterns=['setup.py'])
+        with patch('subprocess.Popen', new=self.PipePopen):
+            handler.start()
+            worker = handler._process
+            handler.on_any_event(FileModifiedEvent('a.py'))
+            self.assertIs(handler._process, worker)
+            self.assertEqual(worker.stdout.readline(),
+                             b'{"changes": [["modified", "a.py"]]}\n')
+            handler.on_any_event(FileModifiedEvent('setup.py'))
+        self.assertIsNot(handler._process, worker)
+        self.assertEqual(worker.wait(2), -signal.SIGTERM)
+        handler.stop()
+
+    def test_worker_restarted_after_exit(self):
+        from watchdog.events import FileModifiedEvent
+
+        handler = AutoRunTrick('true', worker='stdin')
+        handler.start()
+        worker = handler._process
+        worker.wait()
+        handler.on_any_event(FileModifiedEvent('a.py'))
+        self.assertIsNot(handler._process, worker)
+
+    def test_worker_with_changes_mode(self):
+        with self.assertRaises(ValueError):
+            AutoRunTrick('cat', changes='env', worker='stdin')
+
+    def test_callable_command(self):
+        import threading
+        from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+        calls = []
+        called = threading.Event()
+        release = threading.Event()
+
+        def command(events):
+            calls.append(events)
+            release.wait(2)
+            called.set()
+
+        handler = AutoRunTrick(command)
+        self.assertEqual(handler.pool, 'thread')
+        first = FileCreatedEvent('a.py')
+        handler.on_any_event(first)
+        # Calls waiting for the running one are merged.
+        events = [FileModifiedEvent('b.py'), FileModifiedEvent('c.py')]
+        for event in events:
+            handler.on_any_event(event)
+        release.set()
+        for _ in range(40):
+            if len(calls) == 2 and not handler._calling:
+                break
+            time.sleep(0.05)
+        self.assertEqual(calls, [[first], events])
+
+    def test_run_step(self):
+        import threading
+
+        results = []
+        done = threading.Event()
+
+        def finished(succeeded):
+            results.append(succeeded)
+            done.set()
+
+        for command in ('true', 'false', ['/nonexistent/program']):
+            done.clear()
+            with patch('traceback.print_exc'):
+                AutoRunTrick(command).run_step([], finished)
+            self.assertTrue(done.wait(2))
+        self.assertEqual(results, [True, False, False])
+
+    def test_run_step_callable(self):
+        import threading
+
+        results = []
+        done = threading.Event()
+
+        def finished(succeeded):
+            results.append(succeeded)
+            done.set()
+
+        def fail(events):
+            raise RuntimeError('dummy')
+
+        for command in (print, fail):
+            done.clear()
+            with patch('arfarf.pools._print_error'):
+                AutoRunTrick(command).run_step([], finished)
+                self.assertTrue(done.wait(2))
+        self.assertEqual(results, [True, False])
+
+    def test_events_handed_over_to_graph(self):
+        from unittest.mock import MagicMock
+        from watchdog.events import FileModifiedEvent
+
+        handler = AutoRunTrick('echo hello', name='test', after=['build'])
+        self.assertEqual(handler.name, 'test')
+        self.assertEqual(handler.after, ('build',))
+        handler.graph = MagicMock()
+        event = FileModifiedEvent('a.py')
+        handler.on_any_event(event)
+        handler.graph.trigger.assert_called_once_with(handler, [event])
+        self.assertIsNone(handler._process)
+
+    def test_output_captured(self):
+        import io
+        from ..output import OutputMux
+
+        stream = io.BytesIO()
+        output = OutputMux(stream)
+        handler = AutoRunTrick('echo hello', name='greet')
+        with patch.object(AutoRunTrick, 'output', new=output):
+            handler.start()
+        handler._process.wait()
+        for _ in range(40):
+            if b'\n' in stream.getvalue():
+                break
+            time.sleep(0.05)
+        output.close()
+        self.assertEqual(stream.getvalue(), b'[greet] hello\n')
+        run, = output.history('greet')
+        self.assertEqual(run.lines, [b'hello\n'])
+
+    def test_metrics_recorded(self):
+        from watchdog.events import FileModifiedEvent
+        from ..metrics import Metrics
+        from ..transaction import Transaction
+
+        metrics = Metrics()
+        handler = AutoRunTrick('exit 3', patterns=['*.py'], name='check')
+        events = [FileModifiedEvent('/a.py'), FileModifiedEvent('/a.txt')]
+        with patch.object(AutoRunTrick, 'metrics', new=metrics):
+            handler.dispatch_transaction(Transaction(None, events))
+            handler._process.wait()
+            for _ in range(40):
+                if metrics.command_exits.value(dog='check', status=3):
+                    break
+                time.sleep(0.05)
+        self.assertEqual(metrics.events_received.value(dog='check'), 2)
+        self.assertEqual(metrics.events_matched.value(dog='check'), 1)
+        self.assertGreater(metrics.match_seconds.value(dog='check'), 0)
+        self.assertEqual(metrics.spawn_delay.count(dog='check'), 1)
+        self.assertEqual(metrics.command_exits.value(dog='check', status=3),
+                         1)
+        self.assertEqual(metrics.command_duration.count(dog='check'), 1)
+
+    def test_failed_spawn_keeps_observer_dispatching(self):
+        import os
+        from tempfile import TemporaryDirectory
+        from ..metrics import Metrics
+        from ..polling import SnapshotObserver
+
+        metrics = Metrics()
+        seen = []
+        failing = AutoRunTrick(['/nonexistent/prog'], name='failing')
+        logger = AutoRunTrick(lambda events: seen.extend(
+            os.path.basename(e.src_path) for e in events))
+        with TemporaryDirectory() as td, patch('sys.stderr'), \
+                patch.object(AutoRunTrick, 'metrics', new=metrics):
+            observer = SnapshotObserver(timeout=0.02)
+            observer.schedule(failing, td, True)
+            observer.schedule(logger, td, True)
+            observer.start()
+            try:
+                for name in ('a', 'b'):
+                    open(os.path.join(td, name), 'w').close()
+                    for _ in range(100):
+                        if name in seen:
+                            break
+                        time.sleep(0.02)
+                self.assertTrue(observer.is_alive())
+            finally:
+                observer.stop()
+                observer.join()
+        self.assertIn('b', seen)
+        self.assertEqual(metrics.command_exits.value(dog='failing',
+                                                     status='failed'), 2)
+
+    def test_label_property(self):
+        self.assertEqual(AutoRunTrick('make', name='build').label, 'build')
+        self.assertEqual(AutoRunTrick(['make', '-j4']).label, 'make -j4')
+        self.assertEqual(AutoRunTrick('make -j4').label, 'make -j4')
+
+    def test_callable_command_unknown_pool(self):
+        with self.assertRaises(ValueError):
+            AutoRunTrick(print, pool='unknown')
+        self.assertIsNone(AutoRunTrick('echo hello', pool='unknown').pool)
+
+    def test_unknown_changes_mode(self):
+        with self.assertRaises(ValueError):
+            AutoRunTrick('echo hello', changes='unknown')
+
     def test_on_any_event(self):
         from watchdog.events import DirMovedEvent
 
@@ -137,6 +435,149 @@ class AutoRunTrickTestCase(unittest.TestCase):
         expected = b'hello\n'
         self.assertEqual(outs, expected)
 
+    def test_on_any_event_debounced(self):
+        from watchdog.events import FileModifiedEvent
+
+        handler = AutoRunTrick(command='echo hello', debounce=0.05)
+        events = [FileModifiedEvent('/source/path/file%d' % i)
+                  for i in range(3)]
+        with patch.object(handler, 'start') as m:
+            for event in events:
+                handler.on_any_event(event)
+            m.assert_not_called()
+            for _ in range(40):
+                if m.called:
+                    break
+                time.sleep(0.05)
+        m.assert_called_once_with(event=events[-1])
+
+    def test_on_any_event_debounced_command_default(self):
+        """Default logging command should still log each event."""
+        from watchdog.events import FileModifiedEvent
+
+        handler = AutoRunTrick(debounce=0.05)
+        events = [FileModifiedEvent('/source/path/file%d' % i)
+                  for i in range(3)]
+        handler._on_burst(events)
+        self.assertEqual(self.mock_out.getvalue().count('is modified'), 3)
+
+    def test_stop_drops_debounced_events(self):
+        from watchdog.events import FileModifiedEvent
+
+        handler = AutoRunTrick(command='echo hello', debounce=0.1)
+        with patch.object(handler, 'start') as m:
+            handler.on_any_event(FileModifiedEvent('/source/path/file'))
+            handler.stop()
+            time.sleep(0.3)
+        m.assert_not_called()
+
+    def test_verify_content(self):
+        import os
+        import tempfile
+
+        from watchdog.events import FileModifiedEvent, FileDeletedEvent
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'file')
+            with open(path, 'w') as f:
+                f.write('hello')
+            handler = AutoRunTrick(command='true', verify_content=True)
+            with patch.object(handler, 'on_any_event') as m:
+                handler.dispatch(FileModifiedEvent(path))
+                self.assertEqual(m.call_count, 1)
+                # Saved unchanged.
+                with open(path, 'w') as f:
+                    f.write('hello')
+                handler.dispatch(FileModifiedEvent(path))
+                self.assertEqual(m.call_count, 1)
+                with open(path, 'w') as f:
+                    f.write('world')
+                handler.dispatch(FileModifiedEvent(path))
+                self.assertEqual(m.call_count, 2)
+                handler.dispatch(FileDeletedEvent(path))
+                self.assertEqual(m.call_count, 3)
+
+    def test_verify_content_atomic_save(self):
+        import os
+        import tempfile
+
+        from watchdog.events import FileModifiedEvent, FileMovedEvent
+
+        from ..polling import TreeSnapshot, diff_events
+        from ..transaction import Transaction
+
+        def save(path, content):
+            # Written to a temporary file, then renamed over the file.
+            tmp = os.path.join(os.path.dirname(path), '.file.py.tmp')
+            with open(tmp, 'w') as f:
+                f.write(content)
+            os.replace(tmp, path)
+            return tmp
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'file.py')
+            with open(path, 'w') as f:
+                f.write('hello')
+            handler = AutoRunTrick(command='true', patterns=['*.py'],
+                                   verify_content=True)
+            snapshot = TreeSnapshot(d, True)
+            with patch.object(handler, 'on_any_event') as m, \
+                    patch.object(handler, 'on_events') as mt:
+                handler.dispatch(FileModifiedEvent(path))
+                self.assertEqual(m.call_count, 1)
+                # As inotify sees it, a move of the temporary file.
+                tmp = save(path, 'hello')
+                handler.dispatch(FileMovedEvent(tmp, path))
+                self.assertEqual(m.call_count, 1)
+                tmp = save(path, 'world')
+                handler.dispatch(FileMovedEvent(tmp, path))
+                self.assertEqual(m.call_count, 2)
+                # As polling sees it, the file deleted and created again.
+                snapshot.rescan(full=True)
+                save(path, 'world')
+                events = diff_events(snapshot.rescan(full=True))
+                handler.dispatch_transaction(Transaction(d, events))
+                self.assertFalse(mt.called)
+                save(path, 'hello')
+                events = diff_events(snapshot.rescan(full=True))
+                handler.dispatch_transaction(Transaction(d, events))
+                self.assertEqual(mt.call_count, 1)
+                # Renamed away from a path the dog handles.
+                other = os.path.join(d, 'other.py')
+                os.rename(path, other)
+                save(path, 'hello')
+                handler.dispatch(FileMovedEvent(other, path))
+                self.assertEqual(m.call_count, 3)
+
+    def test_transaction_restarts_command_once(self):
+        from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+        from ..transaction import Transaction
+
+        handler = AutoRunTrick(command='echo hello', patterns=['path/*.py'])
+        events = [FileCreatedEvent('path/a.py'), FileModifiedEvent('path/a.py'),
+                  FileCreatedEvent('path/b.txt')]
+        with patch.object(handler, 'start') as m, \
+                patch.object(handler, 'on_created') as mc:
+            handler.dispatch_transaction(Transaction('watch', events))
+        m.assert_called_once_with(event=events[1])
+        mc.assert_called_once_with(events[0])
+
+    def test_transaction_debounced(self):
+        from watchdog.events import FileCreatedEvent
+
+        handler = AutoRunTrick(command='echo hello', debounce=10)
+        events = [FileCreatedEvent('a'), FileCreatedEvent('b')]
+        handler.on_events(events)
+        self.assertEqual(handler._debouncer.pending, 2)
+        handler.stop()
+
+    def test_verify_content_off(self):
+        from watchdog.events import FileModifiedEvent
+
+        handler = AutoRunTrick(command='true')
+        self.assertFalse(handler.unchanged(FileModifiedEvent('/no/file')))
+
     def _dispatch_test_helper(self, path, ignore_directories=False):
         """patterns: 'relative/path/*.py', 'relative/path/src/'
         ignore_patterns: 'relative/path/*.rst', 'relative/path/__pycache__/',
@@ -232,6 +673,80 @@ class AutoRunTrickTestCase(unittest.TestCase):
         for event in devents:
             self._assert_will_not_dispatch(event, handler)
 
+    def test_ignores_tree(self):
+        handler = AutoRunTrick(ignore_patterns=['path/build/', 'path/*.py'])
+        self.assertTrue(handler.ignores_tree('path/build'))
+        self.assertTrue(handler.ignores_tree('path/build/sub'))
+        self.assertTrue(handler.ignores_tree('path/BUILD/sub'))
+        self.assertFalse(handler.ignores_tree('path/src'))
+        self.assertFalse(handler.ignores_tree('path'))
+        self.assertFalse(AutoRunTrick().ignores_tree('path/build'))
+
+    def test_scope(self):
+        from watchdog.events import DirModifiedEvent, FileCreatedEvent
+        from watchdog.events import FileMovedEvent
+
+        def wants(handler, event):
+            return handler.wants(event, handler.event_paths(event))
+
+        handler = AutoRunTrick(scope=('./src', True))
+        self.assertTrue(wants(handler, FileCreatedEvent('./src/a/b.c')))
+        self.assertTrue(wants(handler, DirModifiedEvent('./src')))
+        self.assertFalse(wants(handler, FileCreatedEvent('./srcs/b.c')))
+        self.assertFalse(wants(handler, DirModifiedEvent('.')))
+        self.assertTrue(wants(handler, FileMovedEvent('./b.c',
+                                                      './src/b.c')))
+        self.assertFalse(handler.ignores_tree('.'))
+        self.assertFalse(handler.ignores_tree('./src/a'))
+        self.assertTrue(handler.ignores_tree('./lib'))
+
+        handler = AutoRunTrick(patterns=['./src/*.c'],
+                               scope=('./src', False))
+        self.assertTrue(wants(handler, FileCreatedEvent('./src/b.c')))
+        self.assertFalse(wants(handler, FileCreatedEvent('./src/a/b.c')))
+        self.assertFalse(handler.ignores_tree('./src'))
+        self.assertTrue(handler.ignores_tree('./src/a'))
+        self.assertNotEqual(handler, AutoRunTrick(patterns=['./src/*.c']))
+
+    def test_rebase(self):
+        import os
+        from watchdog.events import FileCreatedEvent, FileMovedEvent
+        from ..dog import Dog
+        from ..transaction import Transaction
+
+        src = os.path.join(os.getcwd(), 'src')
+        handler = Dog(patterns=['*.c'], path=src).create_handler(
+            AutoRunTrick, ('.', True))
+        self.assertEqual(handler._rebase, ('./src', src))
+        events = [FileCreatedEvent('./src/a.c'),
+                  FileMovedEvent('./lib/b.c', './src/b.c'),
+                  FileCreatedEvent('./lib/c.c')]
+        with patch.object(handler, 'on_events') as on_events:
+            handler.dispatch_transaction(Transaction(None, events))
+        self.assertEqual(
+            [(e.src_path, getattr(e, 'dest_path', None))
+             for e in on_events.call_args[0][0]],
+            [(os.path.join(src, 'a.c'), None),
+             (os.path.join(os.getcwd(), 'lib', 'b.c'),
+              os.path.join(src, 'b.c'))])
+
+    def test_dispatch_events_under_ignored_directory(self):
+        """No events under excluded directories should be dispatched."""
+        path = 'relative/path/__pycache__/sub/dummy.py'
+        handler, fevents, devents, _ = self._dispatch_test_helper(path)
+
+        for event in fevents[:2] + fevents[3:] + devents[:2] + devents[3:]:
+            self._assert_will_not_dispatch(event, handler)
+
+    def test_dispatch_moved_out_of_ignored_directory(self):
+        """Moved events should be dispatched if dest_path is not ignored."""
+        from watchdog.events import FileMovedEvent
+
+        path = 'relative/path/__pycache__/dummy.py'
+        handler, _, _, _ = self._dispatch_test_helper(path)
+        event = FileMovedEvent(path, 'relative/path/dummy.py')
+        self._assert_will_dispatch(event, 'on_moved', handler)
+
     def test_dispatch_dir_events_matching_patterns_when_ignore_directories(self):
         """No directory events should be dispatched."""
         # Notice no trailing slash is appended.
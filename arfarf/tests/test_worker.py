@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from ..worker import Notifier, encode_notification
+
+
+# Print the notifications received, through the channel given as argument.
+WORKER = '''
+import os, socket, sys
+mode = sys.argv[1]
+if mode == 'stdin':
+    lines = sys.stdin
+elif mode == 'fifo':
+    lines = open(os.environ['ARFARF_NOTIFY_PATH'])
+else:
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(os.environ['ARFARF_NOTIFY_PATH'])
+    server.listen()
+    lines = (server.accept()[0].makefile().readline() for _ in range(2))
+for _, line in zip(range(2), lines):
+    sys.stdout.write(line)
+    sys.stdout.flush()
+'''
+
+
+class NotifierTestCase(unittest.TestCase):
+
+    changes = [('modified', 'src/a.py'), ('moved_to', 'src/b/')]
+
+    def test_encode_notification(self):
+        line = encode_notification(self.changes)
+        self.assertTrue(line.endswith(b'\n'))
+        self.assertEqual(json.loads(line.decode()),
+                         {'changes': [['modified', 'src/a.py'],
+                                      ['moved_to', 'src/b/']]})
+
+    def notify_worker(self, mode):
+        notifier = Notifier(mode)
+        process = subprocess.Popen([sys.executable, '-c', WORKER, mode],
+                                   stdout=subprocess.PIPE,
+                                   **notifier.popen_kwargs)
+        notifier.feed(process)
+        notifier.notify(self.changes)
+        notifier.notify(self.changes[:1])
+        outs = process.stdout.read()
+        process.wait()
+        process.stdout.close()
+        notifier.close(process)
+        self.assertEqual(outs.splitlines(),
+                         [encode_notification(self.changes)[:-1],
+                          encode_notification(self.changes[:1])[:-1]])
+        return notifier
+
+    def test_stdin(self):
+        notifier = self.notify_worker('stdin')
+        self.assertIsNone(notifier.path)
+
+    def test_fifo(self):
+        notifier = self.notify_worker('fifo')
+        self.assertFalse(os.path.exists(notifier.path))
+
+    def test_socket(self):
+        notifier = self.notify_worker('socket')
+        self.assertFalse(os.path.exists(notifier.path))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            Notifier('unknown')
@@ -0,0 +1,210 @@
+"""Define event transactions.
+
+Emitters put the events of one scan tick, or of one inotify read, between
+BEGIN and END markers in the event queue. The observer collects the events
+between the markers into a Transaction. Transactions of a watch following
+each other closely are merged, and a transaction is dispatched once its watch
+settled: nothing more was queued for it for settle_time seconds, and the
+event queue is drained. Handlers get a whole transaction at once, so a branch
+switch touching thousands of files restarts a command once.
+
+Events queued outside markers, by emitters not using them, are dispatched
+right away, each in a transaction of its own.
+"""
+
+import time
+
+from collections import OrderedDict
+
+
+class _Marker(object):
+
+    def __init__(self, name):
+        self._name = name
+
+    def __repr__(self):
+        return '<transaction {}>'.format(self._name)
+
+    @property
+    def key(self):
+        """Readonly property, so that events can be compared with markers
+        in the event queue.
+        """
+        return ('transaction', self._name)
+
+
+BEGIN = _Marker('begin')
+END = _Marker('end')
+
+
+def queue_transaction(emitter, events):
+    """Queue events in a transaction.
+
+    Args:
+        emitter: An EventEmitter object.
+        events: A list of file system event objects, nothing is queued if
+            it's empty.
+    """
+    if not events:
+        return
+    emitter.queue_event(BEGIN)
+    for event in events:
+        emitter.queue_event(event)
+    emitter.queue_event(END)
+
+
+class Transaction(object):
+    """The events of a watch queued between BEGIN and END markers.
+
+    Constructor Args:
+        watch: The ObservedWatch object the events are for.
+        events: A list of the first events.
+
+    Attributes:
+        watch: Readonly property, the ObservedWatch object.
+        events: Readonly property, the list of events, in the order they were
+            queued.
+        ticks: Readonly property, the number of transactions merged into
+            this one.
+        started: Readonly property, the time.monotonic() time the
+            transaction was created, when its first event was collected.
+    """
+
+    def __init__(self, watch, events=None):
+        self._watch = watch
+        self._events = list(events) if events is not None else []
+        self._ticks = 1
+        self._started = time.monotonic()
+
+    def __repr__(self):
+        return '<Transaction: {} events for {!r}>'.format(len(self._events),
+                                                         self._watch)
+
+    def __len__(self):
+        return len(self._events)
+
+    @property
+    def watch(self):
+        """Readonly property, the ObservedWatch object."""
+        return self._watch
+
+    @property
+    def events(self):
+        """Readonly property, the list of events."""
+        return self._events
+
+    @property
+    def ticks(self):
+        """Readonly property, the number of transactions merged."""
+        return self._ticks
+
+    @property
+    def started(self):
+        """Readonly property, the time the transaction was created."""
+        return self._started
+
+    def add(self, event):
+        """Add an event at the end of the transaction."""
+        self._events.append(event)
+
+    def reopen(self):
+        """Merge the next transaction of the watch into this one."""
+        self._ticks += 1
+
+
+class TransactionCollector(object):
+    """Collect the items of an event queue into transactions.
+
+    It's used by one thread, the observer's.
+
+    Constructor Args:
+        settle_time: Seconds a watch must stay quiet after a transaction
+            ends before it's dispatched. A transaction of the watch beginning
+            meanwhile is merged into it.
+
+    Attributes:
+        max_hold: Max seconds a settled transaction is held while the event
+            queue is not drained, so a busy queue doesn't hold it for good.
+    """
+
+    max_hold = 1
+
+    def __init__(self, settle_time=0):
+        self._settle_time = settle_time
+        # watch -> Transaction between its markers
+        self._open = {}
+        # watch -> (Transaction, time it settles), ended, not dispatched yet
+        self._ended = OrderedDict()
+
+    @property
+    def pending(self):
+        """Readonly property, the number of transactions not dispatched."""
+        return len(self._open) + len(self._ended)
+
+    def timeout(self, timeout):
+        """Get how long to wait for the next item of the queue.
+
+        Args:
+            timeout: The observer timeout.
+
+        Returns:
+            timeout, or less so that ended transactions are dispatched once
+            they settle.
+        """
+        if not self._ended:
+            return timeout
+        first = min(settles for _, settles in self._ended.values())
+        return max(0, min(timeout, first - time.monotonic()))
+
+    def add(self, event, watch):
+        """Collect an item of the event queue.
+
+        Args:
+            event: A file system event object, BEGIN or END.
+            watch: The ObservedWatch object of the item.
+
+        Returns:
+            A Transaction object to dispatch right away for an event queued
+            outside markers, None otherwise.
+        """
+        if event is BEGIN:
+            if watch in self._open:
+                return None
+            ended = self._ended.pop(watch, None)
+            if ended is not None:
+                transaction = ended[0]
+                transaction.reopen()
+            else:
+                transaction = Transaction(watch)
+            self._open[watch] = transaction
+        elif event is END:
+            transaction = self._open.pop(watch, None)
+            if transaction is not None:
+                settles = time.monotonic() + self._settle_time
+                self._ended[watch] = (transaction, settles)
+        else:
+            transaction = self._open.get(watch)
+            if transaction is None:
+                return Transaction(watch, [event])
+            transaction.add(event)
+        return None
+
+    def settled(self, drained):
+        """Take the transactions which settled.
+
+        Args:
+            drained: A boolean indicating if the event queue is empty. While
+                it's not, the next items may be more events for the watch,
+                so settled transactions are held up to max_hold seconds.
+
+        Returns:
+            A list of Transaction objects, in the order they ended.
+        """
+        now = time.monotonic()
+        hold = 0 if drained else type(self).max_hold
+        settled = [transaction
+                   for transaction, settles in self._ended.values()
+                   if settles + hold <= now]
+        for transaction in settled:
+            del self._ended[transaction.watch]
+        return settled
@@ -3,17 +3,24 @@
 
 import os
 import signal
-import subprocess
+import threading
 import time
+import traceback
 
 from string import Template
 from watchdog.utils import unicode_paths
 
-from pathtools.patterns import match_any_paths
 from watchdog.tricks import Trick
 from watchdog.events import EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED
 from watchdog.events import EVENT_TYPE_MOVED, EVENT_TYPE_DELETED
 
+from .changes import CHANGES_MODES, ChangeSet, Delivery
+from .debounce import Debouncer
+from .patterns import PatternMatcher
+from .pools import POOLS, Pools
+from .profiling import profiled
+from .scheduler import Scheduler
+from .supervisor import Supervisor, parse_command
 
 
 class AutoRunTrick(Trick):
@@ -30,24 +37,140 @@ class AutoRunTrick(Trick):
         ignore_directories: The same as Dog class.
         stop_signal:
         kill_after: The same as Trick class.
+        debounce:
+        max_delay:
+        priority:
+        nice:
+        ionice:
+        changes:
+        worker:
+        restart_patterns:
+        pool:
+        verify_content:
+        run_at_start:
+        name:
+        after: The same as Dog class.
+        scope: The (path, recursive) tuple of the part of the watch the
+            handler handles events of, see Dog.rebase(). None for the whole
+            watch.
+        rebase: A (path, dog_path) tuple, the path of the dog as written in
+            the events of the watch and as written in the config, see
+            Dog.rebase(). The events handled have their paths written like
+            the dog's path. None if they are written alike.
 
     Attributes:
         command_default: A template string representing the default command.
-        command: Readonly property, the shell command string.
+        supervisor: The Supervisor object starting and stopping processes of
+            all the AutoRunTrick objects.
+        scheduler: The Scheduler object limiting how many commands of all the
+            AutoRunTrick objects run at once.
+        pools: The Pools object running callable commands of all the
+            AutoRunTrick objects.
+        content_cache: The ContentCache object hashing files for all the
+            AutoRunTrick objects verifying content, None until one does.
+        output: The OutputMux object the output of the commands of all the
+            AutoRunTrick objects goes through, None to let commands write to
+            the terminal directly.
+        metrics: The Metrics object all the AutoRunTrick objects record
+            their metrics in, None not to record any.
+        command: Readonly property, the command string, argv tuple or
+            callable.
+        pool: Readonly property, the kind of pool running a callable
+            command, None if command is not callable.
+        run_at_start: Readonly property, a boolean indicating if start() is
+            called when arfarf starts.
+        name: Readonly property, the name of the dog, or None.
+        label: Readonly property, the name of the dog, or its command when
+            it has none.
+        after: Readonly property, a tuple of the names of the dogs the
+            command runs after.
+        scope: Readonly property, the (path, recursive) tuple of the part of
+            the watch the handler handles events of, or None.
+        worker: Readonly property, the worker mode, or None.
+        graph: The DogGraph object running the command in dependency order,
+            None if the dog has no dependencies or dependents.
     """
 
     command_default = ('${event_object} ${event_src_path} is '
                        '${event_type}${if_moved}')
+    supervisor = Supervisor()
+    scheduler = Scheduler(supervisor)
+    pools = Pools()
+    content_cache = None
+    output = None
+    metrics = None
 
     def __init__(self, command=None, patterns=None, ignore_patterns=None,
                  ignore_directories=False, stop_signal=signal.SIGINT,
-                 kill_after=10):
+                 kill_after=10, debounce=None, max_delay=None, priority=0,
+                 nice=None, ionice=None, changes=None, worker=None,
+                 restart_patterns=None, pool='thread', verify_content=False,
+                 run_at_start=True, name=None, after=None, scope=None,
+                 rebase=None):
         # Match Trick.__init__() signature.
         super().__init__(patterns, ignore_patterns, ignore_directories)
+        if isinstance(command, list):
+            # Keep the handler hashable.
+            command = tuple(command)
         self._command = command
+        self._callable = command if callable(command) else None
+        if self._callable is not None and pool not in POOLS:
+            raise ValueError('unknown pool %r' % pool)
+        self._pool = pool
+        # Events waiting for the running call of the callable.
+        self._calling = False
+        self._pending = None
+        self._args, self._shell = parse_command(command) \
+                                  if isinstance(command, (str, tuple)) \
+                                  else (None, False)
         self._stop_signal = stop_signal
         self._kill_after = kill_after
+        self._debounce = debounce
+        self._max_delay = max_delay
+        self._priority = priority
+        self._nice = nice
+        self._ionice = ionice
+        if changes is not None and changes not in CHANGES_MODES:
+            raise ValueError('unknown changes mode %r' % changes)
+        self._changes_mode = changes
+        self._changes = ChangeSet()
+        # Changes delivered to the running command.
+        self._delivered = []
+        if worker is not None:
+            from .worker import NOTIFY_MODES
+
+            if worker not in NOTIFY_MODES:
+                raise ValueError('unknown worker mode %r' % worker)
+        if worker is not None and changes is not None:
+            raise ValueError('workers are notified of changes, they take no '
+                             'changes mode')
+        self._worker = worker
+        self._notifier = None
+        self._restart_patterns = restart_patterns
+        self._restart_matcher = PatternMatcher(restart_patterns, None,
+                                               self.case_sensitive) \
+                                if restart_patterns else None
+        self._debouncer = Debouncer(self._on_burst, debounce, max_delay) \
+                          if debounce else None
+        # Serialize restarts from the debouncer thread and stop() calls.
+        self._lock = threading.RLock()
         self._process = None
+        self._matcher = PatternMatcher(patterns, ignore_patterns,
+                                       self.case_sensitive)
+        self._verify_content = verify_content
+        self._run_at_start = run_at_start
+        self._content = self._track_content() if verify_content else None
+        self._name = name
+        self._after = tuple(after) if after is not None else ()
+        self._scope = tuple(scope) if scope is not None else None
+        self._scope_prefix = os.path.join(scope[0], '') \
+                             if scope is not None else None
+        self._rebase = tuple(rebase) if rebase is not None else None
+        self._rebase_prefix = os.path.join(rebase[0], '') \
+                              if rebase is not None else None
+        self.graph = None
+        # When the first change not run for yet was seen, for metrics.
+        self._since = None
 
     def __eq__(self, value):
         return isinstance(value, self.__class__) and self.key == value.key
@@ -78,6 +201,16 @@ class AutoRunTrick(Trick):
             path = os.path.join(path, '')
         return path
 
+    @staticmethod
+    def _track_content():
+        """Get a ContentTracker object on the content cache, creating the
+        cache for all the AutoRunTrick objects first if none does.
+        """
+        from .content import ContentCache, ContentTracker
+
+        if AutoRunTrick.content_cache is None:
+            AutoRunTrick.content_cache = ContentCache()
+        return ContentTracker(AutoRunTrick.content_cache)
 
     def _substitute_command(self, event):
         if hasattr(event, 'dest_path'):
@@ -98,55 +231,406 @@ class AutoRunTrick(Trick):
         c = Template(type(self).command_default).safe_substitute(**context)
         return c
 
+    def ignores_tree(self, path):
+        """Tell if a directory and everything under it is ignored.
+
+        Like in git, when a directory matches ignore_patterns, everything
+        under it is ignored, so observers don't need to scan it at all. So
+        is a directory out of the scope of the handler.
+
+        Args:
+            path: A directory path, without trailing slash.
+
+        Returns:
+            A boolean indicating if the directory tree is ignored.
+        """
+        return self._out_of_scope(path) or self._excludes_tree(path)
+
+    def _excludes_tree(self, path):
+        if not self._ignore_patterns:
+            return False
+        return self._matcher.excludes_tree(path)
+
+    def _out_of_scope(self, path):
+        """Tell if nothing under a directory is in the scope."""
+        if self._scope is None:
+            return False
+        root, recursive = self._scope
+        if path == root or root.startswith(os.path.join(path, '')):
+            return False
+        return not recursive or not path.startswith(self._scope_prefix)
+
+    def _in_scope(self, path):
+        """Tell if a path returned by event_paths() is in the scope."""
+        if path.endswith(os.sep) and len(path) > 1:
+            path = path[:-1]
+        root, recursive = self._scope
+        if path == root:
+            return True
+        if recursive:
+            return path.startswith(self._scope_prefix)
+        return os.path.dirname(path) == root
+
     @property
     def command(self):
-        """Readonly property, command string."""
+        """Readonly property, command string, argv tuple or callable."""
         return self._command
 
+    @property
+    def pool(self):
+        """Readonly property, the kind of pool running a callable command."""
+        return self._pool if self._callable is not None else None
+
+    @property
+    def run_at_start(self):
+        """Readonly property, if start() is called when arfarf starts."""
+        return self._run_at_start
+
+    @property
+    def name(self):
+        """Readonly property, the name of the dog, or None."""
+        return self._name
+
+    @property
+    def label(self):
+        """Readonly property, the name of the dog, or its command."""
+        if self._name is not None:
+            return self._name
+        if isinstance(self._command, tuple):
+            return ' '.join(self._command)
+        return str(self._command)
+
+    @property
+    def after(self):
+        """Readonly property, the names of the dogs the command runs
+        after.
+        """
+        return self._after
+
+    def _rebased_path(self, path):
+        """Write a path of the watch like the dog's path."""
+        root, dog_path = self._rebase
+        if path == root:
+            return dog_path
+        if path.startswith(self._rebase_prefix):
+            return os.path.join(dog_path, path[len(self._rebase_prefix):])
+        # Moved from or to out of the dog's path.
+        return os.path.abspath(path) if os.path.isabs(dog_path) \
+               else os.path.relpath(path)
+
+    def _rebased(self, event):
+        """Get event with its paths written like the dog's path."""
+        if self._rebase is None:
+            return event
+        if hasattr(event, 'dest_path'):
+            return type(event)(self._rebased_path(event.src_path),
+                               self._rebased_path(event.dest_path))
+        return type(event)(self._rebased_path(event.src_path))
+
+    @property
+    def scope(self):
+        """Readonly property, the part of the watch handled, or None."""
+        return self._scope
+
+    @property
+    def worker(self):
+        """Readonly property, the worker mode, or None."""
+        return self._worker
+
     def start(self, event=None):
         """Execute a command according to context.
 
         It logs all file system events when self._command is None, or execute
-        the command otherwise.
+        the command otherwise, as soon as the scheduler lets it run.
 
         Args:
             event: A file system event object.
         """
-        if self._command is None:
+        if self._callable is not None:
+            self._call([] if event is None else [event])
+        elif self._command is None:
             if event is not None:
                 command = self._substitute_command(event)
                 print(command)
+        elif self._worker is not None:
+            # Workers run for good, they would hold a slot for good.
+            self._try_spawn()
         else:
-            self._process = subprocess.Popen(self._command, shell=True,
-                                             start_new_session=True)
+            type(self).scheduler.submit(self, self._try_spawn,
+                                        self._priority)
+
+    def _try_spawn(self):
+        """Start the command like _spawn(), a command failing to start is
+        reported instead of raising into the thread dispatching events.
+
+        Returns:
+            The process started, None if it failed to start.
+        """
+        try:
+            return self._spawn()
+        except Exception:
+            traceback.print_exc()
+            metrics = type(self).metrics
+            if metrics is not None:
+                metrics.command_exits.inc(dog=self.label, status='failed')
+            return None
+
+    def _spawn(self):
+        """Start the command, in place of the one running if any."""
+        cls = type(self)
+        with self._lock:
+            self._kill()
+            # The channel telling the command what changed, if any.
+            channel = None
+            if self._changes_mode is not None:
+                self._delivered = self._changes.take()
+                channel = Delivery(self._changes_mode, self._delivered)
+            elif self._worker is not None:
+                from .worker import Notifier
+
+                channel = self._notifier = Notifier(self._worker)
+            kwargs = channel.popen_kwargs if channel is not None else {}
+            output = cls.output.open(self.label) \
+                     if cls.output is not None else None
+            if output is not None:
+                kwargs.update(output.popen_kwargs)
+            try:
+                self._process = cls.supervisor.spawn(
+                    self._args, shell=self._shell, nice=self._nice,
+                    ionice=self._ionice, **kwargs)
+            except Exception:
+                if channel is not None:
+                    channel.close()
+                if self._changes_mode is not None:
+                    # Deliver the changes again to the next run.
+                    self._changes.restore(self._delivered)
+                    self._delivered = []
+                raise
+            finally:
+                if output is not None:
+                    output.spawned()
+            started = self._record_spawn()
+            if channel is not None:
+                channel.feed(self._process)
+                cls.supervisor.watch(self._process, channel.close)
+            if output is not None:
+                cls.supervisor.watch(self._process, output.exited)
+            if started is not None:
+                cls.supervisor.watch(
+                    self._process,
+                    lambda p: self._record_exit(started, p.returncode))
+            return self._process
+
+    def _changed(self, since=None):
+        """Remember when the first change the command runs for was seen.
+
+        Args:
+            since: The time.monotonic() time it was seen, None for now.
+        """
+        if type(self).metrics is None:
+            return
+        with self._lock:
+            if self._since is None:
+                self._since = since if since is not None \
+                              else time.monotonic()
+
+    def _record_spawn(self):
+        """Record the delay from the first change to the process start.
+
+        Returns:
+            The time.monotonic() time the process started, None if metrics
+            are not recorded.
+        """
+        metrics = type(self).metrics
+        if metrics is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            since, self._since = self._since, None
+        if since is not None:
+            metrics.spawn_delay.observe(now - since, dog=self.label)
+        return now
+
+    def _record_exit(self, started, returncode):
+        """Record the runtime and the exit status of a process.
+
+        Args:
+            started: The time returned by _record_spawn().
+            returncode: The exit status of the process.
+        """
+        metrics = type(self).metrics
+        if metrics is None or started is None:
+            return
+        label = self.label
+        metrics.command_duration.observe(time.monotonic() - started,
+                                         dog=label)
+        metrics.command_exits.inc(dog=label, status=returncode)
+
+    def _call(self, events):
+        """Call the callable command with events in its pool.
+
+        A call waits for the running one, if any, calls waiting are merged.
+        """
+        with self._lock:
+            if self._calling:
+                self._pending = (self._pending or []) + events
+                return
+            self._calling = True
+        type(self).pools.get(self._pool).submit(self._callable, (events,),
+                                                self._called)
+
+    def _called(self):
+        with self._lock:
+            events, self._pending = self._pending, None
+            self._calling = False
+        if events is not None:
+            self._call(events)
+
+    def run_step(self, events, done):
+        """Run the command once for events, as a step of its graph.
+
+        Args:
+            events: A list of file system event objects, empty when the
+                command runs because a command it runs after ran.
+            done: A callable called with a boolean once the command is done,
+                True if it succeeded: the process exited with status 0, or
+                the callable returned.
+        """
+        cls = type(self)
+        if self._callable is not None:
+            errors = []
+            cls.pools.get(self._pool).submit(self._callable, (events,),
+                                             lambda: done(not errors),
+                                             errors.append)
+            return
+        if self._command is None:
+            for event in events:
+                self.start(event=event)
+            done(True)
+            return
+
+        def job():
+            process = self._try_spawn()
+            if process is None:
+                done(False)
+                return None
+            cls.supervisor.watch(process,
+                                 lambda p: done(p.returncode == 0))
+            return process
+
+        if self._changes_mode is not None:
+            with self._lock:
+                for event in events:
+                    self._changes.add(event)
+        cls.scheduler.submit(self, job, self._priority)
+
+    def stop_step(self):
+        """Stop the command run by run_step(), it's done once it exits."""
+        with self._lock:
+            self._kill()
+
+    def _notifies(self, events):
+        """Tell if events are sent to the running worker.
+
+        They are unless there's no worker running, or one of them matches
+        restart_patterns.
+        """
+        if self._worker is None or self._process is None or \
+                self._process.poll() is not None:
+            return False
+        if self._restart_matcher is None:
+            return True
+        return not any(self._restart_matcher.match_any(self.event_paths(e))
+                       for e in events)
 
     def stop(self):
         """Try to kill the shell command process at its best.
+
+        It returns once the stop signal is sent, see Supervisor. Events
+        waiting for the debounce period to end are dropped.
         """
+        if self.graph is not None:
+            self.graph.stop()
+        if self._debouncer is not None:
+            dropped = self._debouncer.cancel()
+            metrics = type(self).metrics
+            if dropped and metrics is not None:
+                metrics.events_dropped.inc(len(dropped), dog=self.label,
+                                           reason='stopped')
+        type(self).scheduler.cancel(self)
+        with self._lock:
+            # A running call can't be stopped, but the waiting ones can.
+            self._pending = None
+            self._kill()
+
+    def _kill(self):
         if self._process is None:
             return
-        try:
-            os.killpg(os.getpgid(self._process.pid), self._stop_signal)
-        except OSError:
-            # Process is already gone.
-            pass
-        else:
-            kill_time = time.time() + self._kill_after
-            while time.time() < kill_time:
-                if self._process.poll() is not None:
-                    break
-                time.sleep(0.25)
-            else:
-                try:
-                    os.killpg(os.getpgid(self._process.pid, signal.SIGKILL))
-                except OSError:
-                    pass
+        if self._process.poll() is None:
+            # Deliver the changes again to the next run.
+            self._changes.restore(self._delivered)
+        self._delivered = []
+        # The supervisor escalates to SIGKILL, so dispatching doesn't wait.
+        type(self).supervisor.terminate(self._process, self._stop_signal,
+                                        self._kill_after)
         self._process = None
 
+    def _on_burst(self, events):
+        """Restart the command once for a burst of debounced events.
+
+        A worker is notified of the events instead. The graph of the dog
+        runs the command, if it has one.
+        """
+        if self.graph is not None:
+            self.graph.trigger(self, events)
+            return
+        if self._callable is not None:
+            self._call(events)
+            return
+        with self._lock:
+            if self._changes_mode is not None:
+                for event in events:
+                    self._changes.add(event)
+            if self._notifies(events):
+                changes = ChangeSet()
+                for event in events:
+                    changes.add(event)
+                self._notifier.notify(changes.take())
+                # Running workers don't start again.
+                self._since = None
+                return
+            self._kill()
+            if self._command is None:
+                # The default logger logs every event.
+                for event in events:
+                    self.start(event=event)
+            else:
+                self.start(event=events[-1])
+
     def on_any_event(self, event):
-        """Override superclass on_any_event, pass event to start()."""
-        self.stop()
-        self.start(event=event)
+        """Override superclass on_any_event, pass event to start().
+
+        When debouncing, the event is collected and the command restarted
+        once for all the events of a burst.
+        """
+        if self._debouncer is not None:
+            self._debouncer.push(event)
+        else:
+            self._on_burst([event])
+
+    def on_events(self, events):
+        """Handle the events of a transaction at once.
+
+        The command is restarted once for all of them, like for a burst of
+        debounced events. When debouncing, they are added to the burst.
+
+        Args:
+            events: A list of file system event objects.
+        """
+        if self._debouncer is not None:
+            self._debouncer.extend(events)
+        else:
+            self._on_burst(events)
 
     @property
     def key(self):
@@ -160,39 +644,190 @@ class AutoRunTrick(Trick):
         ignore_patterns = tuple(self._ignore_patterns) \
                        if self._ignore_patterns is not None \
                        else None
+        restart_patterns = tuple(self._restart_patterns) \
+                           if self._restart_patterns is not None \
+                           else None
         return (self.command, patterns, ignore_patterns,
-                self.ignore_directories)
+                self.ignore_directories, self._debounce, self._max_delay,
+                self._priority, self._nice, self._ionice, self._changes_mode,
+                self._worker, restart_patterns, self._pool,
+                self._verify_content, self._run_at_start, self._name,
+                self._after, self._scope, self._rebase)
 
-    def dispatch(self, event):
-        """Override superclass method.
+    @classmethod
+    def event_paths(cls, event):
+        """Get the paths to match an event with.
 
         Append trailing slash to event src_path if it is a directory event and
-        its dest_path if exists before matching using fnmatch.
+        its dest_path if exists.
 
         Args:
-            event: The event object to dispatch.
-        """
-        if event.is_directory and self._ignore_directories:
-            return
+            event: A file system event object.
 
+        Returns:
+            A list of decoded path strings.
+        """
         paths = []
         if hasattr(event, 'dest_path'):
-            dest_path = self._slash(event, event.dest_path)
+            dest_path = cls._slash(event, event.dest_path)
             paths.append(unicode_paths.decode(dest_path))
         if event.src_path:
-            src_path = self._slash(event, event.src_path)
+            src_path = cls._slash(event, event.src_path)
             paths.append(unicode_paths.decode(src_path))
+        return paths
+
+    def wants(self, event, paths, memo=None):
+        """Tell if the handler handles an event.
 
-        if match_any_paths(paths,
-                           included_patterns=self._patterns,
-                           excluded_patterns=self._ignore_patterns,
-                           case_sensitive=self.case_sensitive):
-            self.on_any_event(event)
-            method_map = {
-                EVENT_TYPE_CREATED: self.on_created,
-                EVENT_TYPE_MODIFIED: self.on_modified,
-                EVENT_TYPE_MOVED: self.on_moved,
-                EVENT_TYPE_DELETED: self.on_deleted,
-            }
-            event_type = event.event_type
-            method_map[event_type](event)
+        Paths are matched using the patterns compiled when the handler is
+        created. Paths under an ignored directory, or out of the scope of
+        the handler, are ignored.
+
+        Args:
+            event: A file system event object.
+            paths: The list returned by event_paths(event).
+            memo: A dict shared by handlers matching the same paths, so that
+                the patterns they share are tried only once.
+
+        Returns:
+            A boolean indicating if the event should be handled.
+        """
+        metrics = type(self).metrics
+        if metrics is None:
+            return self._matches(event, paths, memo)
+        start = time.perf_counter()
+        wanted = self._matches(event, paths, memo)
+        label = self.label
+        metrics.match_seconds.inc(time.perf_counter() - start, dog=label)
+        metrics.events_received.inc(dog=label)
+        if wanted:
+            metrics.events_matched.inc(dog=label)
+        return wanted
+
+    def _matches(self, event, paths, memo):
+        if event.is_directory and self._ignore_directories:
+            return False
+        if self._scope is not None:
+            paths = [p for p in paths if self._in_scope(p)]
+        paths = [p for p in paths
+                 if not self._excludes_tree(os.path.dirname(p))]
+        return bool(paths) and self._matcher.match_any(paths, memo)
+
+    def unchanged(self, event):
+        """Tell if an event left a file with the content it had.
+
+        It's only checked when verifying content, a file is changed the first
+        time it's seen. A file modified or created is checked at its path, a
+        file moved at its destination, so that an atomic save, writing a
+        temporary file then renaming it over the file, is unchanged too. A
+        move from a path the handler handles is changed, the file is gone
+        from there.
+
+        Args:
+            event: A file system event object.
+
+        Returns:
+            A boolean.
+        """
+        if self._content is None or event.is_directory:
+            return False
+        event_type = event.event_type
+        if event_type == EVENT_TYPE_MOVED:
+            if self._matches(event, [unicode_paths.decode(event.src_path)],
+                             None):
+                return False
+            path = event.dest_path
+        elif event_type in (EVENT_TYPE_MODIFIED, EVENT_TYPE_CREATED):
+            path = event.src_path
+        else:
+            return False
+        return not self._content.changed(path)
+
+    def _dropped(self, count):
+        metrics = type(self).metrics
+        if count and metrics is not None:
+            metrics.events_dropped.inc(count, dog=self.label,
+                                       reason='unchanged')
+
+    def handle(self, event):
+        """Call on_any_event() and the method for the event type.
+
+        Events leaving a file with the content it had are dropped when
+        verifying content, see unchanged().
+
+        Args:
+            event: A file system event object wants() returned True for.
+        """
+        event = self._rebased(event)
+        if self.unchanged(event):
+            self._dropped(1)
+            return
+        self._changed()
+        self.on_any_event(event)
+        method_map = {
+            EVENT_TYPE_CREATED: self.on_created,
+            EVENT_TYPE_MODIFIED: self.on_modified,
+            EVENT_TYPE_MOVED: self.on_moved,
+            EVENT_TYPE_DELETED: self.on_deleted,
+        }
+        event_type = event.event_type
+        method_map[event_type](event)
+
+    def handle_transaction(self, events, since=None):
+        """Call the method for each event type, then on_events() once.
+
+        Events leaving a file with the content it had are dropped when
+        verifying content, see unchanged(), and so is the deletion of a file
+        created again unchanged in the transaction.
+
+        Args:
+            events: A list of the events of a transaction wants() returned
+                True for.
+            since: The time.monotonic() time the transaction started, None
+                for now.
+        """
+        count = len(events)
+        events = list(map(self._rebased, events))
+        unchanged = [self.unchanged(event) for event in events]
+        # Polling sees a file replaced, like by an atomic save, deleted and
+        # created again, the deletion goes with the creation.
+        recreated = {event.src_path for event, same in zip(events, unchanged)
+                     if same and event.event_type == EVENT_TYPE_CREATED}
+        events = [event for event, same in zip(events, unchanged)
+                  if not same and not (event.event_type == EVENT_TYPE_DELETED
+                                       and event.src_path in recreated)]
+        self._dropped(count - len(events))
+        if not events:
+            return
+        self._changed(since)
+        method_map = {
+            EVENT_TYPE_CREATED: self.on_created,
+            EVENT_TYPE_MODIFIED: self.on_modified,
+            EVENT_TYPE_MOVED: self.on_moved,
+            EVENT_TYPE_DELETED: self.on_deleted,
+        }
+        for event in events:
+            method_map[event.event_type](event)
+        self.on_events(events)
+
+    @profiled
+    def dispatch(self, event):
+        """Override superclass method, handle the event if it's wanted.
+
+        Args:
+            event: The event object to dispatch.
+        """
+        if self.wants(event, self.event_paths(event)):
+            self.handle(event)
+
+    @profiled
+    def dispatch_transaction(self, transaction):
+        """Handle the events of a transaction which are wanted.
+
+        Args:
+            transaction: A Transaction object.
+        """
+        events = [event for event in transaction.events
+                  if self.wants(event, self.event_paths(event))]
+        if events:
+            self.handle_transaction(events, transaction.started)
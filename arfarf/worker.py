@@ -0,0 +1,154 @@
+"""Define the notifications sent to warm workers.
+
+A warm worker is a command started once and kept running. Instead of being
+restarted, it's notified of the changes, so it keeps its caches and state.
+A notification is one line of JSON, such as:
+
+    {"changes": [["modified", "src/a.py"], ["moved_to", "src/b/"]]}
+
+where each change is the same as in the changes module. Notifications are
+sent in one of the NOTIFY_MODES:
+    stdin: Written to the worker's standard input.
+    fifo: Written to a FIFO, its path is in the ARFARF_NOTIFY_PATH
+        environment variable. The worker opens it for reading.
+    socket: Sent to a Unix stream socket, its path is in the
+        ARFARF_NOTIFY_PATH environment variable. The worker listens on it,
+        each notification comes in a connection of its own.
+"""
+
+import json
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+
+NOTIFY_MODES = ('stdin', 'fifo', 'socket')
+ENV_NOTIFY_PATH = 'ARFARF_NOTIFY_PATH'
+
+
+def encode_notification(changes):
+    """Encode changes to a notification line.
+
+    Args:
+        changes: A list of (event type, path) tuples.
+
+    Returns:
+        A bytes object ending with a line break.
+    """
+    data = json.dumps({'changes': [list(change) for change in changes]})
+    return data.encode('utf-8', 'surrogateescape') + b'\n'
+
+
+class Notifier(object):
+    """Send notifications to one run of a worker, in a thread of its own.
+
+    Notifications are queued, so a worker slow to read them doesn't block
+    the caller.
+
+    Constructor Args:
+        mode: One of NOTIFY_MODES.
+
+    Attributes:
+        connect_interval: Seconds between attempts to connect to a worker not
+            listening yet, in socket mode.
+        popen_kwargs: Readonly property, a dict of keyword arguments to start
+            the worker with.
+        path: Readonly property, the FIFO or socket path, None in stdin mode.
+    """
+
+    connect_interval = 0.1
+
+    def __init__(self, mode):
+        if mode not in NOTIFY_MODES:
+            raise ValueError('unknown worker mode %r' % mode)
+        self._mode = mode
+        self._queue = queue.Queue()
+        self._process = None
+        self._thread = None
+        self._dir = None
+        self._path = None
+        if mode == 'stdin':
+            self._popen_kwargs = {'stdin': subprocess.PIPE}
+            return
+        self._dir = tempfile.mkdtemp(prefix='arfarf-worker-')
+        self._path = os.path.join(self._dir, 'notify')
+        if mode == 'fifo':
+            os.mkfifo(self._path, 0o600)
+        env = dict(os.environ)
+        env[ENV_NOTIFY_PATH] = self._path
+        self._popen_kwargs = {'env': env}
+
+    @property
+    def popen_kwargs(self):
+        """Readonly property, a dict of keyword arguments to start the
+        worker with.
+        """
+        return dict(self._popen_kwargs)
+
+    @property
+    def path(self):
+        """Readonly property, the FIFO or socket path."""
+        return self._path
+
+    def feed(self, process):
+        """Start sending notifications to the worker process."""
+        self._process = process
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def notify(self, changes):
+        """Queue a notification of changes."""
+        self._queue.put(changes)
+
+    def close(self, process=None):
+        """Stop sending notifications and remove the FIFO or socket."""
+        self._queue.put(None)
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+
+    def _run(self):
+        fifo = None
+        try:
+            if self._mode == 'fifo':
+                # Opened for reading too, so it doesn't wait for the worker.
+                fifo = os.open(self._path, os.O_RDWR)
+            for changes in iter(self._queue.get, None):
+                data = encode_notification(changes)
+                if self._mode == 'stdin':
+                    self._process.stdin.write(data)
+                    self._process.stdin.flush()
+                elif self._mode == 'fifo':
+                    os.write(fifo, data)
+                else:
+                    self._send(data)
+        except (OSError, ValueError):
+            # The worker exited, or closed its end.
+            pass
+        finally:
+            if fifo is not None:
+                os.close(fifo)
+            if self._mode == 'stdin':
+                try:
+                    self._process.stdin.close()
+                except OSError:
+                    pass
+
+    def _send(self, data):
+        while True:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                try:
+                    sock.connect(self._path)
+                except (FileNotFoundError, ConnectionRefusedError):
+                    if self._process.poll() is not None:
+                        raise
+                    # Not listening yet.
+                    time.sleep(type(self).connect_interval)
+                    continue
+                sock.sendall(data)
+                return